@@ -5,19 +5,42 @@ Endpoints:
   GET  /api/genomes        — List available demo genomes
   POST /api/analyze         — Get predictions for a demo genome (by ID)
   POST /api/analyze_fasta   — Analyze raw FASTA text through trained models
-  GET  /api/metrics         — Model performance metrics
-  GET  /api/validation      — Bootstrap validation stats per antibiotic
+                              (Accept: application/x-msgpack for the compact encoding;
+                              429 + Retry-After when the compute pool is full;
+                              organism from {"organism": name or taxon} or the header taxon;
+                              {"preview": true | fraction} predicts from a window sample and
+                              flags ambiguous calls, {"refine": true} recounts just those)
+  POST /api/analyze_fasta/stream — The same analysis as server-sent events: progress,
+                              each prediction as it is made, then the full payload
+  POST /api/analyze_reads   — Analyze sequencing reads without assembling: multipart "reads"
+                              = one FASTQ(.gz) or both mates; optional "organism", "genome_id",
+                              "name"; k-mers from error-filtered reads, genes inferred
+  GET  /api/genome/<hash>/tiles — GC / skew / N windows of an analyzed genome at any zoom
+  GET  /api/metrics         — Model performance metrics (?organism=)
+  GET  /api/validation      — Bootstrap validation stats per antibiotic (?organism=)
+  GET  /api/similar         — Most similar training genomes + lab phenotypes
+                              (?genome_id=..., or POST {"fasta": ...}; k up to 50; E. coli only)
+  GET  /api/models          — Active model version, load timings, available versions,
+                              loaded organisms and their memory budget
+  POST /api/models/reload   — Load + validate + swap a model version, recorded in CURRENT (admin only)
+  GET  /api/admin/profiles  — Captured request profiles (admin only; X-Profile header)
+
+Every response carries the serving model version in X-Model-Version.
 """
 
+import hmac
 import json
 import os
+import random
 import re
+import shutil
 import sys
-import numpy as np
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
-import joblib
 
 app = Flask(__name__)
 
@@ -29,19 +52,36 @@ _frontend_url = os.environ.get("FRONTEND_URL", "").strip().rstrip("/")
 if _frontend_url:
     _allowed_origins.append(_frontend_url)
 
-CORS(app, resources={r"/api/*": {"origins": _allowed_origins}})
+CORS(
+    app,
+    resources={r"/api/*": {"origins": _allowed_origins}},
+    expose_headers=["X-Model-Version", "Server-Timing", "X-Profile-Id"],
+)
 
 BASE_DIR = os.path.dirname(__file__)
 DEMO_DIR = os.path.join(BASE_DIR, "data", "demo_genomes")
 MODELS_DIR = os.path.join(BASE_DIR, "..", "models")
+SKETCH_INDEX_PATH = os.path.join(BASE_DIR, "data", "sketch_index.npz")
 
 # Add training dir to path so we can import extract_kmers
 sys.path.insert(0, os.path.join(BASE_DIR, "..", "training"))
-from extract_kmers import build_kmer_index, K
-from resistance_genes import compute_genome_stats, infer_resistance_genes
-
-# Pre-load k-mer index and models at startup
-KMER_INDEX = build_kmer_index()
+from resistance_genes import infer_resistance_genes
+from response_cache import cached_json_response
+from compact_encoding import compact_response, wants_compact
+from sequence_analysis import (
+    analyze_sequence, extract_kmers_from_fasta_text, preview_features, reads_features,
+    sequence_annotations, sequence_features,
+)
+from fastq_kmers import open_reads
+from model_registry import ModelRegistry
+from organism_registry import DEFAULT_TAXON, OrganismRegistry
+from minhash import SketchIndex
+from gene_detection import get_detector
+from point_mutations import MUTATION_PANEL, get_mutation_caller, mutation_genes
+from similarity_index import SIMILARITY_INDEX_NAME, SimilarityIndex
+from genome_pyramid import MAX_WINDOWS, load_pyramid
+import compute_pool
+import request_profiler
 
 TARGET_ANTIBIOTICS = [
     "ampicillin",
@@ -56,27 +96,65 @@ TARGET_ANTIBIOTICS = [
     "levofloxacin",
 ]
 
-MODELS = {}
-SHAP_DATA = {}
-METRICS = {}
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", 0))
+
+# Estimated identity above which an upload is treated as a training genome
+SKETCH_MATCH_IDENTITY = float(os.environ.get("SKETCH_MATCH_IDENTITY", 0.999))
+
+# Preview mode: default sample fraction, and the distance from 0.5 below which a
+# sampled prediction is flagged ambiguous (see training/preview_study.py)
+PREVIEW_FRACTION = float(os.environ.get("PREVIEW_FRACTION", 0.1))
+PREVIEW_MARGIN = float(os.environ.get("PREVIEW_MARGIN", 0.1))
+# Total size of the FASTQ files of one analyze_reads upload (streamed, so not held in memory)
+READS_MAX_BYTES = int(os.environ.get("READS_MAX_BYTES", 2_000_000_000))
+# Werkzeug refuses larger bodies (413) before parsing them; multipart framing
+# of the reads upload gets 1 MB of headroom
+app.config["MAX_CONTENT_LENGTH"] = READS_MAX_BYTES + 1_000_000
+
 AMR_DF = None
 TRAINING_GENOME_IDS = set()
+SKETCH_INDEX = None
+LAB_PHENOTYPES = {}  # genome_id -> {antibiotic: "resistant" | "susceptible"}
+_SIMILARITY_INDEXES = {}  # path -> (mtime_ns, SimilarityIndex)
+# Waits on the second compute-pool job of streamed analyses (admission still caps the jobs)
+_STREAM_THREADS = ThreadPoolExecutor(max_workers=max(2, compute_pool.ANALYZE_MAX_JOBS))
+SIMILAR_MAX_K = 50
 
 
-def load_models():
-    """Load all trained models, SHAP data, and AMR lab data at startup."""
-    global METRICS, AMR_DF, TRAINING_GENOME_IDS
-    metrics_path = os.path.join(MODELS_DIR, "metrics.json")
-    if os.path.exists(metrics_path):
-        with open(metrics_path) as f:
-            METRICS = json.load(f)
+def smoke_genome_features():
+    """k-mer features of a fixed synthetic genome, used to validate new model sets."""
+    rng = random.Random(562)
+    seq = "".join(rng.choice("ACGT") for _ in range(50_000))
+    return extract_kmers_from_fasta_text(">smoke\n" + seq)
+
 
+REGISTRY = ModelRegistry(MODELS_DIR, TARGET_ANTIBIOTICS, smoke_genome_features())
+# E. coli is REGISTRY; other organisms (models/organisms/<taxon>/) load on first use
+ORGANISMS = OrganismRegistry(MODELS_DIR, REGISTRY, TARGET_ANTIBIOTICS, REGISTRY.smoke_features)
+
+
+def is_admin():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def load_models():
+    """Load the active model set and AMR lab data at startup."""
+    global AMR_DF, TRAINING_GENOME_IDS, SKETCH_INDEX, LAB_PHENOTYPES
     # Load AMR phenotype lab data for verification (compact version in backend/data)
     amr_path = os.path.join(BASE_DIR, "data", "amr_labels.csv")
     if os.path.exists(amr_path):
         AMR_DF = pd.read_csv(amr_path, dtype=str)
         AMR_DF["antibiotic"] = AMR_DF["antibiotic"].str.lower()
         print(f"Loaded AMR lab data: {len(AMR_DF)} rows")
+        # Per-genome phenotype lookup for /api/similar (one dict hit per neighbour)
+        labeled = AMR_DF[AMR_DF["resistant_phenotype"].isin(["Resistant", "Susceptible"])]
+        LAB_PHENOTYPES = {}
+        for gid, ab, phenotype in zip(
+            labeled["genome_id"], labeled["antibiotic"], labeled["resistant_phenotype"]
+        ):
+            LAB_PHENOTYPES.setdefault(gid, {})[ab] = phenotype.lower()
 
     # Load training genome IDs to flag training set membership
     gids_path = os.path.join(BASE_DIR, "data", "genome_ids.json")
@@ -85,35 +163,72 @@ def load_models():
             TRAINING_GENOME_IDS = set(json.load(f))
         print(f"Loaded {len(TRAINING_GENOME_IDS)} training genome IDs")
 
-    for ab in TARGET_ANTIBIOTICS:
-        ab_safe = ab.replace("/", "_")
-        model_path = os.path.join(MODELS_DIR, f"{ab_safe}.joblib")
-        if os.path.exists(model_path):
-            MODELS[ab] = joblib.load(model_path)
-
-        shap_path = os.path.join(MODELS_DIR, f"{ab_safe}_shap.json")
-        if os.path.exists(shap_path):
-            with open(shap_path) as f:
-                SHAP_DATA[ab] = json.load(f)
-
-    print(f"Loaded {len(MODELS)} models: {list(MODELS.keys())}")
+    # MinHash sketches of the training genomes (training/build_sketch_index.py)
+    if os.path.exists(SKETCH_INDEX_PATH):
+        SKETCH_INDEX = SketchIndex(SKETCH_INDEX_PATH)
+        print(f"Loaded sketch index: {len(SKETCH_INDEX)} genomes ({SKETCH_INDEX.load_ms:.0f} ms)")
+
+    # Build / open the CARD seed index before compute-pool workers start using it
+    detector = get_detector()
+    if detector is not None:
+        print(f"Loaded CARD seed index: {len(detector)} reference sequences")
+    caller = get_mutation_caller()
+    if caller is not None:
+        print(f"Loaded point-mutation loci: {', '.join(caller.loci)}")
+
+    model_set = REGISTRY.load()
+    print(f"Loaded {len(model_set.models)} models: {list(model_set.models.keys())}")
+    ORGANISMS.registry(DEFAULT_TAXON)
+    others = [o.name for t, o in ORGANISMS.organisms.items() if t != DEFAULT_TAXON]
+    if others:
+        print(f"Other organisms (loaded on first use): {', '.join(others)}")
+    if MODEL_WATCH_INTERVAL > 0:
+        ORGANISMS.watch(MODEL_WATCH_INTERVAL)
 
 
 def parse_genome_id(fasta_text):
-    """Extract genome ID (e.g. '562.100018') from the first FASTA header line."""
+    """Extract a PATRIC genome ID (taxon.number, e.g. '562.100018') from the first FASTA header.
+
+    Only IDs whose taxon has models count: a bare decimal elsewhere in the
+    header (cov=35.27, depth=12.34) is not a genome ID, and returning one would
+    also stop training_membership from taking the ID of a sketch match.
+    """
     for line in fasta_text.strip().split("\n"):
         if line.startswith(">"):
             # Match patterns like 562.100018 in headers like:
             # >accn|562.100018.con.0004  ERR... [Escherichia coli ... | 562.100018]
-            match = re.search(r"\b(562\.\d+)\b", line)
-            if match:
-                return match.group(1)
+            for genome_id in re.findall(r"\b(\d{2,7}\.\d{2,})\b", line):
+                if genome_id.split(".")[0] in ORGANISMS.organisms:
+                    return genome_id
+            return None
     return None
 
 
-def get_lab_results(genome_id):
-    """Look up lab-confirmed AMR phenotypes from amr_labels.csv for a genome."""
-    if AMR_DF is None or genome_id is None:
+def route_organism(data, genome_id):
+    """Taxon for a request: explicit organism/taxon parameter, else the header taxon, else E. coli.
+
+    Returns (taxon, error message); an explicit organism that has no models is an error.
+    """
+    explicit = data.get("organism") or data.get("taxon") or request.args.get("organism")
+    if explicit:
+        taxon = ORGANISMS.resolve(explicit)
+        if taxon is None:
+            available = ", ".join(f"{o.name} ({t})" for t, o in ORGANISMS.organisms.items())
+            return None, f"No models for organism {explicit!r}. Available: {available}"
+        return taxon, None
+    header_taxon = genome_id.split(".")[0] if genome_id else None
+    return (header_taxon if header_taxon in ORGANISMS.organisms else DEFAULT_TAXON), None
+
+
+def requested_registry():
+    """ModelRegistry for the ?organism= query parameter (default E. coli), or None if unknown."""
+    taxon = ORGANISMS.resolve(request.args.get("organism", DEFAULT_TAXON))
+    return ORGANISMS.registry(taxon) if taxon else None
+
+
+def get_lab_results(genome_id, taxon=DEFAULT_TAXON):
+    """Look up lab-confirmed AMR phenotypes from amr_labels.csv (E. coli only) for a genome."""
+    if AMR_DF is None or genome_id is None or taxon != DEFAULT_TAXON:
         return {}
     rows = AMR_DF[AMR_DF["genome_id"] == genome_id]
     lab_results = {}
@@ -128,51 +243,13 @@ def get_lab_results(genome_id):
     return lab_results
 
 
-def extract_kmers_from_fasta_text(fasta_text):
-    """Extract 6-mer frequency vector from raw FASTA text."""
-    counts = np.zeros(len(KMER_INDEX), dtype=np.float64)
-
-    sequence = []
-    for line in fasta_text.strip().split("\n"):
-        line = line.strip()
-        if line.startswith(">"):
-            # Process previous sequence
-            if sequence:
-                seq = "".join(sequence).upper()
-                for i in range(len(seq) - K + 1):
-                    kmer = seq[i : i + K]
-                    if kmer in KMER_INDEX:
-                        counts[KMER_INDEX[kmer]] += 1
-                sequence = []
-        else:
-            sequence.append(line)
-
-    # Process last sequence
-    if sequence:
-        seq = "".join(sequence).upper()
-        for i in range(len(seq) - K + 1):
-            kmer = seq[i : i + K]
-            if kmer in KMER_INDEX:
-                counts[KMER_INDEX[kmer]] += 1
-
-    total = counts.sum()
-    if total > 0:
-        return (counts / total).astype(np.float32)
-    return counts.astype(np.float32)
-
-
-def load_json(path):
-    with open(path) as f:
-        return json.load(f)
-
-
 @app.route("/api/genomes", methods=["GET"])
 def list_genomes():
     """Return list of available demo genomes."""
     index_path = os.path.join(DEMO_DIR, "index.json")
     if not os.path.exists(index_path):
         return jsonify({"error": "No demo genomes available"}), 404
-    return jsonify(load_json(index_path))
+    return cached_json_response(index_path)
 
 
 @app.route("/api/analyze", methods=["POST"])
@@ -192,96 +269,124 @@ def analyze_genome():
     if not os.path.exists(genome_path):
         return jsonify({"error": f"Genome {genome_id} not found"}), 404
 
-    return jsonify(load_json(genome_path))
+    return cached_json_response(genome_path, allow_compact=True)
 
 
-@app.route("/api/analyze_fasta", methods=["POST"])
-def analyze_fasta():
-    """Analyze raw FASTA text through all trained models."""
+def read_fasta_request():
+    """(fasta text, taxon, error response) for an analyze_fasta-style request body."""
     data = request.get_json()
     if not data or "fasta" not in data:
-        return jsonify({"error": "fasta field is required"}), 400
+        return None, None, (jsonify({"error": "fasta field is required"}), 400)
 
     fasta_text = data["fasta"]
     if len(fasta_text.strip()) < 100:
-        return jsonify({"error": "FASTA sequence too short"}), 400
+        return None, None, (jsonify({"error": "FASTA sequence too short"}), 400)
 
     # Cap at 50 MB to prevent memory exhaustion
     if len(fasta_text) > 50_000_000:
-        return jsonify({"error": "FASTA sequence too large (max 50 MB)"}), 400
+        return None, None, (jsonify({"error": "FASTA sequence too large (max 50 MB)"}), 400)
 
-    # Parse genome ID from FASTA header for lab result lookup
-    genome_id = parse_genome_id(fasta_text)
-    lab_results = get_lab_results(genome_id)
-    in_training_set = genome_id in TRAINING_GENOME_IDS if genome_id else False
+    taxon, error = route_organism(data, parse_genome_id(fasta_text))
+    if error:
+        return None, None, (jsonify({"error": error}), 404)
+    return fasta_text, taxon, None
 
-    # Extract k-mer features
-    features = extract_kmers_from_fasta_text(fasta_text)
-    X = features.reshape(1, -1)
 
-    # Run through each model
-    predictions = []
-    for ab in TARGET_ANTIBIOTICS:
-        lab = lab_results.get(ab)
-        lab_phenotype = lab["phenotype"] if lab else None
-
-        if ab not in MODELS:
-            predictions.append({
-                "antibiotic": ab,
-                "prediction": "No model",
-                "confidence": 0,
-                "resistant_probability": 0,
-                "lab_result": lab_phenotype,
-                "match": None,
-            })
-            continue
+def overloaded_response(e):
+    response = jsonify({"error": "Server busy, please retry shortly"})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def training_membership(genome_id, sketch, taxon):
+    """(genome_id, in training set, nearest training genomes): FASTA header ID, else sequence content.
 
-        model = MODELS[ab]
-        prob = model.predict_proba(X)[0]
-        pred_class = int(prob[1] >= 0.5)
-        confidence = float(prob[1]) if pred_class == 1 else float(prob[0])
+    The training IDs and sketch index are E. coli's; other organisms are never
+    matched against them. Without a sketch only the header ID is checked.
+    """
+    if taxon != DEFAULT_TAXON:
+        return genome_id, False, []
+    nearest = SKETCH_INDEX.query(sketch) if SKETCH_INDEX is not None and sketch is not None else []
+    in_training_set = genome_id in TRAINING_GENOME_IDS if genome_id else False
+    # Renamed uploads of training genomes are still recognised by content
+    if not in_training_set and nearest and nearest[0]["identity"] >= SKETCH_MATCH_IDENTITY:
+        in_training_set = True
+        genome_id = genome_id or nearest[0]["genome_id"]
+    return genome_id, in_training_set, nearest
 
-        ab_metrics = METRICS.get(ab, {})
-        top_kmers = SHAP_DATA.get(ab, [])[:10]
 
-        pred_label = "Resistant" if pred_class == 1 else "Susceptible"
-        match = (pred_label == lab_phenotype) if lab_phenotype else None
+def predict_antibiotic(model_set, ab, X, lab_results):
+    """One entry of the predictions list."""
+    lab = lab_results.get(ab)
+    lab_phenotype = lab["phenotype"] if lab else None
 
-        predictions.append({
+    if ab not in model_set.models:
+        return {
             "antibiotic": ab,
-            "prediction": pred_label,
-            "confidence": round(confidence, 4),
-            "resistant_probability": round(float(prob[1]), 4),
-            "model_accuracy": ab_metrics.get("cv_accuracy"),
-            "model_f1": ab_metrics.get("cv_f1"),
-            "top_kmers": top_kmers,
+            "prediction": "No model",
+            "confidence": 0,
+            "resistant_probability": 0,
             "lab_result": lab_phenotype,
-            "lab_method": lab["method"] if lab else None,
-            "match": match,
-        })
-
-    # Extract genome name from first FASTA header
-    genome_name = "Uploaded genome"
+            "match": None,
+        }
+
+    model = model_set.models[ab]
+    prob = model.predict_proba(X)[0]
+    pred_class = int(prob[1] >= 0.5)
+    confidence = float(prob[1]) if pred_class == 1 else float(prob[0])
+
+    ab_metrics = model_set.metrics.get(ab, {})
+    top_kmers = model_set.shap_data.get(ab, [])[:10]
+
+    pred_label = "Resistant" if pred_class == 1 else "Susceptible"
+    match = (pred_label == lab_phenotype) if lab_phenotype else None
+
+    return {
+        "antibiotic": ab,
+        "prediction": pred_label,
+        "confidence": round(confidence, 4),
+        "resistant_probability": round(float(prob[1]), 4),
+        "model_accuracy": ab_metrics.get("cv_accuracy"),
+        "model_f1": ab_metrics.get("cv_f1"),
+        "top_kmers": top_kmers,
+        "lab_result": lab_phenotype,
+        "lab_method": lab["method"] if lab else None,
+        "match": match,
+    }
+
+
+def genome_name_of(fasta_text):
+    """Genome name from the first FASTA header."""
     for line in fasta_text.strip().split("\n"):
         if line.startswith(">"):
-            genome_name = line[1:].strip()[:80]
-            break
-
-    resistant_count = sum(1 for p in predictions if p["prediction"] == "Resistant")
-
-    # Compute genome stats from FASTA
-    genome_stats = compute_genome_stats(fasta_text)
-
-    # Infer resistance genes based on predictions
-    resistance_genes = infer_resistance_genes(
-        predictions, genome_stats["chromosome"]["length"]
-    )
-
-    # Build SHAP data keyed by antibiotic for frontend ShapExplanation
+            return line[1:].strip()[:80]
+    return "Uploaded genome"
+
+
+def resistance_genes_for(predictions, genome_stats, detected_genes, mutations):
+    """Genes found in the sequence (CARD seed index); without references, inferred from predictions."""
+    if detected_genes is not None:
+        resistance_genes = detected_genes
+    else:
+        resistance_genes = infer_resistance_genes(
+            predictions, genome_stats["chromosome"]["length"]
+        )
+    if mutations is not None:
+        # Called codons replace mutations that were only inferred from the predictions
+        resistance_genes = [
+            gene for gene in resistance_genes
+            if gene.get("detection") or gene["gene_id"].split("-")[0] not in MUTATION_PANEL
+        ] + mutation_genes(mutations)
+    return resistance_genes
+
+
+def shap_for(model_set, predictions):
+    """SHAP data keyed by antibiotic for frontend ShapExplanation."""
     shap_by_drug = {}
     for p in predictions:
         ab = p["antibiotic"]
-        raw_shap = SHAP_DATA.get(ab, [])[:10]
+        raw_shap = model_set.shap_data.get(ab, [])[:10]
         if raw_shap:
             is_resistant = p["prediction"] == "Resistant"
             shap_by_drug[ab] = [
@@ -292,10 +397,16 @@ def analyze_fasta():
                 }
                 for entry in raw_shap
             ]
+    return shap_by_drug
 
-    return jsonify({
+
+def analysis_payload(genome_name, taxon, model_set, predictions, genome_stats, resistance_genes,
+                     mutations, lab_results, in_training_set, nearest):
+    resistant_count = sum(1 for p in predictions if p["prediction"] == "Resistant")
+    return {
         "genome_name": genome_name,
-        "organism": "Escherichia coli",
+        "organism": ORGANISMS.organisms[taxon].name,
+        "taxon_id": taxon,
         "predictions": predictions,
         "summary": {
             "total_antibiotics": len(predictions),
@@ -304,27 +415,523 @@ def analyze_fasta():
         },
         "genome_data": genome_stats,
         "resistance_genes": resistance_genes,
-        "shap": shap_by_drug,
+        "shap": shap_for(model_set, predictions),
         "lab_results": {ab: lr["phenotype"].lower() for ab, lr in lab_results.items()},
         "genome_in_training_set": in_training_set,
+        "nearest_training_genomes": nearest,
+        "point_mutations": mutations,
+        "model_version": model_set.version,
+    }
+
+
+@app.route("/api/analyze_fasta", methods=["POST"])
+@request_profiler.profiled(is_admin)
+def analyze_fasta():
+    """Analyze raw FASTA text through all trained models."""
+    fasta_text, taxon, error = read_fasta_request()
+    if error:
+        return error
+
+    preview, error = requested_preview(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Pin one model version for the whole request, even if a reload swaps it
+    # or the organism is evicted
+    organism = ORGANISMS.organisms[taxon]
+    model_set = ORGANISMS.registry(taxon).current()
+    g.model_version = model_set.version
+    if preview is not None:
+        return analyze_fasta_preview(fasta_text, taxon, model_set, *preview)
+
+    # Extract k-mer features, sketch and genome stats off the request thread
+    try:
+        (features, sketch, genome_stats, detected_genes, mutations), queue_wait, compute_time = request_profiler.run_job(
+            analyze_sequence, fasta_text, taxon == DEFAULT_TAXON, weight=len(fasta_text)
+        )
+    except compute_pool.Overloaded as e:
+        return overloaded_response(e)
+    X = features.reshape(1, -1)
+
+    genome_id, in_training_set, nearest = training_membership(parse_genome_id(fasta_text), sketch, taxon)
+    lab_results = get_lab_results(genome_id, taxon)
+    predictions = [predict_antibiotic(model_set, ab, X, lab_results) for ab in organism.antibiotics]
+    resistance_genes = resistance_genes_for(predictions, genome_stats, detected_genes, mutations)
+
+    payload = analysis_payload(
+        genome_name_of(fasta_text), taxon, model_set, predictions, genome_stats, resistance_genes,
+        mutations, lab_results, in_training_set, nearest,
+    )
+    return analysis_response(payload, queue_wait, compute_time)
+
+
+def analysis_response(payload, queue_wait, compute_time):
+    if wants_compact():
+        response = compact_response(payload)
+    else:
+        response = jsonify(payload)
+        response.vary.add("Accept")
+    response.headers["Server-Timing"] = (
+        f"queue;dur={queue_wait * 1000:.1f}, compute;dur={compute_time * 1000:.1f}"
+    )
+    return response
+
+
+def requested_preview(data):
+    """((fraction, refine), None) for {"preview": true | fraction[, "refine": true]}, (None, None) without it."""
+    value = data.get("preview")
+    if value is None or value is False:
+        return None, None
+    fraction = PREVIEW_FRACTION if value is True else value
+    if isinstance(fraction, bool) or not isinstance(fraction, (int, float)) or not 0 < fraction <= 1:
+        return None, "preview must be true or a sample fraction in (0, 1]"
+    return (float(fraction), bool(data.get("refine", False))), None
+
+
+def analyze_fasta_preview(fasta_text, taxon, model_set, fraction, refine):
+    """Preliminary predictions from k-mers of a window sample of the genome.
+
+    Predictions within PREVIEW_MARGIN of the 0.5 threshold are marked
+    ambiguous: the sample may have put them on the wrong side. With refine,
+    only those are re-predicted from full-genome k-mers (one more compute-pool
+    job, and only when something is ambiguous). The sketch, gene scan,
+    mutation calls and GC tracks are skipped; genes are inferred from the
+    predictions and training-set membership comes from the header ID alone.
+    """
+    organism = ORGANISMS.organisms[taxon]
+    try:
+        (features, genome_stats, bases_counted), queue_wait, compute_time = request_profiler.run_job(
+            preview_features, fasta_text, fraction, weight=len(fasta_text)
+        )
+    except compute_pool.Overloaded as e:
+        return overloaded_response(e)
+    X = features.reshape(1, -1)
+
+    genome_id, in_training_set, _ = training_membership(parse_genome_id(fasta_text), None, taxon)
+    lab_results = get_lab_results(genome_id, taxon)
+    predictions = [predict_antibiotic(model_set, ab, X, lab_results) for ab in organism.antibiotics]
+    for p in predictions:
+        p["ambiguous"] = p["prediction"] != "No model" and abs(p["resistant_probability"] - 0.5) < PREVIEW_MARGIN
+    ambiguous = [p["antibiotic"] for p in predictions if p["ambiguous"]]
+
+    refined = []
+    if refine and ambiguous:
+        try:
+            (_, full_features), refine_wait, refine_time = request_profiler.run_job(
+                sequence_features, fasta_text, weight=len(fasta_text)
+            )
+        except compute_pool.Overloaded as e:
+            return overloaded_response(e)
+        queue_wait, compute_time = queue_wait + refine_wait, compute_time + refine_time
+        X_full = full_features.reshape(1, -1)
+        for i, p in enumerate(predictions):
+            if p["ambiguous"]:
+                predictions[i] = {**predict_antibiotic(model_set, p["antibiotic"], X_full, lab_results),
+                                  "ambiguous": False}
+                refined.append(p["antibiotic"])
+
+    resistance_genes = resistance_genes_for(predictions, genome_stats, None, None)
+    payload = analysis_payload(
+        genome_name_of(fasta_text), taxon, model_set, predictions, genome_stats, resistance_genes,
+        None, lab_results, in_training_set, [],
+    )
+    payload["preview"] = {
+        "fraction": fraction,
+        "bases_counted": bases_counted,
+        "genome_length": genome_stats["chromosome"]["length"],
+        "margin": PREVIEW_MARGIN,
+        "ambiguous": [ab for ab in ambiguous if ab not in refined],
+        "refined": refined,
+    }
+    return analysis_response(payload, queue_wait, compute_time)
+
+
+def sse_event(event, data):
+    """One server-sent event; data is JSON on a single line."""
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+
+@app.route("/api/analyze_fasta/stream", methods=["POST"])
+def analyze_fasta_stream():
+    """analyze_fasta as server-sent events, sending each result as soon as it exists.
+
+    Events, in order:
+      parsed       contig count and genome length
+      features     k-mer features ready (queue / compute ms)
+      prediction   one per antibiotic, same objects as payload["predictions"]
+      genome       genome_data, resistance_genes, point_mutations, training-set match
+      result       the complete payload, identical to POST /api/analyze_fasta
+      error        {"error", "status"[, "retry_after"]}; ends the stream
+
+    k-mer features are computed before the response starts, so validation
+    errors and a full compute pool get the same 4xx / 429 responses as the
+    plain endpoint. The sketch / genome stats / gene / mutation job is queued
+    while predictions stream. Streamed predictions carry lab results for the
+    header genome ID; if the sketch then recognises a renamed training genome,
+    the result event carries its lab results instead.
+    """
+    fasta_text, taxon, error = read_fasta_request()
+    if error:
+        return error
+    organism = ORGANISMS.organisms[taxon]
+    model_set = ORGANISMS.registry(taxon).current()
+    g.model_version = model_set.version
+
+    try:
+        (contigs, features), queue_wait, compute_time = compute_pool.run_job(
+            sequence_features, fasta_text, weight=len(fasta_text)
+        )
+    except compute_pool.Overloaded as e:
+        return overloaded_response(e)
+    annotations = _STREAM_THREADS.submit(
+        compute_pool.run_job, sequence_annotations, fasta_text, contigs, taxon == DEFAULT_TAXON,
+        weight=len(fasta_text),
+    )
+
+    def generate():
+        try:
+            yield from stream_events()
+        finally:
+            # Client gone (or the stream failed): don't leave the annotations job queued
+            annotations.cancel()
+
+    def stream_events():
+        yield sse_event("parsed", {
+            "contigs": len(contigs),
+            "length": int(sum(len(codes) for _, codes in contigs)),
+        })
+        yield sse_event("features", {
+            "queue_ms": round(queue_wait * 1000, 1), "compute_ms": round(compute_time * 1000, 1),
+        })
+        X = features.reshape(1, -1)
+        header_id = parse_genome_id(fasta_text)
+        lab_results = get_lab_results(header_id, taxon)
+        predictions = []
+        for ab in organism.antibiotics:
+            predictions.append(predict_antibiotic(model_set, ab, X, lab_results))
+            yield sse_event("prediction", predictions[-1])
+
+        try:
+            (sketch, genome_stats, detected_genes, mutations), _, _ = annotations.result()
+        except compute_pool.Overloaded as e:
+            yield sse_event("error", {
+                "error": "Server busy, please retry shortly", "status": 429, "retry_after": e.retry_after,
+            })
+            return
+        except Exception as e:
+            # The 200 is already on the wire: report the failure as the final event
+            print(f"  ERROR: streamed analysis failed: {type(e).__name__}: {e}")
+            yield sse_event("error", {"error": "Analysis failed", "status": 500})
+            return
+        genome_id, in_training_set, nearest = training_membership(header_id, sketch, taxon)
+        if genome_id != header_id:
+            lab_results = get_lab_results(genome_id, taxon)
+            predictions = [predict_antibiotic(model_set, ab, X, lab_results) for ab in organism.antibiotics]
+        resistance_genes = resistance_genes_for(predictions, genome_stats, detected_genes, mutations)
+        yield sse_event("genome", {
+            "genome_data": genome_stats,
+            "resistance_genes": resistance_genes,
+            "point_mutations": mutations,
+            "genome_in_training_set": in_training_set,
+            "nearest_training_genomes": nearest,
+        })
+        yield sse_event("result", analysis_payload(
+            genome_name_of(fasta_text), taxon, model_set, predictions, genome_stats, resistance_genes,
+            mutations, lab_results, in_training_set, nearest,
+        ))
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # nginx: don't hold events back
+    response.headers["Server-Timing"] = (
+        f"queue;dur={queue_wait * 1000:.1f}, compute;dur={compute_time * 1000:.1f}"
+    )
+    return response
+
+
+@app.route("/api/analyze_reads", methods=["POST"])
+@request_profiler.profiled(is_admin)
+def analyze_reads():
+    """Analyze FASTQ reads (multipart upload) through all trained models.
+
+    The reads are spooled to a temporary directory and streamed through
+    fastq_kmers.count_reads in a compute-pool job, so memory does not grow with
+    the upload. There is no assembly, so genes are inferred from the
+    predictions, the genome length is estimated from k-mer coverage and
+    training-set membership comes from the genome_id field alone.
+    """
+    # Refuse oversized bodies before Werkzeug spools the multipart parts to disk
+    if request.content_length is None:
+        return jsonify({"error": "Content-Length is required"}), 411
+    if request.content_length > READS_MAX_BYTES:
+        return jsonify({"error": f"Reads too large (max {READS_MAX_BYTES // 1_000_000} MB)"}), 413
+    uploads = [f for f in request.files.getlist("reads") if f.filename]
+    if not uploads or len(uploads) > 2:
+        return jsonify({"error": "reads must be one FASTQ file or a pair of mates"}), 400
+    genome_id = request.form.get("genome_id") or None
+    if genome_id and not all(c.isalnum() or c == "." for c in genome_id):
+        return jsonify({"error": "Invalid genome_id format"}), 400
+    taxon, error = route_organism(request.form, genome_id)
+    if error:
+        return jsonify({"error": error}), 404
+
+    organism = ORGANISMS.organisms[taxon]
+    model_set = ORGANISMS.registry(taxon).current()
+    g.model_version = model_set.version
+
+    tmp_dir = tempfile.mkdtemp(prefix="reads-")
+    try:
+        paths = []
+        for i, upload in enumerate(uploads):
+            path = os.path.join(tmp_dir, f"reads_{i + 1}.fastq")
+            upload.save(path)
+            paths.append(path)
+        if sum(os.path.getsize(p) for p in paths) > READS_MAX_BYTES:
+            return jsonify({"error": f"Reads too large (max {READS_MAX_BYTES // 1_000_000} MB)"}), 413
+        for path, upload in zip(paths, uploads):
+            try:
+                with open_reads(path) as f:
+                    first = f.read(1)
+            except OSError:
+                first = b""
+            if first != b"@":
+                return jsonify({"error": f"{upload.filename} is not a FASTQ file"}), 400
+
+        try:
+            (features, read_stats), queue_wait, compute_time = request_profiler.run_job(
+                reads_features, paths, lane="reads"
+            )
+        except compute_pool.Overloaded as e:
+            return overloaded_response(e)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if not read_stats["kmers_counted"]:
+        return jsonify({"error": "No k-mers passed the abundance filter (too few reads?)"}), 400
+    X = features.reshape(1, -1)
+
+    genome_id, in_training_set, _ = training_membership(genome_id, None, taxon)
+    lab_results = get_lab_results(genome_id, taxon)
+    predictions = [predict_antibiotic(model_set, ab, X, lab_results) for ab in organism.antibiotics]
+    genome_stats = {
+        "chromosome": {"length": read_stats["est_genome_size"]},
+        "gc_content_windows": [],
+        "reads": read_stats,
+    }
+    resistance_genes = resistance_genes_for(predictions, genome_stats, None, None)
+    name = request.form.get("name") or genome_id or uploads[0].filename
+    payload = analysis_payload(
+        name[:80], taxon, model_set, predictions, genome_stats, resistance_genes,
+        None, lab_results, in_training_set, [],
+    )
+    return analysis_response(payload, queue_wait, compute_time)
+
+
+def get_similarity_index():
+    """Similarity index of the serving model set (or the base set), reloaded when rebuilt."""
+    for directory in (REGISTRY.current().path, MODELS_DIR):
+        path = os.path.join(directory, SIMILARITY_INDEX_NAME)
+        if not os.path.exists(path):
+            continue
+        mtime = os.stat(path).st_mtime_ns
+        cached = _SIMILARITY_INDEXES.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, SimilarityIndex(path))
+            _SIMILARITY_INDEXES[path] = cached
+        return cached[1]
+    return None
+
+
+@app.route("/api/similar", methods=["GET", "POST"])
+def similar_genomes():
+    """Return the k most similar training genomes (k-mer profile cosine) and their lab phenotypes."""
+    data = request.get_json(silent=True) or {}
+    params = {**request.args, **data}
+    # The index holds E. coli training genomes only
+    query_id = params.get("genome_id") or (
+        parse_genome_id(data["fasta"]) if isinstance(data.get("fasta"), str) else None
+    )
+    taxon, error = route_organism(params, query_id)
+    if error:
+        return jsonify({"error": error}), 404
+    if taxon != DEFAULT_TAXON:
+        return jsonify({"error": f"No similarity index for {ORGANISMS.organisms[taxon].name}"}), 404
+    index = get_similarity_index()
+    if index is None:
+        return jsonify({"error": "No similarity index. Run training/build_similarity_index.py first."}), 404
+
+    try:
+        k = max(1, min(int(params.get("k", 10)), SIMILAR_MAX_K))
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be an integer"}), 400
+
+    genome_id = params.get("genome_id")
+    exclude = None
+    if genome_id is not None:
+        if genome_id not in index.row_of:
+            return jsonify({"error": f"genome_id {genome_id} is not in the training set"}), 404
+        query = index.vectors[index.row_of[genome_id]]
+        exclude = [index.row_of[genome_id]]
+    elif "fasta" in data:
+        fasta_text = data["fasta"]
+        if len(fasta_text.strip()) < 100:
+            return jsonify({"error": "FASTA sequence too short"}), 400
+        if len(fasta_text) > 50_000_000:
+            return jsonify({"error": "FASTA sequence too large (max 50 MB)"}), 400
+        try:
+            features, _, _ = compute_pool.run_job(
+                extract_kmers_from_fasta_text, fasta_text, weight=len(fasta_text)
+            )
+        except compute_pool.Overloaded as e:
+            return overloaded_response(e)
+        query = index.project(features)[0]
+    else:
+        return jsonify({"error": "genome_id or fasta is required"}), 400
+
+    t0 = time.perf_counter()
+    rows, sims = index.search(query, k=k, exclude=exclude)
+    search_ms = (time.perf_counter() - t0) * 1000
+    neighbors = [
+        {
+            "genome_id": index.genome_ids[row],
+            "similarity": round(float(sim), 4),
+            "lab_results": LAB_PHENOTYPES.get(index.genome_ids[row], {}),
+        }
+        for row, sim in zip(rows[0], sims[0])
+    ]
+    return jsonify({
+        "query_genome_id": genome_id,
+        "neighbors": neighbors,
+        "index_size": len(index),
+        "search_ms": round(search_ms, 3),
+    })
+
+
+@app.route("/api/genome/<genome_hash>/tiles", methods=["GET"])
+def genome_tiles(genome_hash):
+    """GC / GC skew / N-fraction windows of a region of an analyzed genome at one zoom level.
+
+    Query: start, end (bp, default whole genome) and either level (window size
+    base_window * 2**level) or windows (target count; picks the finest level).
+    """
+    pyramid = load_pyramid(genome_hash)
+    if pyramid is None:
+        return jsonify({"error": "Unknown genome_hash. Analyze the genome first."}), 404
+    try:
+        start = max(0, int(request.args.get("start", 0)))
+        end = min(pyramid.length, int(request.args.get("end", pyramid.length)))
+        level = request.args.get("level")
+        level = int(level) if level is not None else None
+        windows = int(request.args.get("windows", 120))
+    except ValueError:
+        return jsonify({"error": "start, end, level and windows must be integers"}), 400
+    if start >= end:
+        return jsonify({"error": "start must be less than end"}), 400
+    if level is None:
+        level = pyramid.level_for(start, end, max(1, min(windows, MAX_WINDOWS)))
+    if not 0 <= level < len(pyramid.levels):
+        return jsonify({"error": f"level must be between 0 and {len(pyramid.levels) - 1}"}), 400
+    if -(-(end - start) // pyramid.window_size(level)) > MAX_WINDOWS:
+        return jsonify({"error": f"Region spans more than {MAX_WINDOWS} windows at this level"}), 400
+
+    response = jsonify({
+        "genome_hash": genome_hash,
+        "length": pyramid.length,
+        "level": level,
+        "levels": len(pyramid.levels),
+        "window_size": pyramid.window_size(level),
+        "start": start,
+        "end": end,
+        "windows": pyramid.windows(start, end, level),
     })
+    # Content-addressed: a genome hash + query always maps to the same tile
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@app.route("/api/admin/profiles", methods=["GET"])
+def list_profiles():
+    """Captured request profiles (newest first) with input size and stage timings."""
+    if not is_admin():
+        return jsonify({"error": "Admin token required"}), 403
+    return jsonify({"profiles": request_profiler.list_captures()})
+
+
+@app.route("/api/admin/profiles/<profile_id>/<part>", methods=["GET"])
+def download_profile(profile_id, part):
+    """Download a capture's request or worker profile (pstats dump or folded stacks)."""
+    if not is_admin():
+        return jsonify({"error": "Admin token required"}), 403
+    path = request_profiler.capture_file(profile_id, part)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, mimetype="application/octet-stream", as_attachment=True,
+                     download_name=os.path.basename(path))
 
 
 @app.route("/api/metrics", methods=["GET"])
 def get_metrics():
-    """Return model training metrics for all antibiotics."""
-    if not METRICS:
+    """Return model training metrics for all antibiotics (?organism=, default E. coli)."""
+    registry = requested_registry()
+    if registry is None:
+        return jsonify({"error": "Unknown organism"}), 404
+    metrics = registry.current().metrics
+    if not metrics:
         return jsonify({"error": "No metrics available"}), 404
-    return jsonify(METRICS)
+    return jsonify(metrics)
 
 
 @app.route("/api/validation", methods=["GET"])
 def get_validation():
     """Return bootstrap validation stats per antibiotic."""
-    path = os.path.join(MODELS_DIR, "validation_stats.json")
+    registry = requested_registry()
+    if registry is None:
+        return jsonify({"error": "Unknown organism"}), 404
+    path = os.path.join(registry.current().path, "validation_stats.json")
+    if not os.path.exists(path):
+        path = os.path.join(registry.models_dir, "validation_stats.json")
     if not os.path.exists(path):
         return jsonify({"error": "No validation stats available. Run training/validate.py first."}), 404
-    return jsonify(load_json(path))
+    return cached_json_response(path)
+
+
+@app.route("/api/models", methods=["GET"])
+def get_models():
+    """Return the active model version, its load timings and available versions.
+
+    E. coli at the top level (unchanged contract); every organism under "organisms".
+    """
+    return jsonify({**REGISTRY.status(), "organisms": ORGANISMS.status()})
+
+
+@app.route("/api/models/reload", methods=["POST"])
+def reload_models():
+    """Load, validate and atomically swap in a model version in the background."""
+    if not is_admin():
+        return jsonify({"error": "Admin token required"}), 403
+    data = request.get_json(silent=True) or {}
+    version = data.get("version")
+    taxon = ORGANISMS.resolve(data.get("organism", DEFAULT_TAXON))
+    if taxon is None:
+        return jsonify({"error": f"Unknown organism {data.get('organism')!r}"}), 404
+    registry = ORGANISMS.registry(taxon)
+    try:
+        registry.resolve(version)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    # An explicit version is recorded in the organism's CURRENT once it validates,
+    # so watch() keeps it and a reload after eviction or restart comes back to it
+    registry.reload_async(version, persist=True)
+    return jsonify({"status": "loading", "version": version or "CURRENT", "taxon": taxon}), 202
+
+
+@app.after_request
+def add_model_version(response):
+    version = g.get("model_version")
+    if version is None and REGISTRY.current() is not None:
+        version = REGISTRY.current().version
+    if version:
+        response.headers["X-Model-Version"] = version
+    return response
 
 
 # Load models at startup
@@ -0,0 +1,109 @@
+"""
+bench_encoding.py — Benchmark JSON vs compact msgpack encoding of analysis payloads.
+
+Compares serialization time and payload size of the default jsonify() body
+against compact_encoding.pack() (raw and gzipped) for every demo genome and
+for a fresh analyze_fasta response on a synthetic genome, and checks that
+from_compact() round-trips each payload.
+
+Usage: python bench_encoding.py [--repeat 200] [--genome-mbp 1.0]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import time
+
+import msgpack
+
+from app import app, DEMO_DIR
+from compact_encoding import pack, from_compact
+
+
+def synthetic_fasta(n_bases, seed=42):
+    rng = random.Random(seed)
+    seq = "".join(rng.choice("ACGT") for _ in range(n_bases))
+    lines = [seq[i : i + 70] for i in range(0, len(seq), 70)]
+    return ">accn|synthetic.con.0001 synthetic genome\n" + "\n".join(lines) + "\n"
+
+
+def time_us(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(samples)
+
+
+def normalize(obj):
+    """Canonical JSON text for round-trip comparison (key order independent)."""
+    return json.dumps(obj, sort_keys=True)
+
+
+def bench_payload(name, payload, repeat):
+    with app.app_context():
+        json_body = app.json.response(payload).get_data()
+        json_us = time_us(lambda: app.json.response(payload).get_data(), repeat)
+    compact_body = pack(payload)
+    compact_us = time_us(lambda: pack(payload), repeat)
+
+    round_trip = from_compact(msgpack.unpackb(compact_body))
+    expected = {
+        **payload,
+        "resistance_genes": [
+            {**g, "description": round_trip["resistance_genes"][i]["description"]}
+            for i, g in enumerate(payload.get("resistance_genes", []))
+        ],
+    }
+    return {
+        "payload": name,
+        "json_bytes": len(json_body),
+        "json_gzip_bytes": len(gzip.compress(json_body)),
+        "compact_bytes": len(compact_body),
+        "compact_gzip_bytes": len(gzip.compress(compact_body)),
+        "json_us": round(json_us, 1),
+        "compact_us": round(compact_us, 1),
+        "round_trip_ok": normalize(round_trip) == normalize(expected),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--genome-mbp", type=float, default=1.0, help="synthetic genome size")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    payloads = []
+    with open(os.path.join(DEMO_DIR, "index.json")) as f:
+        for entry in json.load(f):
+            with open(os.path.join(DEMO_DIR, f"{entry['genome_id']}.json")) as f:
+                payloads.append((f"demo {entry['genome_id']}", json.load(f)))
+
+    fasta = synthetic_fasta(int(args.genome_mbp * 1_000_000))
+    response = app.test_client().post("/api/analyze_fasta", json={"fasta": fasta})
+    payloads.append((f"analyze_fasta {args.genome_mbp:g} Mbp", response.get_json()))
+
+    results = [bench_payload(name, payload, args.repeat) for name, payload in payloads]
+
+    print(f"\n{'payload':28s} {'json B':>8s} {'json.gz':>8s} {'mpack B':>8s} {'mpack.gz':>8s} "
+          f"{'json us':>8s} {'mpack us':>8s}  round-trip")
+    for r in results:
+        print(
+            f"{r['payload']:28s} {r['json_bytes']:8d} {r['json_gzip_bytes']:8d} {r['compact_bytes']:8d} "
+            f"{r['compact_gzip_bytes']:8d} {r['json_us']:8.1f} {r['compact_us']:8.1f}  "
+            f"{'ok' if r['round_trip_ok'] else 'MISMATCH'}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+compact_encoding.py — Compact MessagePack encoding of analysis responses.
+
+Machine-to-machine clients that send `Accept: application/x-msgpack` get the
+analysis payload in a columnar form instead of the default JSON:
+
+  - predictions become one list per field (antibiotic, prediction, ...)
+  - each antibiotic's top k-mers are stored once, as kmer/importance columns
+    (the JSON `shap` block is dropped — it is top_kmers + prediction)
+  - GC windows become start/end/gc columns
+  - gene descriptions equal to GENE_DATABASE's are dropped and the gene is
+    flagged "_description" (look them up by gene_id)
+
+from_compact() rebuilds the JSON payload, so the default contract is untouched.
+"""
+
+import msgpack
+from flask import current_app, request
+
+from resistance_genes import GENE_DATABASE
+
+COMPACT_FORMAT = "bacter.compact/2"
+COMPACT_MIMETYPE = "application/x-msgpack"
+COMPACT_MIMETYPES = (COMPACT_MIMETYPE, "application/msgpack", "application/vnd.msgpack")
+
+_GENE_DESCRIPTIONS = {g["gene_id"]: g["description"] for g in GENE_DATABASE}
+
+
+def wants_compact():
+    """True if the client explicitly asked for msgpack over JSON."""
+    accept = request.accept_mimetypes
+    explicit = {mimetype for mimetype, quality in accept if quality > 0}
+    if not explicit.intersection(COMPACT_MIMETYPES):
+        return False
+    return accept.best_match([*COMPACT_MIMETYPES, "application/json"]) in COMPACT_MIMETYPES
+
+
+def _columns(rows, skip=()):
+    """List of dicts -> dict of lists. Rows lacking a key are listed under "_absent"."""
+    keys = []
+    for row in rows:
+        keys.extend(k for k in row if k not in skip and k not in keys)
+    columns = {k: [row.get(k) for row in rows] for k in keys}
+    absent = {k: [i for i, row in enumerate(rows) if k not in row] for k in keys}
+    absent = {k: idx for k, idx in absent.items() if idx}
+    if absent:
+        columns["_absent"] = absent
+    return columns
+
+
+def to_compact(payload):
+    """Convert an analysis payload (analyze_fasta or demo JSON) to the columnar form."""
+    out = {"format": COMPACT_FORMAT}
+    for key, value in payload.items():
+        if key == "predictions":
+            out["predictions"] = _columns(value, skip=("top_kmers",))
+            out["top_kmers"] = {
+                p["antibiotic"]: {
+                    "kmer": [t["kmer"] for t in p["top_kmers"]],
+                    "importance": [t["importance"] for t in p["top_kmers"]],
+                }
+                for p in value if p.get("top_kmers")
+            }
+        elif key == "genome_data":
+            windows = value.get("gc_content_windows", [])
+            out["genome_data"] = {
+                **{k: v for k, v in value.items() if k != "gc_content_windows"},
+                "gc_content_windows": _columns(windows),
+            }
+        elif key == "resistance_genes":
+            genes = []
+            for gene in value:
+                if "description" in gene and gene["description"] == _GENE_DESCRIPTIONS.get(gene["gene_id"]):
+                    gene = {**{k: v for k, v in gene.items() if k != "description"}, "_description": True}
+                genes.append(gene)
+            out["resistance_genes"] = genes
+        elif key == "shap":
+            out["has_shap"] = True
+        else:
+            out[key] = value
+    return out
+
+
+def _rows(columns):
+    columns = dict(columns)
+    absent = {k: set(idx) for k, idx in columns.pop("_absent", {}).items()}
+    keys = list(columns)
+    n = len(columns[keys[0]]) if keys else 0
+    return [
+        {k: columns[k][i] for k in keys if i not in absent.get(k, ())}
+        for i in range(n)
+    ]
+
+
+def from_compact(compact):
+    """Rebuild the JSON payload from to_compact() output (inverse, up to key order)."""
+    top_kmers = compact.get("top_kmers", {})
+    out = {}
+    for key, value in compact.items():
+        if key in ("format", "top_kmers", "has_shap"):
+            continue
+        if key == "predictions":
+            preds = []
+            for p in _rows(value):
+                tk = top_kmers.get(p["antibiotic"])
+                if tk is not None:
+                    p["top_kmers"] = [
+                        {"kmer": k, "importance": imp} for k, imp in zip(tk["kmer"], tk["importance"])
+                    ]
+                preds.append(p)
+            out["predictions"] = preds
+        elif key == "genome_data":
+            out["genome_data"] = {**value, "gc_content_windows": _rows(value["gc_content_windows"])}
+        elif key == "resistance_genes":
+            # Only genes to_compact() stripped get their description back
+            genes = []
+            for gene in value:
+                if gene.get("_description"):
+                    gene = {"description": _GENE_DESCRIPTIONS[gene["gene_id"]],
+                            **{k: v for k, v in gene.items() if k != "_description"}}
+                genes.append(gene)
+            out["resistance_genes"] = genes
+        else:
+            out[key] = value
+
+    if compact.get("has_shap"):
+        shap = {}
+        for p in out.get("predictions", []):
+            if p.get("top_kmers"):
+                direction = "toward_resistant" if p["prediction"] == "Resistant" else "toward_susceptible"
+                shap[p["antibiotic"]] = [
+                    {"pattern": t["kmer"], "importance": round(t["importance"], 4), "direction": direction}
+                    for t in p["top_kmers"]
+                ]
+        out["shap"] = shap
+    return out
+
+
+def pack(payload):
+    return msgpack.packb(to_compact(payload))
+
+
+def compact_response(payload):
+    response = current_app.response_class(pack(payload), mimetype=COMPACT_MIMETYPE)
+    response.vary.add("Accept")
+    return response
@@ -0,0 +1,137 @@
+"""
+compute_pool.py — Bounded executor with admission control for analyze_fasta.
+
+CPU-heavy work (k-mer counting, GC stats) runs in a process pool instead of on
+the request thread. Admission is limited two ways:
+
+  ANALYZE_WORKERS     worker processes (0 = run inline on the request thread)
+  ANALYZE_MAX_JOBS    jobs queued + running at once (default 2 x workers)
+  ANALYZE_MAX_BYTES   upload bytes in flight at once (default 200 MB)
+  ANALYZE_MAX_READS_JOBS  analyze_reads jobs at once (default 1)
+
+Reads jobs stream their FASTQ from disk in fixed memory, so they are not
+charged against the byte budget; they run in their own "reads" lane, capped
+separately, so a long FASTQ job never locks analyze_fasta uploads out.
+
+A job that would exceed any limit is refused immediately with Overloaded,
+which the API turns into 429 + Retry-After instead of letting uploads pile up
+in memory. run_job() reports queue wait and compute time separately.
+"""
+
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+ANALYZE_WORKERS = int(os.environ.get("ANALYZE_WORKERS", min(4, os.cpu_count() or 1)))
+ANALYZE_MAX_JOBS = int(os.environ.get("ANALYZE_MAX_JOBS", max(2, 2 * ANALYZE_WORKERS)))
+ANALYZE_MAX_BYTES = int(os.environ.get("ANALYZE_MAX_BYTES", 200_000_000))
+ANALYZE_MAX_READS_JOBS = int(os.environ.get("ANALYZE_MAX_READS_JOBS", 1))
+LANE_LIMITS = {"reads": ANALYZE_MAX_READS_JOBS}
+
+_lock = threading.Lock()
+_executor = None
+_inflight_jobs = 0
+_inflight_bytes = 0
+_inflight_lanes = {}  # lane -> jobs queued + running
+_avg_compute_s = 1.0  # EWMA of job compute time, seeds the Retry-After estimate
+
+
+class Overloaded(Exception):
+    """Raised when a job cannot be admitted; retry_after is in whole seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"compute pool full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=ANALYZE_WORKERS)
+        return _executor
+
+
+def _drop_executor(executor):
+    """Forget a broken pool (a worker was OOM-killed or crashed) so the next submit builds a new one."""
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(fn, args):
+    executor = _get_executor()
+    try:
+        return executor, executor.submit(_timed_call, fn, args)
+    except BrokenProcessPool:
+        # Broken before this job reached it: nothing ran, so rebuild and submit once more
+        _drop_executor(executor)
+        executor = _get_executor()
+        return executor, executor.submit(_timed_call, fn, args)
+
+
+def _timed_call(fn, args):
+    """Runs in the worker: returns (result, wall-clock start, compute seconds)."""
+    started = time.time()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter() - t0
+
+
+def _admit(weight, lane=None):
+    global _inflight_jobs, _inflight_bytes
+    with _lock:
+        over_jobs = _inflight_jobs + 1 > ANALYZE_MAX_JOBS
+        # A single job larger than the byte budget is still admitted when idle
+        over_bytes = _inflight_jobs > 0 and _inflight_bytes + weight > ANALYZE_MAX_BYTES
+        over_lane = lane is not None and _inflight_lanes.get(lane, 0) + 1 > LANE_LIMITS[lane]
+        if over_jobs or over_bytes or over_lane:
+            slots = max(ANALYZE_WORKERS, 1)
+            raise Overloaded(max(1, math.ceil(_avg_compute_s * _inflight_jobs / slots)))
+        _inflight_jobs += 1
+        _inflight_bytes += weight
+        if lane is not None:
+            _inflight_lanes[lane] = _inflight_lanes.get(lane, 0) + 1
+
+
+def _release(weight, compute_s, lane=None):
+    global _inflight_jobs, _inflight_bytes, _avg_compute_s
+    with _lock:
+        _inflight_jobs -= 1
+        _inflight_bytes -= weight
+        if lane is not None:
+            _inflight_lanes[lane] -= 1
+        if compute_s is not None:
+            _avg_compute_s = 0.8 * _avg_compute_s + 0.2 * compute_s
+
+
+def run_job(fn, *args, weight=0, lane=None):
+    """Run fn(*args) in the pool. Returns (result, queue_wait_s, compute_s).
+
+    Raises Overloaded without queueing if the job, byte or lane budget is
+    exhausted. fn must be a module-level function so it can be sent to a
+    worker process.
+    """
+    _admit(weight, lane)
+    compute_s = None
+    try:
+        submitted = time.time()
+        if ANALYZE_WORKERS <= 0:
+            result, started, compute_s = _timed_call(fn, args)
+        else:
+            executor, future = _submit(fn, args)
+            try:
+                result, started, compute_s = future.result()
+            except BrokenProcessPool:
+                # This job is lost, but later requests get a fresh pool instead of the same error
+                _drop_executor(executor)
+                raise
+        return result, max(0.0, started - submitted), compute_s
+    finally:
+        _release(weight, compute_s, lane)
+
@@ -0,0 +1,370 @@
+"""
+gene_detection.py — Resistance-gene detection against local CARD reference sequences.
+
+Reference nucleotide sequences are read from backend/data/card/ (any .fasta /
+.fa / .fna, optionally gzipped — e.g. CARD's
+nucleotide_fasta_protein_homolog_model.fasta). Every 16-mer of every reference
+goes into a sorted seed array (seed value, reference, offset) plus a 16 MB
+presence filter over hashed seed values, cached as .npy
+files in card/.seed_index/ and memory-mapped, so compute-pool workers share
+one copy through the page cache. The cache is rebuilt when the reference
+files change.
+
+scan() looks up every QUERY_STRIDE-th 16-mer of the genome, both strands,
+the filter discards the (vast majority of) genome k-mers no reference has
+before one searchsorted over the seed array. Seeds are grouped by reference and
+diagonal; each candidate is verified by an ungapped comparison along its
+dominant diagonals in 50 bp blocks (neighbouring diagonals absorb small
+indels), giving identity and coverage. Overlapping hits keep the best
+reference, so near-identical variants (TEM-1 / TEM-116 ...) report once.
+
+Hits come back in the infer_resistance_genes() output format plus identity,
+coverage, strand, contig and ARO accession. position_start / position_end are
+offsets into the concatenated genome (what the circular plot draws against);
+contig_start / contig_end give the same hit within its contig.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from extract_kmers import encode_sequence
+from resistance_genes import GENE_DATABASE
+
+CARD_DIR = os.path.join(os.path.dirname(__file__), "data", "card")
+INDEX_DIR_NAME = ".seed_index"
+FASTA_SUFFIXES = (".fasta", ".fa", ".fna", ".fasta.gz", ".fa.gz", ".fna.gz")
+
+SEED_K = 16
+QUERY_STRIDE = 4
+FILTER_BITS = 24
+MAX_SEED_OCCURRENCES = 500  # skip low-complexity seeds shared by hundreds of references
+MIN_SEEDS = 4
+MAX_DIAGONAL_DRIFT = 30  # indel tolerance when grouping seeds into one hit
+MAX_DIAGONALS = 4
+BLOCK = 50
+MIN_IDENTITY = 0.80
+MIN_COVERAGE = 0.60
+MAX_OVERLAP = 0.5
+DEFAULT_COLOR = "#64748b"
+
+
+def _normalize_name(name):
+    return name.lower().replace("(", "").replace(")", "")
+
+
+_KNOWN_GENES = {_normalize_name(g["gene_id"]): g for g in GENE_DATABASE}
+
+
+def parse_reference_header(header):
+    """CARD 'gb|AF091113.1|+|0-861|ARO:3000873|TEM-1 [Escherichia coli]' -> ('TEM-1', 'ARO:3000873')."""
+    header = header.split(" [")[0].strip()
+    if "|" not in header:
+        return (header.split() or ["unknown"])[0], None
+    fields = header.split("|")
+    aro = next((f for f in fields if f.startswith("ARO:")), None)
+    return fields[-1].strip(), aro
+
+
+def read_references(card_dir):
+    """Yield (header, sequence) for every record in the reference FASTAs, in file order."""
+    for filename in sorted(os.listdir(card_dir)):
+        if not filename.endswith(FASTA_SUFFIXES):
+            continue
+        path = os.path.join(card_dir, filename)
+        opener = gzip.open if filename.endswith(".gz") else open
+        header, sequence = None, []
+        with opener(path, "rt") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith(">"):
+                    if header is not None:
+                        yield header, "".join(sequence)
+                    header, sequence = line[1:], []
+                elif line:
+                    sequence.append(line)
+        if header is not None:
+            yield header, "".join(sequence)
+
+
+def _fingerprint(card_dir):
+    digest = hashlib.sha256(f"k={SEED_K},filter={FILTER_BITS}".encode())
+    for filename in sorted(os.listdir(card_dir)):
+        if filename.endswith(FASTA_SUFFIXES):
+            st = os.stat(os.path.join(card_dir, filename))
+            digest.update(f"{filename}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def kmer_values(codes, positions, k=SEED_K):
+    """Forward and reverse-complement 2-bit values of the k-mers starting at positions.
+
+    Returns (forward, reverse, valid); windows touching a non-ACGT base are invalid.
+    """
+    invalid = np.concatenate(([0], np.cumsum(codes > 3, dtype=np.int64)))
+    valid = (invalid[positions + k] - invalid[positions]) == 0
+    bits = (codes & 3).astype(np.uint32)
+    forward = np.zeros(len(positions), dtype=np.uint32)
+    reverse = np.zeros(len(positions), dtype=np.uint32)
+    for j in range(k):
+        b = bits[positions + j]
+        forward = (forward << np.uint32(2)) | b
+        reverse |= (np.uint32(3) - b) << np.uint32(2 * j)
+    return forward, reverse, valid
+
+
+def filter_slot(values, bits=FILTER_BITS):
+    """Multiplicative hash of 16-mer values into a 2**bits presence filter."""
+    return (values * np.uint32(2654435761)) >> np.uint32(32 - bits)
+
+
+def build_seed_index(card_dir, index_dir):
+    """Index every reference k-mer; writes .npy arrays + meta.json into index_dir."""
+    names, aros, lengths, parts = [], [], [], []
+    for header, sequence in read_references(card_dir):
+        codes = encode_sequence(sequence)
+        if len(codes) < SEED_K:
+            continue
+        name, aro = parse_reference_header(header)
+        names.append(name)
+        aros.append(aro)
+        lengths.append(len(codes))
+        parts.append(codes)
+    if not parts:
+        return None
+
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    ref_codes = np.concatenate(parts)
+    seeds, refs, pos = [], [], []
+    for i, codes in enumerate(parts):
+        positions = np.arange(len(codes) - SEED_K + 1)
+        forward, _, valid = kmer_values(codes, positions)
+        seeds.append(forward[valid])
+        refs.append(np.full(int(valid.sum()), i, dtype=np.uint32))
+        pos.append(positions[valid].astype(np.uint32))
+    seeds = np.concatenate(seeds)
+    order = np.argsort(seeds, kind="stable")
+
+    os.makedirs(index_dir, exist_ok=True)
+    arrays = {
+        "seeds": seeds[order],
+        "seed_refs": np.concatenate(refs)[order],
+        "seed_pos": np.concatenate(pos)[order],
+        "seed_filter": np.zeros(1 << FILTER_BITS, dtype=bool),
+        "ref_codes": ref_codes,
+        "offsets": offsets.astype(np.int64),
+    }
+    arrays["seed_filter"][filter_slot(arrays["seeds"])] = True
+    # Workers may have the previous index mmapped: write aside and swap each
+    # file in, so a live mapping keeps the old inode instead of seeing a rewrite
+    for name, arr in arrays.items():
+        tmp_path = os.path.join(index_dir, f"{name}.tmp.npy")
+        np.save(tmp_path, arr)
+        os.replace(tmp_path, os.path.join(index_dir, f"{name}.npy"))
+    meta = {"fingerprint": _fingerprint(card_dir), "names": names, "aros": aros}
+    with open(os.path.join(index_dir, "meta.json.tmp"), "w") as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(index_dir, "meta.json.tmp"), os.path.join(index_dir, "meta.json"))
+    return meta
+
+
+class GeneDetector:
+    """Memory-mapped seed index over the CARD references plus the scanner."""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.fingerprint = meta["fingerprint"]
+        self.names = meta["names"]
+        self.aros = meta["aros"]
+        for name in ("seeds", "seed_refs", "seed_pos", "seed_filter", "ref_codes", "offsets"):
+            setattr(self, name, np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r"))
+        self.lengths = np.diff(self.offsets)
+
+    @classmethod
+    def load(cls, card_dir=CARD_DIR):
+        """Open the cached index (rebuilding it if the references changed); None if no references."""
+        if not os.path.isdir(card_dir) or not any(
+            f.endswith(FASTA_SUFFIXES) for f in os.listdir(card_dir)
+        ):
+            return None
+        index_dir = os.path.join(card_dir, INDEX_DIR_NAME)
+        meta_path = os.path.join(index_dir, "meta.json")
+        fresh = False
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                fresh = json.load(f).get("fingerprint") == _fingerprint(card_dir)
+        if not fresh and build_seed_index(card_dir, index_dir) is None:
+            return None
+        return cls(index_dir)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _lookup(self, values, qpos):
+        present = self.seed_filter[filter_slot(values)]
+        values, qpos = values[present], qpos[present]
+        lo = np.searchsorted(self.seeds, values, side="left")
+        hi = np.searchsorted(self.seeds, values, side="right")
+        counts = hi - lo
+        keep = (counts > 0) & (counts <= MAX_SEED_OCCURRENCES)
+        lo, counts, qpos = lo[keep], counts[keep], qpos[keep]
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        idx = np.repeat(lo, counts) + within
+        return np.repeat(qpos, counts), self.seed_refs[idx].astype(np.int64), self.seed_pos[idx].astype(np.int64)
+
+    def _verify(self, genome, ref, strand, diagonals):
+        """Block-wise ungapped comparison along the given diagonals -> (identity, coverage, start, end)."""
+        start, length = int(self.offsets[ref]), int(self.lengths[ref])
+        ref_codes = np.asarray(self.ref_codes[start : start + length])
+        n_blocks = -(-length // BLOCK)
+        pad = n_blocks * BLOCK - length
+        x = np.arange(length)
+        best_match = np.full(n_blocks, -1, dtype=np.int64)
+        best_aligned = np.zeros(n_blocks, dtype=np.int64)
+        best_diag = np.zeros(n_blocks, dtype=np.int64)
+        for d in diagonals:
+            gpos = d + x if strand == "+" else d - x
+            inside = (gpos >= 0) & (gpos < len(genome))
+            g = genome[np.clip(gpos, 0, len(genome) - 1)]
+            if strand == "-":
+                g = np.where(g < 4, 3 - g, 4)
+            aligned = inside & (g < 4)
+            match = aligned & (g == ref_codes)
+            m = np.concatenate([match, np.zeros(pad, bool)]).reshape(n_blocks, BLOCK).sum(axis=1)
+            a = np.concatenate([aligned, np.zeros(pad, bool)]).reshape(n_blocks, BLOCK).sum(axis=1)
+            better = m > best_match
+            best_match = np.where(better, m, best_match)
+            best_aligned = np.where(better, a, best_aligned)
+            best_diag = np.where(better, d, best_diag)
+
+        # A block counts as aligned if it is mostly inside the genome and not random
+        ok = (best_aligned > 0) & (best_match >= 0.6 * best_aligned)
+        if not ok.any():
+            return 0.0, 0.0, 0, 0
+        coverage = best_aligned[ok].sum() / length
+        identity = best_match[ok].sum() / best_aligned[ok].sum()
+        blocks = np.flatnonzero(ok)
+        first_x, last_x = blocks[0] * BLOCK, min(blocks[-1] * BLOCK + BLOCK, length) - 1
+        if strand == "+":
+            ends = (best_diag[blocks[0]] + first_x, best_diag[blocks[-1]] + last_x)
+        else:
+            ends = (best_diag[blocks[-1]] - last_x, best_diag[blocks[0]] - first_x)
+        return float(identity), float(coverage), int(ends[0]), int(ends[1]) + 1
+
+    def scan(self, contigs):
+        """Find reference genes in contigs [(name, codes)]; returns hits in gene output format."""
+        # One N between contigs so no seed spans a contig boundary
+        starts, parts, position = [], [], 0
+        for _, codes in contigs:
+            starts.append(position)
+            parts.append(codes)
+            parts.append(np.array([4], dtype=np.uint8))
+            position += len(codes) + 1
+        if not parts:
+            return []
+        genome = np.concatenate(parts)
+        n = len(genome) - SEED_K + 1
+        if n <= 0:
+            return []
+
+        positions = np.arange(0, n, QUERY_STRIDE)
+        forward, reverse, valid = kmer_values(genome, positions)
+        positions = positions[valid]
+        candidates = []
+        for strand, values in (("+", forward[valid]), ("-", reverse[valid])):
+            q, refs, rpos = self._lookup(values, positions)
+            # Plus strand: genome = ref + diag. Minus: genome = diag - ref (reverse complement).
+            diag = q - rpos if strand == "+" else q + rpos + SEED_K - 1
+            seed_counts = np.bincount(refs, minlength=len(self.names))
+            for ref in np.flatnonzero(seed_counts >= MIN_SEEDS):
+                ref_diags = diag[refs == ref]
+                # Several copies of a gene sit on distant diagonals; peel them off one by one
+                while len(ref_diags) >= MIN_SEEDS:
+                    diag_values, diag_counts = np.unique(ref_diags, return_counts=True)
+                    mode = diag_values[np.argmax(diag_counts)]
+                    near = np.abs(ref_diags - mode) <= MAX_DIAGONAL_DRIFT
+                    if near.sum() < MIN_SEEDS:
+                        break
+                    cluster_values, cluster_counts = np.unique(ref_diags[near], return_counts=True)
+                    top = cluster_values[np.argsort(-cluster_counts)[:MAX_DIAGONALS]]
+                    candidates.append((int(ref), strand, top))
+                    ref_diags = ref_diags[~near]
+
+        hits = []
+        for ref, strand, diagonals in candidates:
+            identity, coverage, g_start, g_end = self._verify(genome, ref, strand, diagonals)
+            if identity >= MIN_IDENTITY and coverage >= MIN_COVERAGE:
+                hits.append((identity * coverage, identity, coverage, ref, strand, g_start, g_end))
+
+        # Best hit per locus: drop hits mostly covered by a better one
+        hits.sort(key=lambda h: h[0], reverse=True)
+        kept = []
+        for hit in hits:
+            _, _, _, _, _, s, e = hit
+            if all(
+                min(e, ke) - max(s, ks) <= MAX_OVERLAP * min(e - s, ke - ks)
+                for *_, ks, ke in kept
+            ):
+                kept.append(hit)
+
+        starts = np.asarray(starts)
+        results = []
+        for _, identity, coverage, ref, strand, g_start, g_end in sorted(kept, key=lambda h: h[5]):
+            contig = int(np.searchsorted(starts, g_start, side="right") - 1)
+            # Genome-wide positions leave out the N separators, matching the
+            # concatenated genome length the circular plot is drawn against
+            local_start = int(g_start - starts[contig])
+            genome_start = int(starts[contig]) - contig
+            results.append(self._gene_record(
+                ref, identity, coverage, strand,
+                genome_start + local_start, genome_start + local_start + (g_end - g_start),
+                contigs[contig][0], local_start,
+            ))
+        return results
+
+    def _gene_record(self, ref, identity, coverage, strand, start, end, contig_name, contig_start):
+        name = self.names[ref]
+        known = _KNOWN_GENES.get(_normalize_name(name))
+        location = "plasmid" if "plasmid" in contig_name.lower() else "chromosome"
+        record = {
+            "gene_id": known["gene_id"] if known else name,
+            "position_start": int(start),
+            "position_end": int(end),
+            "location": location,
+        }
+        if location == "plasmid":
+            record["plasmid_name"] = contig_name.split()[0][:40] if contig_name else "plasmid"
+        record.update({
+            "color": known["color"] if known else DEFAULT_COLOR,
+            "mechanism": known["mechanism"] if known else "CARD reference match",
+            "drugs_defeated": known["antibiotics"] if known else [],
+            "spreadable": known["spreadable"] if known else location == "plasmid",
+            "description": known["description"] if known else
+                f"{name}{' (' + self.aros[ref] + ')' if self.aros[ref] else ''} matched a CARD reference sequence.",
+            "identity": round(identity, 4),
+            "coverage": round(min(coverage, 1.0), 4),
+            "strand": strand,
+            "contig": contig_name,
+            "contig_start": int(contig_start),
+            "contig_end": int(contig_start + end - start),
+            "aro": self.aros[ref],
+            "detection": "sequence",
+        })
+        return record
+
+
+_DETECTOR = None
+_DETECTOR_LOADED = False
+
+
+def get_detector():
+    """Per-process GeneDetector (None when backend/data/card/ has no references)."""
+    global _DETECTOR, _DETECTOR_LOADED
+    if not _DETECTOR_LOADED:
+        _DETECTOR = GeneDetector.load()
+        _DETECTOR_LOADED = True
+    return _DETECTOR
@@ -0,0 +1,187 @@
+"""
+genome_pyramid.py — Multi-resolution GC / GC-skew / N tracks for genome plot zooming.
+
+analyze_fasta returns a fixed 120-window GC track; zooming needs finer windows
+without re-uploading the genome. build_pyramid() counts C, G, ACGT and N bases
+once per BASE_WINDOW bp bin of the concatenated contigs (level 0), then sums
+neighbouring windows pairwise for each coarser level, so level L has windows
+of BASE_WINDOW * 2**L bp and the whole pyramid is about twice the size of
+level 0 (~600 KB for 5 Mbp).
+
+Pyramids are stored as <genome hash>.npz under PYRAMID_DIR, keyed by a hash
+of the encoded sequence (not the FASTA text, so line wrapping and header
+names don't matter), and written once per genome. A region read is a slice
+of one level's count arrays, so a tile costs O(windows returned) whatever the
+genome length.
+
+The store is an LRU cache capped at PYRAMID_MAX_BYTES: reading or re-uploading
+a genome refreshes its file's mtime, and each new pyramid evicts the least
+recently used files until the directory fits. An evicted genome's tiles 404
+until it is analyzed again.
+"""
+
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+PYRAMID_DIR = os.environ.get(
+    "GENOME_PYRAMID_DIR", os.path.join(os.path.dirname(__file__), "data", "pyramids")
+)
+# Total size of PYRAMID_DIR; least recently used pyramids are deleted past it (~3000 x 5 Mbp genomes)
+PYRAMID_MAX_BYTES = int(os.environ.get("GENOME_PYRAMID_MAX_BYTES", 2_000_000_000))
+BASE_WINDOW = 256
+MAX_WINDOWS = 4096  # per tile request
+GENOME_HASH_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# columns of each level's count matrix
+C, G, ACGT, N = range(4)
+
+
+def genome_hash(contigs):
+    """Content hash of encoded contigs [(name, codes)]; contig order and boundaries count."""
+    digest = hashlib.sha256()
+    for _, codes in contigs:
+        digest.update(len(codes).to_bytes(8, "little"))
+        digest.update(np.ascontiguousarray(codes).data)
+    return digest.hexdigest()[:32]
+
+
+def pyramid_path(ghash, pyramid_dir=PYRAMID_DIR):
+    return os.path.join(pyramid_dir, f"{ghash}.npz")
+
+
+def build_pyramid(contigs):
+    """Per-level (windows x 4) uint32 count matrices [C, G, ACGT, N] of the concatenated contigs."""
+    codes = np.concatenate([c for _, c in contigs]) if contigs else np.empty(0, np.uint8)
+    n_bins = max(1, -(-len(codes) // BASE_WINDOW))
+    padded = np.full(n_bins * BASE_WINDOW, 5, dtype=np.uint8)  # 5: past the end, not counted
+    padded[: len(codes)] = codes
+    bins = padded.reshape(n_bins, BASE_WINDOW)
+    level = np.empty((n_bins, 4), dtype=np.uint32)
+    level[:, C] = (bins == 1).sum(axis=1)
+    level[:, G] = (bins == 2).sum(axis=1)
+    level[:, ACGT] = (bins < 4).sum(axis=1)
+    level[:, N] = (bins == 4).sum(axis=1)
+
+    levels = [level]
+    while len(level) > 1:
+        if len(level) % 2:
+            level = np.vstack([level, np.zeros((1, 4), dtype=np.uint32)])
+        level = level[0::2] + level[1::2]
+        levels.append(level)
+    return levels
+
+
+def _touch(path):
+    """Mark a pyramid as recently used (mtime, since atime is often not updated)."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict(pyramid_dir=PYRAMID_DIR, max_bytes=PYRAMID_MAX_BYTES, keep=None):
+    """Delete least recently used pyramids until pyramid_dir holds at most max_bytes."""
+    entries = []
+    with os.scandir(pyramid_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".npz") and not entry.name.endswith(".tmp.npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another worker
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def save_pyramid(ghash, contigs, pyramid_dir=PYRAMID_DIR, max_bytes=PYRAMID_MAX_BYTES):
+    """Build and store the pyramid for a genome unless it is already stored, then enforce the size cap."""
+    path = pyramid_path(ghash, pyramid_dir)
+    if os.path.exists(path):
+        _touch(path)
+        return path
+    levels = build_pyramid(contigs)
+    lengths = [len(c) for _, c in contigs]
+    os.makedirs(pyramid_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        length=np.int64(sum(lengths)),
+        contig_offsets=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        contig_names=np.asarray([name for name, _ in contigs], dtype=str),
+        **{f"level_{i}": level for i, level in enumerate(levels)},
+    )
+    os.replace(tmp_path, path)
+    evict(pyramid_dir, max_bytes, keep=path)
+    return path
+
+
+class GenomePyramid:
+    """A stored pyramid: level count matrices plus genome length and contig layout."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.length = int(data["length"])
+            self.contig_offsets = data["contig_offsets"]
+            self.contig_names = data["contig_names"].tolist()
+            n_levels = sum(1 for name in data.files if name.startswith("level_"))
+            self.levels = [data[f"level_{i}"] for i in range(n_levels)]
+
+    def window_size(self, level):
+        return BASE_WINDOW << level
+
+    def level_for(self, start, end, windows):
+        """Finest level that covers [start, end) in at most `windows` windows."""
+        for level in range(len(self.levels)):
+            if -(-(end - start) // self.window_size(level)) <= windows:
+                return level
+        return len(self.levels) - 1
+
+    def windows(self, start, end, level):
+        """GC, GC skew and N fraction of the level's windows overlapping [start, end)."""
+        size = self.window_size(level)
+        first, last = start // size, min(-(-end // size), len(self.levels[level]))
+        counts = self.levels[level][first:last].astype(np.int64)
+        gc = counts[:, C] + counts[:, G]
+        acgt = counts[:, ACGT]
+        total = acgt + counts[:, N]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            gc_frac = np.where(acgt > 0, gc / acgt, 0.5)
+            skew = np.where(gc > 0, (counts[:, G] - counts[:, C]) / gc, 0.0)
+            n_frac = np.where(total > 0, counts[:, N] / total, 0.0)
+        starts = np.arange(first, last) * size
+        ends = np.minimum(starts + size, self.length)
+        return [
+            {"start": int(s), "end": int(e), "gc": round(float(g), 4),
+             "skew": round(float(k), 4), "n_fraction": round(float(n), 4)}
+            for s, e, g, k, n in zip(starts, ends, gc_frac, skew, n_frac)
+        ]
+
+
+@lru_cache(maxsize=32)
+def _open(path):
+    return GenomePyramid(path)
+
+
+def load_pyramid(ghash, pyramid_dir=PYRAMID_DIR):
+    """Stored pyramid for a genome hash (content-addressed, so safe to cache); None if absent."""
+    if not GENOME_HASH_RE.match(ghash):
+        return None
+    path = pyramid_path(ghash, pyramid_dir)
+    if not os.path.exists(path):
+        return None
+    _touch(path)
+    return _open(path)
@@ -0,0 +1,64 @@
+"""
+joint_model.py — One multi-output booster serving every antibiotic.
+
+train_joint.py writes joint.ubj (an XGBoost multi_output_tree booster with
+one output per antibiotic, trained with missing labels masked) and
+joint_model.json (output order, tree count). JointModel evaluates the
+booster once per feature matrix; JointHead exposes one antibiotic's column
+through predict_proba(), so app.py serves a joint model set through the
+same models[antibiotic].predict_proba(X) loop as the per-antibiotic models.
+"""
+
+import json
+import os
+
+import numpy as np
+import xgboost as xgb
+
+JOINT_MODEL_NAME = "joint.ubj"
+JOINT_META_NAME = "joint_model.json"
+
+
+class JointModel:
+    """Multi-output booster; caches the last prediction so the heads share it."""
+
+    def __init__(self, booster, antibiotics):
+        self.booster = booster
+        self.antibiotics = list(antibiotics)
+        self.n_features_in_ = booster.num_features()
+        self._last = (None, None)  # (input bytes, probabilities), swapped as one tuple
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, JOINT_META_NAME)) as f:
+            meta = json.load(f)
+        booster = xgb.Booster(model_file=os.path.join(path, JOINT_MODEL_NAME))
+        return cls(booster, meta["antibiotics"])
+
+    def predict_all(self, X):
+        """Resistant probability for every output: (rows x antibiotics)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        key = X.tobytes()
+        last_key, last_prob = self._last
+        if last_key == key:
+            return last_prob
+        margin = self.booster.inplace_predict(X, predict_type="margin")
+        prob = 1.0 / (1.0 + np.exp(-np.asarray(margin, dtype=np.float64).reshape(X.shape[0], -1)))
+        self._last = (key, prob)
+        return prob
+
+    def heads(self):
+        return {ab: JointHead(self, i) for i, ab in enumerate(self.antibiotics)}
+
+
+class JointHead:
+    """One antibiotic's view of a JointModel, shaped like XGBClassifier.predict_proba."""
+
+    def __init__(self, joint, index):
+        self.joint = joint
+        self.index = index
+        self.n_features_in_ = joint.n_features_in_
+
+    def predict_proba(self, X):
+        p = self.joint.predict_all(X)[:, self.index]
+        return np.column_stack([1.0 - p, p])
@@ -0,0 +1,377 @@
+"""
+load_test.py — Drive the API under concurrent load and report latency SLOs.
+
+Replays a weighted mix of requests against a backend:
+
+  genomes   GET  /api/genomes
+  analyze   POST /api/analyze        (random demo genome)
+  fasta     POST /api/analyze_fasta  (synthetic genome, size drawn from --fasta-mbp)
+
+at a fixed concurrency (--concurrency 8 --duration 30) or a ramp
+(--ramp 1,2,4,8,16 --stage-seconds 20, one stage per level). By default it
+starts `python app.py` on a free port with any --env KEY=VALUE settings
+(ANALYZE_WORKERS, ANALYZE_MAX_JOBS, ...), waits for it to load the models,
+and samples the peak RSS (VmHWM in /proc) of the server and each of its
+worker processes while the test runs. --url targets an already running server
+instead (pass --pid to still get RSS).
+
+For each stage it reports throughput, p50/p95/p99 latency per endpoint, 429
+rejections and the error rate, and writes everything to a JSON report.
+--compare prints two or more reports side by side, e.g. to compare
+ANALYZE_WORKERS=2 against 4.
+
+Usage:
+  python load_test.py --concurrency 4 --duration 30 --output report.json
+  python load_test.py --ramp 1,2,4,8 --stage-seconds 15 --env ANALYZE_WORKERS=2
+  python load_test.py --mix genomes=1,analyze=4 --url http://localhost:5000
+  python load_test.py --compare workers2.json workers4.json
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEMO_INDEX = os.path.join(BASE_DIR, "data", "demo_genomes", "index.json")
+ENDPOINTS = {
+    "genomes": ("GET", "/api/genomes"),
+    "analyze": ("POST", "/api/analyze"),
+    "fasta": ("POST", "/api/analyze_fasta"),
+}
+FASTA_VARIANTS = 3  # distinct synthetic genomes per size
+REQUEST_TIMEOUT = 300
+
+
+def synthetic_fasta(n_bases, seed):
+    rng = random.Random(seed)
+    seq = "".join(rng.choices("ACGT", k=n_bases))
+    lines = [seq[i : i + 70] for i in range(0, len(seq), 70)]
+    return f">load_test|synthetic.{seed} synthetic genome\n" + "\n".join(lines) + "\n"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint in --mix: {name} (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class Workload:
+    """Pre-built request bodies, so generating load costs nothing during the test."""
+
+    def __init__(self, mix, fasta_mbp):
+        self.mix = mix
+        self.genome_ids = []
+        if os.path.exists(DEMO_INDEX):
+            with open(DEMO_INDEX) as f:
+                self.genome_ids = [g["genome_id"] for g in json.load(f)]
+        if "analyze" in mix and not self.genome_ids:
+            raise SystemExit(f"No demo genomes in {DEMO_INDEX}; drop 'analyze' from --mix")
+        self.fasta_bodies = []
+        if "fasta" in mix:
+            print(f"Generating synthetic genomes: {', '.join(f'{m:g}' for m in fasta_mbp)} Mbp...")
+            for mbp in fasta_mbp:
+                for v in range(FASTA_VARIANTS):
+                    fasta = synthetic_fasta(int(mbp * 1_000_000), seed=int(mbp * 1000) * FASTA_VARIANTS + v)
+                    self.fasta_bodies.append((mbp, json.dumps({"fasta": fasta}).encode()))
+
+    def next(self, rng):
+        """(endpoint name, method, path, body bytes or None, size label)."""
+        names = list(self.mix)
+        name = rng.choices(names, weights=[self.mix[n] for n in names])[0]
+        method, path = ENDPOINTS[name]
+        if name == "analyze":
+            body = json.dumps({"genome_id": rng.choice(self.genome_ids)}).encode()
+            return name, method, path, body, None
+        if name == "fasta":
+            mbp, body = rng.choice(self.fasta_bodies)
+            return name, method, path, body, mbp
+        return name, method, path, None, None
+
+
+def send(base_url, method, path, body):
+    """One request -> (status or None, latency seconds, error text or None)."""
+    req = urllib.request.Request(base_url + path, data=body, method=method)
+    if body is not None:
+        req.add_header("Content-Type", "application/json")
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+            resp.read()
+            return resp.status, time.perf_counter() - t0, None
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, time.perf_counter() - t0, None
+    except (urllib.error.URLError, OSError) as e:
+        return None, time.perf_counter() - t0, str(e)
+
+
+def run_stage(base_url, workload, concurrency, duration, seed=0):
+    """Closed-loop load: `concurrency` threads each send back-to-back requests for `duration`."""
+    samples = []  # (endpoint, size, status, latency, error)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        while time.perf_counter() < deadline:
+            name, method, path, body, size = workload.next(rng)
+            status, latency, error = send(base_url, method, path, body)
+            with lock:
+                samples.append((name, size, status, latency, error))
+
+    t0 = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(seed * 1000 + i,), daemon=True)
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - t0
+
+
+def summarize(samples, elapsed):
+    """Throughput, latency percentiles and error rates, overall and per endpoint."""
+
+    def stats(rows):
+        ok = sorted(r[3] * 1000 for r in rows if r[2] is not None and 200 <= r[2] < 300)
+        statuses = Counter(str(r[2]) if r[2] is not None else "error" for r in rows)
+        errors = sum(n for s, n in statuses.items() if s != "429" and not s.startswith("2"))
+        return {
+            "requests": len(rows),
+            "ok": len(ok),
+            "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(ok, 50), 1) if ok else None,
+            "p95_ms": round(percentile(ok, 95), 1) if ok else None,
+            "p99_ms": round(percentile(ok, 99), 1) if ok else None,
+            "max_ms": round(ok[-1], 1) if ok else None,
+            "rejected_429": statuses.get("429", 0),
+            "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+            "statuses": dict(statuses),
+        }
+
+    by_endpoint = defaultdict(list)
+    for row in samples:
+        label = row[0] if row[1] is None else f"{row[0]} {row[1]:g}Mbp"
+        by_endpoint[label].append(row)
+    errors = Counter(r[4] for r in samples if r[4])
+    return {
+        "elapsed_s": round(elapsed, 2),
+        **stats(samples),
+        "endpoints": {label: stats(rows) for label, rows in sorted(by_endpoint.items())},
+        "error_messages": dict(errors.most_common(5)),
+    }
+
+
+def _proc_children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                if int(fields[1]) == pid:
+                    children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return children
+
+
+def _proc_status(pid, key):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssMonitor:
+    """Polls peak RSS (VmHWM) of a server process and its children from /proc."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peaks = {}  # pid -> (role, bytes)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        for pid, role in [(self.pid, "server")] + [(c, "worker") for c in _proc_children(self.pid)]:
+            peak = _proc_status(pid, "VmHWM")
+            if peak is not None:
+                self.peaks[pid] = (role, max(peak, self.peaks.get(pid, (role, 0))[1]))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return {
+            str(pid): {"role": role, "peak_rss_mb": round(peak / 1e6, 1)}
+            for pid, (role, peak) in sorted(self.peaks.items())
+        }
+
+
+def start_server(env_overrides, startup_timeout):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = {**os.environ, "PORT": str(port), **env_overrides}
+    proc = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Server exited during startup (code {proc.returncode})")
+        status, _, _ = send(base_url, "GET", "/api/models", None)
+        if status == 200:
+            return proc, base_url
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit(f"Server did not come up within {startup_timeout}s")
+
+
+def print_stage(stage):
+    print(f"\n  concurrency {stage['concurrency']}: {stage['requests']} requests, "
+          f"{stage['throughput_rps']} req/s, p50 {stage['p50_ms']} ms, p95 {stage['p95_ms']} ms, "
+          f"p99 {stage['p99_ms']} ms, 429s {stage['rejected_429']}, error rate {stage['error_rate']:.2%}")
+    for label, s in stage["endpoints"].items():
+        print(f"    {label:22s} {s['requests']:6d} req  {s['throughput_rps']:7.2f}/s  "
+              f"p50 {s['p50_ms']}  p95 {s['p95_ms']}  p99 {s['p99_ms']}  429 {s['rejected_429']}  "
+              f"err {s['error_rate']:.2%}")
+
+
+def compare(paths):
+    reports = []
+    for path in paths:
+        with open(path) as f:
+            reports.append((os.path.basename(path), json.load(f)))
+    print(f"{'report':28s} {'conc':>5s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} "
+          f"{'p99 ms':>9s} {'429':>5s} {'err':>7s} {'peak RSS MB':>12s}")
+    for name, report in reports:
+        rss = sum(p["peak_rss_mb"] for p in report.get("rss", {}).values()) or None
+        for stage in report["stages"]:
+            print(f"{name[:28]:28s} {stage['concurrency']:5d} {stage['throughput_rps']:8.2f} "
+                  f"{stage['p50_ms'] or 0:9.1f} {stage['p95_ms'] or 0:9.1f} {stage['p99_ms'] or 0:9.1f} "
+                  f"{stage['rejected_429']:5d} {stage['error_rate']:7.2%} {rss or 0:12.1f}")
+        env = report["config"].get("server_env")
+        if env:
+            print(f"{'':28s} env: {' '.join(f'{k}={v}' for k, v in env.items())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--pid", type=int, help="server pid for RSS sampling with --url")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="environment for the started server (repeatable)")
+    parser.add_argument("--mix", default="genomes=1,analyze=3,fasta=1",
+                        help="endpoint weights, e.g. genomes=1,analyze=3,fasta=1")
+    parser.add_argument("--fasta-mbp", default="0.5,2,5", help="synthetic upload sizes in Mbp")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30, help="seconds at fixed concurrency")
+    parser.add_argument("--ramp", help="comma-separated concurrency levels, one stage each")
+    parser.add_argument("--stage-seconds", type=float, default=20)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test_report.json")
+    parser.add_argument("--compare", nargs="+", metavar="REPORT", help="print reports side by side")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    mix = parse_mix(args.mix)
+    levels = [int(c) for c in args.ramp.split(",")] if args.ramp else [args.concurrency]
+    stage_seconds = args.stage_seconds if args.ramp else args.duration
+    server_env = dict(item.split("=", 1) for item in args.env)
+    workload = Workload(mix, [float(m) for m in args.fasta_mbp.split(",")])
+
+    proc = None
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.pid
+    else:
+        print("Starting backend...")
+        t0 = time.time()
+        proc, base_url = start_server(server_env, args.startup_timeout)
+        pid = proc.pid
+        print(f"  {base_url} ready in {time.time() - t0:.1f}s")
+
+    monitor = RssMonitor(pid) if pid else None
+    stages = []
+    try:
+        if monitor:
+            monitor.start()
+        for concurrency in levels:
+            print(f"\nStage: {concurrency} concurrent clients for {stage_seconds:g}s...")
+            samples, elapsed = run_stage(base_url, workload, concurrency, stage_seconds, args.seed)
+            stage = {"concurrency": concurrency, **summarize(samples, elapsed)}
+            stages.append(stage)
+            print_stage(stage)
+    finally:
+        rss = monitor.stop() if monitor else {}
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    if rss:
+        print("\nPeak RSS:")
+        for p, info in rss.items():
+            print(f"  {info['role']:7s} pid {p:>7s}  {info['peak_rss_mb']:8.1f} MB")
+
+    report = {
+        "config": {
+            "url": args.url,
+            "mix": mix,
+            "fasta_mbp": [float(m) for m in args.fasta_mbp.split(",")],
+            "levels": levels,
+            "stage_seconds": stage_seconds,
+            "server_env": server_env,
+            "cpu_count": os.cpu_count(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "stages": stages,
+        "rss": rss,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
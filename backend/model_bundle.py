@@ -0,0 +1,213 @@
+"""
+model_bundle.py — Single-file, memory-mapped bundle of every model in a model set.
+
+Layout (little-endian):
+
+  8 bytes   magic b"BACTBND1"
+  8 bytes   header length (uint64)
+  N bytes   JSON header: version hash, antibiotics, metrics, SHAP summaries,
+            feature names and the dtype/shape/offset of every array
+  ...       64-byte aligned arrays: the flattened trees of all boosters
+
+The trees are stored as plain node arrays (children, split feature, split
+threshold / leaf value, default direction), so loading is one mmap plus a JSON
+parse — no unpickling — and the arrays live in the page cache, shared by every
+worker process that maps the same file. BundleModel evaluates them with numpy
+and exposes predict_proba() like the XGBClassifier it replaces.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+BUNDLE_NAME = "models.bundle"
+MAGIC = b"BACTBND1"
+ALIGN = 64
+
+
+def _file_sha256(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def flatten_booster(booster):
+    """Flatten an XGBoost binary:logistic booster into node arrays + metadata."""
+    model = json.loads(booster.save_raw("json"))
+    learner = model["learner"]
+    objective = learner["objective"]["name"]
+    if objective != "binary:logistic":
+        raise ValueError(f"unsupported objective {objective}")
+    base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+    trees = learner["gradient_booster"]["model"]["trees"]
+
+    left, right, feature, value, default_left, roots = [], [], [], [], [], []
+    max_depth = 0
+    offset = 0
+    for tree in trees:
+        lc = np.asarray(tree["left_children"], dtype=np.int32)
+        rc = np.asarray(tree["right_children"], dtype=np.int32)
+        is_leaf = lc == -1
+        left.append(np.where(is_leaf, -1, lc + offset))
+        right.append(np.where(is_leaf, -1, rc + offset))
+        feature.append(np.asarray(tree["split_indices"], dtype=np.int32))
+        value.append(np.asarray(tree["split_conditions"], dtype=np.float32))
+        default_left.append(np.asarray(tree["default_left"], dtype=np.uint8))
+        roots.append(offset)
+        # Depth of each node via parents (parents precede children in XGBoost trees)
+        depth = np.zeros(len(lc), dtype=np.int32)
+        for node in range(1, len(lc)):
+            depth[node] = depth[tree["parents"][node]] + 1
+        max_depth = max(max_depth, int(depth.max()))
+        offset += len(lc)
+
+    arrays = {
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "feature": np.concatenate(feature),
+        "value": np.concatenate(value),
+        "default_left": np.concatenate(default_left),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }
+    meta = {
+        "n_trees": len(trees),
+        "max_depth": max_depth,
+        "base_margin": float(np.log(base_score / (1 - base_score))),
+        "num_feature": int(learner["learner_model_param"]["num_feature"]),
+    }
+    return arrays, meta
+
+
+def write_bundle(path, models, shap_data, metrics, feature_names, metrics_path=None):
+    """Pack models ({antibiotic: XGBClassifier}) and metadata into one bundle file."""
+    antibiotics = {}
+    parts = {}
+    node_base = 0
+    tree_base = 0
+    for ab, model in models.items():
+        arrays, meta = flatten_booster(model.get_booster())
+        for name in ("left", "right"):
+            arrays[name] = np.where(arrays[name] == -1, -1, arrays[name] + node_base).astype(np.int32)
+        arrays["roots"] = arrays["roots"] + node_base
+        for name, arr in arrays.items():
+            parts.setdefault(name, []).append(arr)
+        meta["tree_start"] = tree_base
+        antibiotics[ab] = meta
+        node_base += len(arrays["left"])
+        tree_base += meta["n_trees"]
+
+    arrays = {name: np.ascontiguousarray(np.concatenate(chunks)) for name, chunks in parts.items()}
+
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        digest.update(name.encode())
+        digest.update(arrays[name].tobytes())
+    digest.update(json.dumps([antibiotics, shap_data, metrics], sort_keys=True).encode())
+
+    # Lay out arrays at aligned offsets after a header whose size we iterate to fix
+    layout = {}
+    header = {}
+    header_len = 0
+    for _ in range(3):
+        offset = len(MAGIC) + 8 + header_len
+        offset += -offset % ALIGN
+        for name, arr in arrays.items():
+            layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+            offset += arr.nbytes
+            offset += -offset % ALIGN
+        header = {
+            "format": 1,
+            "version_hash": digest.hexdigest()[:16],
+            "created_at": time.time(),
+            "antibiotics": antibiotics,
+            "arrays": layout,
+            "feature_names": list(feature_names),
+            "metrics": metrics,
+            "shap": shap_data,
+            "metrics_sha256": _file_sha256(metrics_path) if metrics_path else None,
+        }
+        encoded = json.dumps(header).encode("utf-8")
+        if len(encoded) == header_len:
+            break
+        header_len = len(encoded)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(encoded)).tobytes())
+        f.write(encoded)
+        for name, arr in arrays.items():
+            f.write(b"\0" * (layout[name]["offset"] - f.tell()))
+            f.write(arr.tobytes())
+    os.replace(tmp_path, path)
+    return header
+
+
+class BundleModel:
+    """Tree-ensemble evaluator over memory-mapped node arrays (one antibiotic)."""
+
+    def __init__(self, arrays, meta):
+        start = meta["tree_start"]
+        self.roots = np.asarray(arrays["roots"][start : start + meta["n_trees"]], dtype=np.int64)
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.feature = arrays["feature"]
+        self.value = arrays["value"]
+        self.default_left = arrays["default_left"]
+        self.max_depth = meta["max_depth"]
+        self.base_margin = meta["base_margin"]
+        self.n_features_in_ = meta["num_feature"]
+
+    def predict_margin(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.left[node]
+            internal = left != -1
+            if not internal.any():
+                break
+            x = X[rows, self.feature[node]]
+            go_left = np.where(np.isnan(x), self.default_left[node] == 1, x < self.value[node])
+            node = np.where(internal, np.where(go_left, left, self.right[node]), node)
+        return self.base_margin + self.value[node].sum(axis=1, dtype=np.float64)
+
+    def predict_proba(self, X):
+        p = 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+        return np.column_stack([1.0 - p, p])
+
+
+class ModelBundle:
+    """An opened bundle: header metadata plus zero-copy views into the mapped file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._mm = np.memmap(path, mode="r", dtype=np.uint8)
+        if bytes(self._mm[: len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a model bundle")
+        header_len = int(np.frombuffer(self._mm[len(MAGIC) : len(MAGIC) + 8], dtype="<u8")[0])
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self._mm[start : start + header_len]).decode("utf-8"))
+        self.arrays = {
+            name: np.ndarray(
+                tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]),
+                buffer=self._mm, offset=spec["offset"],
+            )
+            for name, spec in self.header["arrays"].items()
+        }
+        self.version_hash = self.header["version_hash"]
+        self.metrics = self.header["metrics"]
+        self.shap_data = self.header["shap"]
+        self.feature_names = self.header["feature_names"]
+        self.models = {
+            ab: BundleModel(self.arrays, meta) for ab, meta in self.header["antibiotics"].items()
+        }
+
+    def is_stale(self, metrics_path):
+        """True if metrics.json changed after the bundle was built (models retrained)."""
+        expected = self.header.get("metrics_sha256")
+        return expected is not None and expected != _file_sha256(metrics_path)
@@ -0,0 +1,267 @@
+"""
+model_registry.py — Versioned model sets with background reload and atomic swap.
+
+A model set is a directory in the layout train_models.py writes:
+<antibiotic>.joblib, <antibiotic>_shap.json and metrics.json, plus optionally
+models.bundle (build_bundle.py), which is preferred when present and not
+older than metrics.json. A directory written by train_joint.py holds one
+multi-output joint.ubj instead and is served through per-antibiotic heads
+(joint_model.py). The flat models/
+directory is the base set; retrained sets live in models/versions/<version>/
+and models/CURRENT names the version to serve (absent = base set).
+
+reload_async() loads the new set on a background thread, runs every model on a
+smoke genome and only then swaps it in; with persist=True a successfully
+swapped-in version is also written to CURRENT, so it is what the next load
+(a restart, or an organism reloaded after eviction) picks up. Request handlers call current() once
+and keep that ModelSet for the whole request, so in-flight requests finish
+on the version they started with.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from joint_model import JOINT_MODEL_NAME, JointModel
+from model_bundle import BUNDLE_NAME, ModelBundle
+
+BASE_VERSION = "base"
+
+
+class ModelSet:
+    """One immutable, fully loaded set of models plus its metadata."""
+
+    def __init__(self, version, path, models, shap_data, metrics, timings, source="joblib"):
+        self.version = version
+        self.path = path
+        self.models = models
+        self.shap_data = shap_data
+        self.metrics = metrics
+        self.timings = timings
+        self.source = source
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "path": os.path.abspath(self.path),
+            "source": self.source,
+            "models": list(self.models),
+            "loaded_at": self.loaded_at,
+            "timings_ms": self.timings,
+        }
+
+
+def load_bundle_model_set(path, version, antibiotics):
+    """Map path/models.bundle, or return None if it is missing or stale."""
+    bundle_path = os.path.join(path, BUNDLE_NAME)
+    if not os.path.exists(bundle_path):
+        return None
+    t_start = time.perf_counter()
+    bundle = ModelBundle(bundle_path)
+    if bundle.is_stale(os.path.join(path, "metrics.json")):
+        print(f"Ignoring stale {bundle_path} (metrics.json changed; rerun build_bundle.py)")
+        return None
+    models = {ab: m for ab, m in bundle.models.items() if ab in antibiotics}
+    timings = {"load_total": round((time.perf_counter() - t_start) * 1000, 2)}
+    return ModelSet(
+        version, path, models, bundle.shap_data, bundle.metrics, timings,
+        source=f"bundle:{bundle.version_hash}",
+    )
+
+
+def _load_json_files(path, antibiotics):
+    metrics, shap_data = {}, {}
+    metrics_path = os.path.join(path, "metrics.json")
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            metrics = json.load(f)
+    for ab in antibiotics:
+        shap_path = os.path.join(path, f"{ab.replace('/', '_')}_shap.json")
+        if os.path.exists(shap_path):
+            with open(shap_path) as f:
+                shap_data[ab] = json.load(f)
+    return metrics, shap_data
+
+
+def load_joint_model_set(path, version, antibiotics):
+    """Load a train_joint.py directory (one multi-output booster), or None."""
+    if not os.path.exists(os.path.join(path, JOINT_MODEL_NAME)):
+        return None
+    t_start = time.perf_counter()
+    joint = JointModel.load(path)
+    models = {ab: head for ab, head in joint.heads().items() if ab in antibiotics}
+    metrics, shap_data = _load_json_files(path, antibiotics)
+    timings = {"load_total": round((time.perf_counter() - t_start) * 1000, 2)}
+    return ModelSet(version, path, models, shap_data, metrics, timings, source="joint")
+
+
+def load_model_set(path, version, antibiotics):
+    """Load every model and SHAP summary in path, recording per-file load times."""
+    for loader in (load_joint_model_set, load_bundle_model_set):
+        model_set = loader(path, version, antibiotics)
+        if model_set is not None:
+            return model_set
+
+    t_start = time.perf_counter()
+    timings = {"models": {}}
+    models = {}
+    metrics, shap_data = _load_json_files(path, antibiotics)
+
+    for ab in antibiotics:
+        model_path = os.path.join(path, f"{ab.replace('/', '_')}.joblib")
+        if os.path.exists(model_path):
+            t0 = time.perf_counter()
+            models[ab] = joblib.load(model_path)
+            timings["models"][ab] = round((time.perf_counter() - t0) * 1000, 2)
+
+    timings["load_total"] = round((time.perf_counter() - t_start) * 1000, 2)
+    return ModelSet(version, path, models, shap_data, metrics, timings)
+
+
+def validate_model_set(model_set, smoke_features):
+    """Run every model on the smoke genome; raise ValueError on bad output."""
+    if not model_set.models:
+        raise ValueError(f"model set {model_set.version} contains no models")
+    t0 = time.perf_counter()
+    X = smoke_features.reshape(1, -1)
+    for ab, model in model_set.models.items():
+        prob = np.asarray(model.predict_proba(X))
+        if prob.shape != (1, 2) or not np.all(np.isfinite(prob)) or abs(prob.sum() - 1) > 1e-3:
+            raise ValueError(f"{ab}: bad smoke prediction {prob.tolist()}")
+    model_set.timings["validate"] = round((time.perf_counter() - t0) * 1000, 2)
+
+
+class ModelRegistry:
+    """Holds the active ModelSet and swaps in new versions without downtime."""
+
+    def __init__(self, models_dir, antibiotics, smoke_features):
+        self.models_dir = models_dir
+        self.versions_dir = os.path.join(models_dir, "versions")
+        self.current_file = os.path.join(models_dir, "CURRENT")
+        self.antibiotics = antibiotics
+        self.smoke_features = smoke_features
+        self._active = None
+        self._reload_lock = threading.Lock()
+        self._failed_version = None
+        self.last_reload = None
+
+    def current(self):
+        return self._active
+
+    def resolve(self, version=None):
+        """Map a version name (default: models/CURRENT) to (version, directory)."""
+        if version is None and os.path.exists(self.current_file):
+            with open(self.current_file) as f:
+                version = f.read().strip() or None
+        if version in (None, BASE_VERSION):
+            return self._base_version(), self.models_dir
+        if not all(c.isalnum() or c in "._-" for c in version):
+            raise ValueError(f"invalid model version {version!r}")
+        path = os.path.join(self.versions_dir, version)
+        if not os.path.isdir(path):
+            raise ValueError(f"model version {version!r} not found")
+        return version, path
+
+    def _base_version(self):
+        metrics_path = os.path.join(self.models_dir, "metrics.json")
+        if not os.path.exists(metrics_path):
+            return BASE_VERSION
+        with open(metrics_path, "rb") as f:
+            return f"{BASE_VERSION}-{hashlib.sha256(f.read()).hexdigest()[:8]}"
+
+    def available_versions(self):
+        versions = [BASE_VERSION]
+        if os.path.isdir(self.versions_dir):
+            versions += sorted(
+                d for d in os.listdir(self.versions_dir)
+                if os.path.isdir(os.path.join(self.versions_dir, d))
+            )
+        return versions
+
+    def set_current(self, version):
+        """Point models/CURRENT at a version (atomic rename)."""
+        tmp_path = self.current_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp_path, self.current_file)
+
+    def load(self, version=None, persist=False):
+        """Load, validate and swap in a version synchronously. Returns the new ModelSet."""
+        with self._reload_lock:
+            started = time.time()
+            try:
+                version, path = self.resolve(version)
+                model_set = load_model_set(path, version, self.antibiotics)
+                validate_model_set(model_set, self.smoke_features)
+            except Exception as e:
+                self.last_reload = {"status": "failed", "error": str(e), "started_at": started}
+                raise
+            previous = self._active
+            self._active = model_set  # single reference assignment: atomic swap
+            self.last_reload = {
+                "status": "ok",
+                "version": model_set.version,
+                "previous_version": previous.version if previous else None,
+                "started_at": started,
+                "timings_ms": model_set.timings,
+            }
+            if persist and version is not None:
+                try:
+                    self.set_current(version if path != self.models_dir else BASE_VERSION)
+                except OSError as e:
+                    print(f"  WARNING: could not record {version} in {self.current_file}: {e}")
+            return model_set
+
+    def reload_async(self, version=None, persist=False):
+        """Start a background reload; failures leave the current version serving."""
+        def run():
+            try:
+                model_set = self.load(version, persist)
+                print(f"Swapped in model set {model_set.version} "
+                      f"({model_set.timings['load_total']:.0f} ms load)")
+            except Exception as e:
+                print(f"Model reload failed, keeping {self._active.version if self._active else None}: {e}")
+
+        self.last_reload = {"status": "loading", "version": version, "started_at": time.time()}
+        thread = threading.Thread(target=run, name="model-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def check_current(self):
+        """Reload if models/CURRENT names a version other than the active one (a failed one is not retried)."""
+        try:
+            version, _ = self.resolve()
+        except ValueError:
+            return
+        if version == self._failed_version:
+            return
+        if self._active is None or version != self._active.version:
+            try:
+                model_set = self.load()
+                print(f"Swapped in model set {model_set.version} "
+                      f"({model_set.timings['load_total']:.0f} ms load)")
+            except Exception as e:
+                self._failed_version = version
+                print(f"Model reload failed: {e}")
+
+    def watch(self, interval):
+        """Poll models/CURRENT and reload in the background when it names a new version."""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.check_current()
+
+        threading.Thread(target=run, name="model-watch", daemon=True).start()
+
+    def status(self):
+        return {
+            "active": self._active.describe() if self._active else None,
+            "available_versions": self.available_versions(),
+            "last_reload": self.last_reload,
+        }
@@ -0,0 +1,199 @@
+"""
+organism_registry.py — Per-organism model registries, loaded lazily under a memory budget.
+
+E. coli (taxon 562) is the base organism and keeps the existing layout in
+models/. Every other organism is a directory models/organisms/<taxon id>/ in
+the same layout (flat base set, versions/, CURRENT) plus an optional
+organism.json:
+
+  {"name": "Klebsiella pneumoniae", "antibiotics": ["meropenem", ...]}
+
+(name defaults to KNOWN_ORGANISMS, antibiotics to the E. coli panel).
+
+Nothing is loaded for an organism until its first request. Loaded organisms
+are kept in least-recently-used order and their model files' size on disk is
+charged against ORGANISM_MEMORY_MB; when a load goes over the budget the
+coldest organisms are dropped (the base organism is pinned). Requests that
+already hold an evicted ModelSet finish on it, exactly as with a reload.
+An organism loaded again after eviction starts from its CURRENT, which is
+where /api/models/reload records an explicitly activated version; watch()
+polls CURRENT for every loaded organism.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from model_registry import ModelRegistry
+
+DEFAULT_TAXON = "562"
+ORGANISMS_DIR_NAME = "organisms"
+ORGANISM_META_NAME = "organism.json"
+ORGANISM_MEMORY_MB = float(os.environ.get("ORGANISM_MEMORY_MB", 2048))
+MODEL_FILE_SUFFIXES = (".joblib", ".bundle", ".ubj")
+
+KNOWN_ORGANISMS = {
+    "562": "Escherichia coli",
+    "573": "Klebsiella pneumoniae",
+    "28901": "Salmonella enterica",
+    "287": "Pseudomonas aeruginosa",
+    "470": "Acinetobacter baumannii",
+    "1280": "Staphylococcus aureus",
+}
+
+
+class Organism:
+    """A servable organism: taxon, display name, model directory and antibiotic panel."""
+
+    def __init__(self, taxon, name, models_dir, antibiotics):
+        self.taxon = taxon
+        self.name = name
+        self.models_dir = models_dir
+        self.antibiotics = antibiotics
+
+    def describe(self):
+        return {"taxon": self.taxon, "name": self.name, "antibiotics": self.antibiotics}
+
+
+def model_footprint(model_set):
+    """Bytes of model files behind a ModelSet (its in-memory size, to within a small factor)."""
+    total = 0
+    for filename in os.listdir(model_set.path):
+        if filename.endswith(MODEL_FILE_SUFFIXES):
+            total += os.path.getsize(os.path.join(model_set.path, filename))
+    return total
+
+
+class OrganismRegistry:
+    """Taxon -> ModelRegistry, loaded on first use and evicted least-recently-used."""
+
+    def __init__(self, models_dir, default_registry, default_antibiotics, smoke_features,
+                 memory_budget_mb=ORGANISM_MEMORY_MB):
+        self.models_dir = models_dir
+        self.organisms_dir = os.path.join(models_dir, ORGANISMS_DIR_NAME)
+        self.default_antibiotics = default_antibiotics
+        self.smoke_features = smoke_features
+        self.memory_budget = int(memory_budget_mb * 1e6)
+        self.default_registry = default_registry
+        self._loaded = OrderedDict()  # taxon -> (ModelRegistry, footprint bytes, last used)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.evictions = 0
+        self.organisms = self.discover()
+
+    def discover(self):
+        """Organisms with a model directory (the base organism always)."""
+        organisms = {
+            DEFAULT_TAXON: Organism(
+                DEFAULT_TAXON, KNOWN_ORGANISMS[DEFAULT_TAXON], self.models_dir, self.default_antibiotics
+            )
+        }
+        if os.path.isdir(self.organisms_dir):
+            for taxon in sorted(os.listdir(self.organisms_dir)):
+                path = os.path.join(self.organisms_dir, taxon)
+                if not taxon.isdigit() or not os.path.isdir(path) or taxon == DEFAULT_TAXON:
+                    continue
+                meta = {}
+                meta_path = os.path.join(path, ORGANISM_META_NAME)
+                if os.path.exists(meta_path):
+                    with open(meta_path) as f:
+                        meta = json.load(f)
+                organisms[taxon] = Organism(
+                    taxon,
+                    meta.get("name", KNOWN_ORGANISMS.get(taxon, f"taxon {taxon}")),
+                    path,
+                    meta.get("antibiotics", self.default_antibiotics),
+                )
+        return organisms
+
+    def resolve(self, value):
+        """Taxon id for a taxon id or organism name ('573', 'Klebsiella pneumoniae'); None if not served."""
+        value = str(value).strip()
+        if value in self.organisms:
+            return value
+        lowered = value.lower()
+        for taxon, organism in self.organisms.items():
+            if organism.name.lower() == lowered:
+                return taxon
+        return None
+
+    def registry(self, taxon):
+        """The organism's ModelRegistry, loading its active model set on first use."""
+        with self._lock:
+            entry = self._loaded.get(taxon)
+            if entry is not None:
+                self._loaded.move_to_end(taxon)
+                self._loaded[taxon] = (entry[0], entry[1], time.time())
+                return entry[0]
+            load_lock = self._load_locks.setdefault(taxon, threading.Lock())
+
+        # One loader per organism; others asking for it wait instead of loading twice
+        with load_lock:
+            with self._lock:
+                if taxon in self._loaded:
+                    return self._loaded[taxon][0]
+            if taxon == DEFAULT_TAXON:
+                registry = self.default_registry
+                model_set = registry.current() or registry.load()
+            else:
+                organism = self.organisms[taxon]
+                registry = ModelRegistry(organism.models_dir, organism.antibiotics, self.smoke_features)
+                model_set = registry.load()
+                print(f"Loaded {organism.name} models ({len(model_set.models)} antibiotics, "
+                      f"{model_set.timings['load_total']:.0f} ms)")
+            footprint = model_footprint(model_set)
+            with self._lock:
+                self._loaded[taxon] = (registry, footprint, time.time())
+                self._evict()
+        return registry
+
+    def watch(self, interval):
+        """Poll each loaded organism's CURRENT and reload in the background when it names a new version."""
+        def run():
+            while True:
+                time.sleep(interval)
+                with self._lock:
+                    registries = [registry for registry, _, _ in self._loaded.values()]
+                for registry in registries:
+                    registry.check_current()
+
+        threading.Thread(target=run, name="organism-watch", daemon=True).start()
+
+    def _evict(self):
+        """Drop least-recently-used organisms while over budget.
+
+        The base organism and the one just used are never dropped, so a budget
+        smaller than one organism still serves it.
+        """
+        total = sum(footprint for _, footprint, _ in self._loaded.values())
+        for taxon in list(self._loaded)[:-1]:
+            if total <= self.memory_budget:
+                break
+            if taxon == DEFAULT_TAXON:
+                continue
+            _, footprint, _ = self._loaded.pop(taxon)
+            total -= footprint
+            self.evictions += 1
+            print(f"Evicted {self.organisms[taxon].name} models ({footprint / 1e6:.1f} MB, "
+                  f"budget {self.memory_budget / 1e6:.0f} MB)")
+
+    def status(self):
+        with self._lock:
+            loaded = {
+                taxon: {
+                    "version": registry.current().version if registry.current() else None,
+                    "footprint_mb": round(footprint / 1e6, 2),
+                    "last_used": last_used,
+                }
+                for taxon, (registry, footprint, last_used) in self._loaded.items()
+            }
+        return {
+            "default_taxon": DEFAULT_TAXON,
+            "available": [o.describe() for o in self.organisms.values()],
+            "loaded": loaded,
+            "memory_budget_mb": round(self.memory_budget / 1e6, 1),
+            "memory_used_mb": round(sum(v["footprint_mb"] for v in loaded.values()), 2),
+            "evictions": self.evictions,
+        }
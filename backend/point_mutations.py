@@ -0,0 +1,363 @@
+"""
+point_mutations.py — Codon calls at known chromosomal resistance loci.
+
+Target mutations such as gyrA-S83L cannot be found by gene presence: every
+E. coli carries gyrA. MutationCaller reads wild-type coding sequences of a
+small panel of loci (gyrA, parC, parE) from backend/data/card/loci/ (CARD
+protein-variant-model records or plain FASTA named after the gene) and,
+for each upload:
+
+  1. anchors: every 16-mer of each locus' resistance-determining region (both
+     strands) goes into one small sorted table. The genome is cut into
+     back-to-back 16-mer tiles; any region of 31+ bp contains at least one
+     whole tile, so only 1/16 of the genome's 16-mers are ever valued and a
+     presence filter discards nearly all of them before the table lookup;
+  2. the dominant anchor diagonal places the region in the genome, and only
+     that window (plus WINDOW_PAD on each side) is aligned to the reference,
+     a semi-global alignment with one vectorised pass per reference base;
+  3. aligned codons are translated and compared with the reference.
+
+Every non-synonymous change in the region is reported; the ones listed in
+MUTATION_PANEL also come back as resistance-gene records (gyrA-S83L ...).
+"""
+
+import os
+
+import numpy as np
+
+from extract_kmers import encode_sequence
+from gene_detection import (
+    CARD_DIR, SEED_K, filter_slot, kmer_values, parse_reference_header, read_references,
+)
+from resistance_genes import GENE_DATABASE
+
+LOCI_DIR = os.path.join(CARD_DIR, "loci")
+
+# locus -> resistance-determining codons and the substitutions known to confer resistance
+MUTATION_PANEL = {
+    "gyrA": {
+        "protein": "DNA gyrase subunit A",
+        "mechanism": "DNA gyrase target mutation",
+        "antibiotics": ["ciprofloxacin", "levofloxacin"],
+        "color": "#a855f7",
+        "codons": {83: "S", 87: "D"},
+        "resistant": {83: "LAWV", 87: "NGYHV"},
+    },
+    "parC": {
+        "protein": "DNA topoisomerase IV subunit A",
+        "mechanism": "Topoisomerase IV target mutation",
+        "antibiotics": ["ciprofloxacin", "levofloxacin"],
+        "color": "#9333ea",
+        "codons": {80: "S", 84: "E"},
+        "resistant": {80: "IR", 84: "KGVA"},
+    },
+    "parE": {
+        "protein": "DNA topoisomerase IV subunit B",
+        "mechanism": "Topoisomerase IV target mutation",
+        "antibiotics": ["ciprofloxacin", "levofloxacin"],
+        "color": "#7e22ce",
+        "codons": {416: "L", 458: "S"},
+        "resistant": {416: "F", 458: "AT"},
+    },
+}
+
+REGION_FLANK_CODONS = 40  # region around the panel codons that is anchored and aligned
+ANCHOR_FILTER_BITS = 20
+MIN_ANCHORS = 3
+WINDOW_PAD = 30
+MATCH, MISMATCH, GAP = 2, -3, -5
+
+_BASES = "ACGT"
+_AMINO = "KNKNTTTTRSRSIIMIQHQHPPPPRRRRLLLLEDEDAAAAGGGGVVVV*Y*YSSSS*CWCLFLF"
+_KNOWN_MUTATIONS = {g["gene_id"]: g for g in GENE_DATABASE}
+
+
+def translate(codon_codes):
+    """Amino acid of a codon given as three 0-3 base codes ('X' if any base is not ACGT)."""
+    if any(c > 3 for c in codon_codes):
+        return "X"
+    a, b, c = (int(x) for x in codon_codes)
+    return _AMINO[a * 16 + b * 4 + c]
+
+
+def _decode(codes):
+    return "".join(_BASES[c] if c < 4 else "N" for c in codes)
+
+
+def align(ref, query):
+    """Semi-global alignment: all of ref against any substring of query.
+
+    Returns (ref_to_query, inserted_after): for each ref base the aligned query
+    index (-1 for a deletion), and the number of query bases inserted after it.
+    Each DP row is one vectorised pass; horizontal gaps use a running maximum.
+    """
+    n, m = len(ref), len(query)
+    H = np.zeros((n + 1, m + 1), dtype=np.int32)
+    H[:, 0] = GAP * np.arange(n + 1)
+    gap_ramp = -GAP * np.arange(m + 1)
+    for i in range(1, n + 1):
+        score = np.where((query == ref[i - 1]) & (query < 4), MATCH, MISMATCH)
+        row = np.empty(m + 1, dtype=np.int32)
+        row[0] = H[i, 0]
+        row[1:] = np.maximum(H[i - 1, :-1] + score, H[i - 1, 1:] + GAP)
+        H[i] = np.maximum.accumulate(row + gap_ramp) - gap_ramp
+
+    ref_to_query = np.full(n, -1, dtype=np.int64)
+    inserted_after = np.zeros(n, dtype=np.int64)
+    i, j = n, int(np.argmax(H[n]))
+    while i > 0:
+        if j > 0:
+            s = MATCH if query[j - 1] == ref[i - 1] and query[j - 1] < 4 else MISMATCH
+            if H[i, j] == H[i - 1, j - 1] + s:
+                i, j = i - 1, j - 1
+                ref_to_query[i] = j
+                continue
+            if H[i, j] != H[i - 1, j] + GAP:
+                inserted_after[i - 1] += 1
+                j -= 1
+                continue
+        i -= 1  # ref base deleted in the query
+    return ref_to_query, inserted_after
+
+
+class Locus:
+    """One panel locus: reference CDS, its anchored region and anchor 16-mers."""
+
+    def __init__(self, name, codes):
+        self.name = name
+        self.panel = MUTATION_PANEL[name]
+        self.codes = codes
+        first, last = min(self.panel["codons"]), max(self.panel["codons"])
+        self.region_start = max(0, (first - 1 - REGION_FLANK_CODONS) * 3)
+        self.region_end = min(len(codes), (last + REGION_FLANK_CODONS) * 3)
+        positions = np.arange(self.region_start, self.region_end - SEED_K + 1)
+        forward, reverse, valid = kmer_values(codes, positions)
+        self.anchor_positions = positions[valid]
+        self.anchor_forward = forward[valid]
+        self.anchor_reverse = reverse[valid]
+
+    def wild_type_ok(self):
+        """The reference must carry the expected wild-type residues at the panel codons."""
+        return all(
+            codon * 3 <= len(self.codes) and translate(self.codes[(codon - 1) * 3 : codon * 3]) == aa
+            for codon, aa in self.panel["codons"].items()
+        )
+
+
+def _locus_name(header):
+    name, _ = parse_reference_header(header)
+    tokens = name.replace("_", " ").split()
+    return next((locus for locus in MUTATION_PANEL if locus in tokens), None)
+
+
+class MutationCaller:
+    """Anchored codon calls at the MUTATION_PANEL loci."""
+
+    def __init__(self, loci):
+        self.loci = loci
+        # One sorted anchor table over all loci and both strands, plus a presence filter
+        values, locus_ids, positions, strands = [], [], [], []
+        for i, locus in enumerate(loci.values()):
+            for strand, anchor_values in ((0, locus.anchor_forward), (1, locus.anchor_reverse)):
+                values.append(anchor_values)
+                locus_ids.append(np.full(len(anchor_values), i))
+                positions.append(locus.anchor_positions)
+                strands.append(np.full(len(anchor_values), strand))
+        values = np.concatenate(values)
+        order = np.argsort(values, kind="stable")
+        self.anchor_values = values[order]
+        self.anchor_loci = np.concatenate(locus_ids)[order]
+        self.anchor_positions = np.concatenate(positions)[order]
+        self.anchor_strands = np.concatenate(strands)[order]
+        self.anchor_filter = np.zeros(1 << ANCHOR_FILTER_BITS, dtype=bool)
+        self.anchor_filter[filter_slot(self.anchor_values, ANCHOR_FILTER_BITS)] = True
+
+    @classmethod
+    def load(cls, loci_dir=LOCI_DIR):
+        """Read the first usable reference per panel locus; None if there are none."""
+        if not os.path.isdir(loci_dir):
+            return None
+        loci = {}
+        for header, sequence in read_references(loci_dir):
+            name = _locus_name(header)
+            if name is None or name in loci:
+                continue
+            locus = Locus(name, encode_sequence(sequence))
+            if locus.wild_type_ok():
+                loci[name] = locus
+            else:
+                print(f"  WARNING: {header[:60]} is not a wild-type {name} CDS in frame; skipped")
+        return cls(loci) if loci else None
+
+    def __len__(self):
+        return len(self.loci)
+
+    def _anchor_hits(self, codes):
+        """(locus, strand, diagonal) of every sampled genome 16-mer that is an anchor.
+
+        The contig is cut into back-to-back 16-mer tiles, so the tile values are
+        16 strided column passes; only the reference's strand needs both values.
+        """
+        n_tiles = len(codes) // SEED_K
+        tiles = codes[: n_tiles * SEED_K].reshape(n_tiles, SEED_K)
+        values = np.zeros(n_tiles, dtype=np.uint32)
+        invalid = np.zeros(n_tiles, dtype=bool)
+        for j in range(SEED_K):
+            column = tiles[:, j]
+            values = (values << np.uint32(2)) | (column & 3)
+            invalid |= column > 3
+        tile = np.flatnonzero(~invalid & self.anchor_filter[filter_slot(values, ANCHOR_FILTER_BITS)])
+        lo = np.searchsorted(self.anchor_values, values[tile], side="left")
+        hi = np.searchsorted(self.anchor_values, values[tile], side="right")
+        counts = hi - lo
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        idx = np.repeat(lo, counts) + within
+        qpos = np.repeat(tile, counts) * SEED_K
+        rpos = self.anchor_positions[idx]
+        minus = self.anchor_strands[idx] == 1
+        # Plus strand: genome = ref + diag. Minus: genome = diag - ref (reverse complement).
+        diag = np.where(minus, qpos + rpos + SEED_K - 1, qpos - rpos)
+        return self.anchor_loci[idx], minus, diag
+
+    def call(self, contigs):
+        """Codon changes per locus found in contigs [(name, codes)] -> list of locus reports."""
+        best = {}  # locus index -> (anchors, contig, strand, diagonal)
+        for c, (_, codes) in enumerate(contigs):
+            loci, minus, diag = self._anchor_hits(codes)
+            for i in np.unique(loci):
+                for strand in (False, True):
+                    d = diag[(loci == i) & (minus == strand)]
+                    if not len(d):
+                        continue
+                    diag_values, counts = np.unique(d, return_counts=True)
+                    top = int(np.argmax(counts))
+                    if counts[top] >= MIN_ANCHORS and counts[top] > best.get(i, (0,))[0]:
+                        best[i] = (int(counts[top]), c, "-" if strand else "+", int(diag_values[top]))
+
+        reports = []
+        for i, locus in enumerate(self.loci.values()):
+            if i in best:
+                anchors, c, strand, diag = best[i]
+                reports.append(self._call_locus(locus, contigs, c, strand, diag, anchors))
+        return reports
+
+    def _call_locus(self, locus, contigs, c, strand, diag, anchors):
+        contig_name, codes = contigs[c]
+        ref = locus.codes[locus.region_start : locus.region_end]
+        if strand == "+":
+            w_start = max(0, diag + locus.region_start - WINDOW_PAD)
+            w_end = min(len(codes), diag + locus.region_end + WINDOW_PAD)
+            window = codes[w_start:w_end]
+        else:
+            w_start = max(0, diag - locus.region_end + 1 - WINDOW_PAD)
+            w_end = min(len(codes), diag - locus.region_start + 1 + WINDOW_PAD)
+            window = codes[w_start:w_end][::-1]
+            window = np.where(window < 4, 3 - window, window).astype(np.uint8)
+
+        ref_to_query, inserted_after = align(ref, window)
+        aligned = ref_to_query >= 0
+        identity = float((window[ref_to_query[aligned]] == ref[aligned]).mean()) if aligned.any() else 0.0
+
+        changes = []
+        first_codon = locus.region_start // 3 + 1
+        for k in range(len(ref) // 3):
+            r = slice(3 * k, 3 * k + 3)
+            codon = first_codon + k
+            ref_codon = ref[r]
+            if (ref_to_query[r] < 0).any() or inserted_after[3 * k : 3 * k + 2].any():
+                changes.append(self._change(locus, codon, ref_codon, None))
+                continue
+            alt_codon = window[ref_to_query[r]]
+            if not np.array_equal(alt_codon, ref_codon):
+                change = self._change(locus, codon, ref_codon, alt_codon)
+                if change["alt_aa"] != change["ref_aa"]:
+                    changes.append(change)
+
+        # Whole-gene coordinates on the contig, extrapolated along the anchor diagonal
+        if strand == "+":
+            start, end = diag, diag + len(locus.codes)
+        else:
+            start, end = diag - len(locus.codes) + 1, diag + 1
+        start, end = max(0, start), min(len(codes), end)
+        # Genome-wide positions (concatenated contigs), as gene_detection reports them
+        offset = sum(len(other) for _, other in contigs[:c])
+        return {
+            "locus": locus.name,
+            "contig": contig_name,
+            "strand": strand,
+            "position_start": offset + start,
+            "position_end": offset + end,
+            "contig_start": start,
+            "contig_end": end,
+            "region_codons": [first_codon, first_codon + len(ref) // 3 - 1],
+            "identity": round(identity, 4),
+            "anchors": anchors,
+            "changes": changes,
+        }
+
+    @staticmethod
+    def _change(locus, codon, ref_codon, alt_codon):
+        ref_aa = translate(ref_codon)
+        if alt_codon is None:
+            return {
+                "codon": codon, "ref_codon": _decode(ref_codon), "alt_codon": None,
+                "ref_aa": ref_aa, "alt_aa": None, "mutation": f"{ref_aa}{codon}indel",
+                "known_resistance": False,
+            }
+        alt_aa = translate(alt_codon)
+        return {
+            "codon": codon,
+            "ref_codon": _decode(ref_codon),
+            "alt_codon": _decode(alt_codon),
+            "ref_aa": ref_aa,
+            "alt_aa": alt_aa,
+            "mutation": f"{ref_aa}{codon}{alt_aa}",
+            "known_resistance": alt_aa in locus.panel["resistant"].get(codon, ""),
+        }
+
+
+def mutation_genes(reports):
+    """Known resistance substitutions from call() in the resistance-gene output format."""
+    genes = []
+    for report in reports:
+        panel = MUTATION_PANEL[report["locus"]]
+        for change in report["changes"]:
+            if not change["known_resistance"]:
+                continue
+            gene_id = f"{report['locus']}-{change['mutation']}"
+            known = _KNOWN_MUTATIONS.get(gene_id)
+            genes.append({
+                "gene_id": gene_id,
+                "position_start": report["position_start"],
+                "position_end": report["position_end"],
+                "location": "chromosome",
+                "color": known["color"] if known else panel["color"],
+                "mechanism": known["mechanism"] if known else panel["mechanism"],
+                "drugs_defeated": known["antibiotics"] if known else panel["antibiotics"],
+                "spreadable": False,
+                "description": known["description"] if known else
+                    f"The {change['mutation']} substitution in {panel['protein']} ({report['locus']}, "
+                    f"codon {change['ref_codon']}>{change['alt_codon']}) is a known resistance mutation "
+                    f"against {', '.join(panel['antibiotics'])}.",
+                "identity": report["identity"],
+                "strand": report["strand"],
+                "contig": report["contig"],
+                "contig_start": report["contig_start"],
+                "contig_end": report["contig_end"],
+                "codon_change": f"{change['ref_codon']}>{change['alt_codon']}",
+                "detection": "point_mutation",
+            })
+    return genes
+
+
+_CALLER = None
+_CALLER_LOADED = False
+
+
+def get_mutation_caller():
+    """Per-process MutationCaller (None when backend/data/card/loci/ has no panel references)."""
+    global _CALLER, _CALLER_LOADED
+    if not _CALLER_LOADED:
+        _CALLER = MutationCaller.load()
+        _CALLER_LOADED = True
+    return _CALLER
@@ -0,0 +1,292 @@
+"""
+request_profiler.py — Opt-in profiling of individual analyze_fasta requests.
+
+A request is profiled when an admin sends `X-Profile: cprofile` (deterministic,
+every call) or `X-Profile: sample` (stack sampling every PROFILE_SAMPLE_INTERVAL
+seconds), or when it is picked at random at PROFILE_SAMPLE_RATE (using
+PROFILE_SAMPLE_MODE). Otherwise nothing here runs beyond one header lookup and
+a comparison: the request and the compute-pool job take their normal path.
+
+A profiled request records two profiles, one for the request thread and one
+inside the compute-pool worker that does the sequence work (merged across
+jobs when a request runs more than one, e.g. preview + refine). They are written
+with the input size and stage timings into PROFILE_DIR, a ring buffer that
+keeps the newest PROFILE_MAX_ENTRIES captures:
+
+  <id>.json             metadata: path, input bytes / lines / contigs, status,
+                        jobs, queue / compute ms (summed over jobs), total ms,
+                        per-stage ms
+  <id>.request.prof     pstats dump (cprofile) or folded stacks (sample)
+  <id>.worker.prof
+
+Load .prof files with `python -m pstats` / snakeviz; folded stacks go straight
+into flamegraph.pl or speedscope. app.py serves them under /api/admin/profiles.
+
+  PROFILE_SAMPLE_RATE      fraction of requests profiled without the header (default 0)
+  PROFILE_SAMPLE_MODE      cprofile | sample for those requests (default sample)
+  PROFILE_SAMPLE_INTERVAL  stack sampling period in seconds (default 0.005)
+  PROFILE_MAX_ENTRIES      captures kept on disk (default 50)
+  PROFILE_DIR              default backend/data/profiles
+"""
+
+import cProfile
+import functools
+import json
+import marshal
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, make_response, request
+
+import compute_pool
+
+PROFILE_DIR = os.environ.get(
+    "PROFILE_DIR", os.path.join(os.path.dirname(__file__), "data", "profiles")
+)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SAMPLE_MODE = os.environ.get("PROFILE_SAMPLE_MODE", "sample")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_MAX_ENTRIES = int(os.environ.get("PROFILE_MAX_ENTRIES", 50))
+MODES = ("cprofile", "sample")
+PROFILE_ID_RE = re.compile(r"^[0-9]{13}-[0-9a-f]{8}$")
+
+# Worker functions reported as stages (sequence_analysis.analyze_sequence and what it calls)
+STAGES = (
+    "parse_contigs", "kmer_features", "scan", "call", "compute_genome_stats", "build_tracks",
+)
+
+_ring_lock = threading.Lock()
+
+
+def requested_mode(header_value, is_admin):
+    """Profiling mode for this request, or None (the common case)."""
+    if header_value in MODES and is_admin():
+        return header_value
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_SAMPLE_MODE
+    return None
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread into folded-stack counts."""
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common()).encode()
+
+    def stage_ms(self):
+        totals = Counter()
+        for stack, n in self.stacks.items():
+            names = {frame.rsplit(":", 1)[1] for frame in stack.split(";")}
+            for stage in STAGES:
+                if stage in names:
+                    totals[stage] += n
+        return {stage: round(n * self.interval * 1000, 1) for stage, n in totals.items()}
+
+
+class Capture:
+    """One running profiler (either mode) with a uniform stop -> (bytes, stage ms) interface."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.profiler = cProfile.Profile() if mode == "cprofile" else StackSampler()
+
+    def start(self):
+        if self.mode == "cprofile":
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop(self):
+        if self.mode == "sample":
+            self.profiler.stop()
+            return self.profiler.dump(), self.profiler.stage_ms()
+        self.profiler.disable()
+        stats = pstats.Stats(self.profiler)
+        stages = {}
+        for (_, _, name), (_, _, _, cumtime, _) in stats.stats.items():
+            if name in STAGES:
+                stages[name] = round(stages.get(name, 0.0) + cumtime * 1000, 1)
+        return marshal.dumps(stats.stats), stages
+
+
+def profile_job(mode, fn, *args):
+    """Compute-pool job wrapper: (fn(*args), (profile bytes, stage ms)) under a profiler."""
+    capture = Capture(mode)
+    capture.start()
+    try:
+        result = fn(*args)
+    finally:
+        profile = capture.stop()
+    return result, profile
+
+
+def run_job(fn, *args, weight=0, lane=None):
+    """compute_pool.run_job, wrapped in profile_job when this request is being profiled.
+
+    Every job of the request adds its worker profile to g.worker_profiles and
+    its queue / compute time to g.profile_timings; the input is recorded once.
+    """
+    mode = g.get("profile_mode")
+    if mode is None:
+        return compute_pool.run_job(fn, *args, weight=weight, lane=lane)
+    if "profile_input" not in g:
+        g.profile_input = {
+            "bytes": sum(len(a) for a in args if isinstance(a, str)),
+            "lines": sum(a.count("\n") + 1 for a in args if isinstance(a, str)),
+            "contigs": sum(a.count(">") for a in args if isinstance(a, str)),
+        }
+    (result, worker_profile), queue_wait, compute_s = compute_pool.run_job(
+        profile_job, mode, fn, *args, weight=weight, lane=lane
+    )
+    g.setdefault("worker_profiles", []).append(worker_profile)
+    timings = g.setdefault("profile_timings", {"jobs": 0, "queue_ms": 0.0, "compute_ms": 0.0})
+    timings["jobs"] += 1
+    timings["queue_ms"] = round(timings["queue_ms"] + queue_wait * 1000, 1)
+    timings["compute_ms"] = round(timings["compute_ms"] + compute_s * 1000, 1)
+    return result, queue_wait, compute_s
+
+
+def merge_profiles(mode, profiles):
+    """One (profile bytes, stage ms) from the worker profiles of several jobs; (None, {}) for none."""
+    if not profiles:
+        return None, {}
+    if len(profiles) == 1:
+        return profiles[0]
+    stages = Counter()
+    for _, job_stages in profiles:
+        stages.update(job_stages)
+    stages = {stage: round(ms, 1) for stage, ms in stages.items()}
+    if mode == "sample":
+        stacks = Counter()
+        for data, _ in profiles:
+            for line in data.decode().splitlines():
+                stack, n = line.rsplit(" ", 1)
+                stacks[stack] += int(n)
+        return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common()).encode(), stages
+    merged = {}
+    for data, _ in profiles:
+        for func, stat in marshal.loads(data).items():
+            merged[func] = pstats.add_func_stats(merged[func], stat) if func in merged else stat
+    return marshal.dumps(merged), stages
+
+
+def profiled(is_admin):
+    """View decorator: profile the request (and its compute-pool job) when requested_mode() says so."""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            mode = requested_mode(request.headers.get("X-Profile"), is_admin)
+            if mode is None:
+                return view(*args, **kwargs)
+            g.profile_mode = mode
+            capture = Capture(mode)
+            t0 = time.perf_counter()
+            capture.start()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                request_profile, request_stages = capture.stop()
+            total_ms = (time.perf_counter() - t0) * 1000
+            worker_profile, worker_stages = merge_profiles(mode, g.get("worker_profiles"))
+            meta = {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "path": request.path,
+                "status": response.status_code,
+                "input": g.get("profile_input", {"bytes": request.content_length}),
+                "total_ms": round(total_ms, 1),
+                **g.get("profile_timings", {}),
+                "stages_ms": {**request_stages, **worker_stages},
+            }
+            try:
+                response.headers["X-Profile-Id"] = save_capture(mode, meta, request_profile, worker_profile)
+            except OSError as e:
+                print(f"  WARNING: could not save request profile: {e}")
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def save_capture(mode, meta, request_profile, worker_profile, profile_dir=PROFILE_DIR):
+    """Write one capture and drop the oldest beyond PROFILE_MAX_ENTRIES; returns its id."""
+    profile_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(profile_dir, exist_ok=True)
+    meta = {"id": profile_id, "mode": mode, "format": "pstats" if mode == "cprofile" else "folded", **meta}
+    for part, data in (("request", request_profile), ("worker", worker_profile)):
+        if data is not None:
+            with open(os.path.join(profile_dir, f"{profile_id}.{part}.prof"), "wb") as f:
+                f.write(data)
+    tmp_path = os.path.join(profile_dir, f"{profile_id}.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(profile_dir, f"{profile_id}.json"))
+
+    with _ring_lock:
+        for old in list_ids(profile_dir)[PROFILE_MAX_ENTRIES:]:
+            for suffix in (".json", ".request.prof", ".worker.prof"):
+                try:
+                    os.remove(os.path.join(profile_dir, old + suffix))
+                except FileNotFoundError:
+                    pass
+    return profile_id
+
+
+def list_ids(profile_dir=PROFILE_DIR):
+    """Capture ids, newest first."""
+    if not os.path.isdir(profile_dir):
+        return []
+    ids = [f[: -len(".json")] for f in os.listdir(profile_dir) if f.endswith(".json")]
+    return sorted((i for i in ids if PROFILE_ID_RE.match(i)), reverse=True)
+
+
+def list_captures(profile_dir=PROFILE_DIR):
+    captures = []
+    for profile_id in list_ids(profile_dir):
+        try:
+            with open(os.path.join(profile_dir, f"{profile_id}.json")) as f:
+                captures.append(json.load(f))
+        except FileNotFoundError:  # rotated out while listing
+            continue
+    return captures
+
+
+def capture_file(profile_id, part, profile_dir=PROFILE_DIR):
+    """Path of a capture's profile ("request" or "worker"), or None."""
+    if not PROFILE_ID_RE.match(profile_id) or part not in ("request", "worker"):
+        return None
+    path = os.path.join(profile_dir, f"{profile_id}.{part}.prof")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,84 @@
+"""
+response_cache.py — In-memory cache for the read-mostly JSON files the API serves.
+
+Each file (demo genome JSONs, index.json, validation_stats.json) is parsed and
+serialized once, stored next to a pre-gzipped copy and a strong ETag, and only
+reloaded when its mtime or size changes. Responses honour If-None-Match (304)
+and Accept-Encoding: gzip, and carry the same body jsonify() would produce.
+Analysis files can also be served in the compact msgpack encoding.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from flask import current_app, request
+
+from compact_encoding import COMPACT_MIMETYPE, pack, wants_compact
+
+_CACHE = {}
+_LOCK = threading.Lock()
+
+
+def _load_entry(path, stamp):
+    with open(path) as f:
+        data = json.load(f)
+    body = current_app.json.response(data).get_data()
+    return {
+        "stamp": stamp,
+        "data": data,
+        "body": body,
+        "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+    }
+
+
+def get_entry(path):
+    """Return the cache entry for path, (re)loading it if the file changed on disk."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    entry = _CACHE.get(path)
+    if entry is None or entry["stamp"] != stamp:
+        with _LOCK:
+            entry = _CACHE.get(path)
+            if entry is None or entry["stamp"] != stamp:
+                entry = _load_entry(path, stamp)
+                _CACHE[path] = entry
+    return entry
+
+
+def cached_json_response(path, allow_compact=False):
+    """Serve a JSON file from the cache with ETag/304 and gzip negotiation.
+
+    With allow_compact, clients asking for msgpack get the compact encoding
+    (built lazily and cached alongside the JSON body).
+    """
+    entry = get_entry(path)
+    content_encoding = None
+    if allow_compact and wants_compact():
+        if "msgpack" not in entry:
+            entry["msgpack"] = pack(entry["data"])
+        body, mimetype = entry["msgpack"], COMPACT_MIMETYPE
+        # Strong ETags are per representation, so each body gets its own tag
+        etag = entry["etag"] + "-msgpack"
+    elif request.accept_encodings["gzip"] > 0:
+        body, mimetype, content_encoding = entry["gzip"], "application/json", "gzip"
+        etag = entry["etag"] + "-gzip"
+    else:
+        body, mimetype = entry["body"], "application/json"
+        etag = entry["etag"]
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype=mimetype)
+        if content_encoding:
+            response.headers["Content-Encoding"] = content_encoding
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    if allow_compact:
+        response.vary.add("Accept")
+    return response
@@ -0,0 +1,136 @@
+"""
+sequence_analysis.py — CPU-heavy per-upload work for analyze_fasta and analyze_reads.
+
+Kept free of Flask and model state so compute_pool can run it inside worker
+processes: k-mer feature extraction, the MinHash sketch and genome stats from
+raw FASTA text, plus resistance genes found against the CARD seed index and
+codon calls at the point-mutation loci. Each contig is encoded once and feeds
+the 6-mer counts, the sketch, the gene scan, the mutation caller and the
+stored GC track pyramid (genome_pyramid.py).
+"""
+
+import numpy as np
+
+from extract_kmers import build_kmer_index, encode_sequence, add_kmer_counts, sample_windows
+from fastq_kmers import count_reads
+from gene_detection import get_detector
+from genome_pyramid import BASE_WINDOW, genome_hash, save_pyramid
+from minhash import Sketcher
+from point_mutations import get_mutation_caller
+from resistance_genes import compute_genome_stats
+
+KMER_INDEX = build_kmer_index()
+
+
+def parse_contigs(fasta_text):
+    """FASTA text -> [(header, encoded sequence)], one entry per contig."""
+    contigs = []
+    header, sequence = "", []
+    for line in fasta_text.strip().split("\n"):
+        line = line.strip()
+        if line.startswith(">"):
+            if sequence:
+                contigs.append((header, encode_sequence("".join(sequence))))
+                sequence = []
+            header = line[1:].strip()
+        else:
+            sequence.append(line)
+    if sequence:
+        contigs.append((header, encode_sequence("".join(sequence))))
+    return contigs
+
+
+def kmer_features(contigs):
+    """6-mer frequency vector of encoded contigs."""
+    counts = np.zeros(len(KMER_INDEX), dtype=np.float64)
+    for _, codes in contigs:
+        add_kmer_counts(codes, counts)
+
+    total = counts.sum()
+    if total > 0:
+        return (counts / total).astype(np.float32)
+    return counts.astype(np.float32)
+
+
+def extract_kmers_from_fasta_text(fasta_text):
+    """Extract 6-mer frequency vector from raw FASTA text."""
+    return kmer_features(parse_contigs(fasta_text))
+
+
+def analyze_sequence(fasta_text, default_organism=True):
+    """Worker job: (k-mer features, MinHash sketch, genome stats, detected genes, mutations).
+
+    Detected genes is None when no CARD references are installed, mutations
+    (point_mutations.MutationCaller.call reports) when no panel loci are.
+    The sketch index and the panel loci are E. coli's: for other organisms
+    (default_organism=False) the sketch and mutations are skipped and None.
+    """
+    contigs, features = sequence_features(fasta_text)
+    sketch, genome_stats, genes, mutations = sequence_annotations(fasta_text, contigs, default_organism)
+    return features, sketch, genome_stats, genes, mutations
+
+
+def sequence_features(fasta_text):
+    """Worker job, first half of analyze_sequence: (encoded contigs, k-mer features).
+
+    The streaming endpoint runs the halves as two jobs so predictions can go
+    out while the second one runs; the contigs are handed back for it.
+    """
+    contigs = parse_contigs(fasta_text)
+    return contigs, kmer_features(contigs)
+
+
+def sequence_annotations(fasta_text, contigs, default_organism=True):
+    """Worker job, second half of analyze_sequence: (sketch, genome stats, detected genes, mutations)."""
+    sketch = mutations = None
+    if default_organism:
+        sketcher = Sketcher()
+        for _, codes in contigs:
+            sketcher.add(codes)
+        sketch = sketcher.padded()
+        caller = get_mutation_caller()
+        mutations = caller.call(contigs) if caller is not None else None
+    detector = get_detector()
+    genes = detector.scan(contigs) if detector is not None else None
+    genome_stats = compute_genome_stats(fasta_text)
+    genome_stats["tracks"] = build_tracks(contigs)
+    return sketch, genome_stats, genes, mutations
+
+
+def preview_features(fasta_text, fraction):
+    """Worker job for preview mode: (k-mer features of a window sample, genome stats, bases counted).
+
+    Frequencies settle long before the whole genome is counted, so a
+    stratified sample (extract_kmers.sample_windows) gives near-final
+    predictions; training/preview_study.py measures how near per fraction.
+    """
+    contigs = parse_contigs(fasta_text)
+    sample = sample_windows([codes for _, codes in contigs], fraction)
+    features = kmer_features([("sample", sample)])
+    return features, compute_genome_stats(fasta_text), int((sample < 4).sum())
+
+
+def reads_features(paths):
+    """Worker job for analyze_reads: (k-mer features of error-filtered FASTQ reads, read stats).
+
+    Streams the files (training/fastq_kmers.py), so memory stays bounded by
+    the abundance sketch however many reads were uploaded.
+    """
+    counts, stats = count_reads(paths)
+    total = counts.sum()
+    if total > 0:
+        return (counts / total).astype(np.float32), stats
+    return counts.astype(np.float32), stats
+
+
+def build_tracks(contigs):
+    """Store the genome's GC track pyramid (once per content hash); None if it can't be written."""
+    ghash = genome_hash(contigs)
+    try:
+        save_pyramid(ghash, contigs)
+    except OSError as e:
+        print(f"  WARNING: could not store GC track pyramid: {e}")
+        return None
+    length = sum(len(codes) for _, codes in contigs)
+    levels = (max(1, -(-length // BASE_WINDOW)) - 1).bit_length() + 1
+    return {"genome_hash": ghash, "base_window": BASE_WINDOW, "levels": levels}
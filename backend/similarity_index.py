@@ -0,0 +1,123 @@
+"""
+similarity_index.py — Nearest training genomes in k-mer feature space.
+
+build_index() turns the training feature matrix into unit-length vectors:
+frequencies are centred, projected onto the top principal components (PCA via
+an eigendecomposition of the blocked covariance, so it never materialises a
+genomes x genomes matrix) and L2-normalised. Cosine similarity is then a dot
+product; search() scores the reference vectors in row blocks with one matrix
+multiply per block and keeps a running top-k, so memory stays bounded for
+batch queries and 50k-genome reference sets.
+
+train_models.py writes similarity_index.npz next to the model set; app.py
+serves it as /api/similar.
+"""
+
+import os
+import time
+
+import numpy as np
+
+SIMILARITY_INDEX_NAME = "similarity_index.npz"
+N_COMPONENTS = 128
+BLOCK_ROWS = 8192
+
+
+def build_index(features, genome_ids, path, n_components=N_COMPONENTS):
+    """Fit PCA on features (genomes x k-mers) and save the normalised index.
+
+    features is only read in row blocks, so a feature_store.LazyFeatures view works too.
+    """
+    mean = np.zeros(features.shape[1], dtype=np.float64)
+    for start in range(0, len(features), BLOCK_ROWS):
+        mean += np.asarray(features[start : start + BLOCK_ROWS], dtype=np.float64).sum(axis=0)
+    mean /= max(len(features), 1)
+
+    if n_components and n_components < features.shape[1]:
+        cov = np.zeros((features.shape[1], features.shape[1]), dtype=np.float64)
+        for start in range(0, len(features), BLOCK_ROWS):
+            block = np.asarray(features[start : start + BLOCK_ROWS], dtype=np.float32) - mean
+            cov += block.T @ block
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        order = np.argsort(eigvals)[::-1][:n_components]
+        components = eigvecs[:, order].astype(np.float32)
+        explained = float(eigvals[order].sum() / max(eigvals.sum(), 1e-30))
+    else:
+        components = None
+        explained = 1.0
+
+    mean = mean.astype(np.float32)
+    vectors = np.vstack([
+        _project(features[start : start + BLOCK_ROWS], mean, components)
+        for start in range(0, len(features), BLOCK_ROWS)
+    ])
+    arrays = {
+        "mean": mean,
+        "vectors": vectors,
+        "genome_ids": np.asarray(genome_ids, dtype=str),
+        "explained_variance": np.float64(explained),
+    }
+    if components is not None:
+        arrays["components"] = components
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return explained
+
+
+def _project(X, mean, components):
+    X = np.asarray(X, dtype=np.float32) - mean
+    if components is not None:
+        X = X @ components
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.maximum(norms, 1e-12)
+
+
+class SimilarityIndex:
+    """Unit vectors of the training genomes plus the projection that made them."""
+
+    def __init__(self, path):
+        t0 = time.perf_counter()
+        with np.load(path) as data:
+            self.mean = data["mean"]
+            self.components = data["components"] if "components" in data.files else None
+            self.vectors = np.ascontiguousarray(data["vectors"])
+            self.genome_ids = data["genome_ids"].tolist()
+            self.explained_variance = float(data["explained_variance"])
+        self.row_of = {gid: i for i, gid in enumerate(self.genome_ids)}
+        self.path = path
+        self.load_ms = (time.perf_counter() - t0) * 1000
+
+    def __len__(self):
+        return len(self.genome_ids)
+
+    def project(self, features):
+        return _project(np.atleast_2d(features), self.mean, self.components)
+
+    def search(self, queries, k=10, exclude=None):
+        """Top-k (rows, cosine similarities) for each projected query vector.
+
+        queries is (m x dims); exclude is an optional row per query to skip
+        (a training genome looking up its own neighbours).
+        """
+        queries = np.atleast_2d(queries).astype(np.float32)
+        m = len(queries)
+        k = min(k, len(self.vectors) - (exclude is not None))
+        best_sim = np.full((m, 0), -np.inf, dtype=np.float32)
+        best_row = np.zeros((m, 0), dtype=np.int64)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            sims = queries @ self.vectors[start : start + BLOCK_ROWS].T
+            if exclude is not None:
+                for q, row in enumerate(exclude):
+                    if row is not None and start <= row < start + sims.shape[1]:
+                        sims[q, row - start] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + sims.shape[1]), sims.shape)
+            sims = np.hstack([best_sim, sims])
+            rows = np.hstack([best_row, rows])
+            if sims.shape[1] > k:
+                keep = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+                sims = np.take_along_axis(sims, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            best_sim, best_row = sims, rows
+        order = np.argsort(-best_sim, axis=1)
+        return np.take_along_axis(best_row, order, axis=1), np.take_along_axis(best_sim, order, axis=1)
@@ -0,0 +1,97 @@
+"""
+build_bundle.py — Pack a model set into a single memory-mapped bundle file.
+
+Reads every <antibiotic>.joblib, <antibiotic>_shap.json and metrics.json in a
+model directory and writes <dir>/models.bundle (see backend/model_bundle.py),
+which the backend prefers over the individual files. The bundle is checked
+against the original XGBoost models before the command exits.
+
+Usage:
+  python build_bundle.py                          # models/
+  python build_bundle.py --models-dir ../models/versions/v2
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+from extract_kmers import build_kmer_index
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from model_bundle import BUNDLE_NAME, ModelBundle, write_bundle
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+
+TARGET_ANTIBIOTICS = [
+    "ampicillin",
+    "ciprofloxacin",
+    "ceftriaxone",
+    "gentamicin",
+    "meropenem",
+    "trimethoprim/sulfamethoxazole",
+    "ceftazidime",
+    "tetracycline",
+    "chloramphenicol",
+    "levofloxacin",
+]
+
+
+def build_bundle(models_dir=MODELS_DIR):
+    """Write models_dir/models.bundle and verify it. Returns the bundle path."""
+    t0 = time.perf_counter()
+    models, shap_data = {}, {}
+    for ab in TARGET_ANTIBIOTICS:
+        ab_safe = ab.replace("/", "_")
+        model_path = os.path.join(models_dir, f"{ab_safe}.joblib")
+        if os.path.exists(model_path):
+            models[ab] = joblib.load(model_path)
+        shap_path = os.path.join(models_dir, f"{ab_safe}_shap.json")
+        if os.path.exists(shap_path):
+            with open(shap_path) as f:
+                shap_data[ab] = json.load(f)
+    joblib_ms = (time.perf_counter() - t0) * 1000
+
+    metrics_path = os.path.join(models_dir, "metrics.json")
+    metrics = {}
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            metrics = json.load(f)
+
+    kmer_index = build_kmer_index()
+    feature_names = sorted(kmer_index, key=kmer_index.get)
+
+    bundle_path = os.path.join(models_dir, BUNDLE_NAME)
+    header = write_bundle(bundle_path, models, shap_data, metrics, feature_names, metrics_path)
+    print(f"Wrote {bundle_path} ({os.path.getsize(bundle_path) / 1024:.0f} KB, "
+          f"{len(models)} models, version {header['version_hash']})")
+
+    # Verify against XGBoost on random frequency vectors
+    t0 = time.perf_counter()
+    bundle = ModelBundle(bundle_path)
+    bundle_ms = (time.perf_counter() - t0) * 1000
+    rng = np.random.default_rng(0)
+    X = rng.dirichlet(np.ones(len(feature_names)), size=64).astype(np.float32)
+    worst = 0.0
+    for ab, model in models.items():
+        diff = np.abs(bundle.models[ab].predict_proba(X)[:, 1] - model.predict_proba(X)[:, 1]).max()
+        worst = max(worst, float(diff))
+    if worst > 1e-5:
+        raise SystemExit(f"Bundle predictions differ from XGBoost by {worst:.2e}")
+    print(f"  Verified against XGBoost: max |dp| = {worst:.1e}")
+    print(f"  Load time: joblib {joblib_ms:.0f} ms -> bundle {bundle_ms:.1f} ms")
+    return bundle_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    args = parser.parse_args()
+    build_bundle(args.models_dir)
+
+
+if __name__ == "__main__":
+    main()
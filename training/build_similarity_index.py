@@ -0,0 +1,50 @@
+"""
+build_similarity_index.py — (Re)build the /api/similar index without retraining.
+
+train_models.py builds it automatically; this rebuilds
+<models-dir>/similarity_index.npz from the current feature store, e.g. with a
+different number of PCA components (0 = keep all 4096 dimensions).
+
+Usage:
+  python build_similarity_index.py
+  python build_similarity_index.py --components 64 --models-dir ../models/versions/v2
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from feature_store import load_features
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from similarity_index import N_COMPONENTS, SIMILARITY_INDEX_NAME, SimilarityIndex, build_index
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "processed")
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--components", type=int, default=N_COMPONENTS)
+    args = parser.parse_args()
+
+    features = load_features()
+    with open(os.path.join(DATA_DIR, "genome_ids.json")) as f:
+        genome_ids = json.load(f)
+
+    t0 = time.perf_counter()
+    path = os.path.join(args.models_dir, SIMILARITY_INDEX_NAME)
+    explained = build_index(features, genome_ids, path, args.components)
+    print(f"Saved {path} ({len(genome_ids)} genomes, {explained:.0%} variance kept, "
+          f"{os.path.getsize(path) / 1e6:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+
+    index = SimilarityIndex(path)
+    t0 = time.perf_counter()
+    index.search(index.vectors[:1], k=10)
+    print(f"  Load: {index.load_ms:.0f} ms  Query: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+build_sketch_index.py — MinHash sketch every training genome for the backend.
+
+Reads the FASTA of each genome in processed/genome_ids.json, computes its
+bottom-k sketch of canonical 21-mers (backend/minhash.py) across all CPU
+cores and writes backend/data/sketch_index.npz. The backend loads it at
+startup to recognise uploads of training genomes whatever their FASTA header
+says, and to report the nearest training genomes.
+
+Usage:
+  python build_sketch_index.py
+  python build_sketch_index.py --output /tmp/sketch_index.npz
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+from extract_kmers import encode_sequence, find_fasta, read_fasta_sequences
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from minhash import SKETCH_K, SKETCH_SIZE, Sketcher, SketchIndex, save_index
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+FASTA_DIR = os.path.join(DATA_DIR, "fastas")
+PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
+OUTPUT_PATH = os.path.join(os.path.dirname(__file__), "..", "backend", "data", "sketch_index.npz")
+
+
+def sketch_genome(gid):
+    """Sketch one genome. Worker function."""
+    fasta_path = find_fasta(gid, FASTA_DIR)
+    if not os.path.exists(fasta_path):
+        return gid, None
+    sketcher = Sketcher()
+    for seq in read_fasta_sequences(fasta_path):
+        sketcher.add(encode_sequence(seq))
+    return gid, sketcher.padded()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    args = parser.parse_args()
+
+    with open(os.path.join(PROCESSED_DIR, "genome_ids.json")) as f:
+        genome_ids = json.load(f)
+
+    print(f"Sketching {len(genome_ids)} genomes (k={SKETCH_K}, {SKETCH_SIZE} hashes each, "
+          f"{args.workers} workers)...")
+    t0 = time.time()
+    sketches = {}
+    missing = 0
+    with Pool(processes=max(1, args.workers)) as pool:
+        for gid, sketch in pool.imap_unordered(sketch_genome, genome_ids, chunksize=4):
+            if sketch is None:
+                missing += 1
+            else:
+                sketches[gid] = sketch
+            done = len(sketches) + missing
+            if done % 100 == 0 or done == len(genome_ids):
+                print(f"  {done}/{len(genome_ids)}  ({done / (time.time() - t0):.1f} genomes/s)")
+
+    ids = [gid for gid in genome_ids if gid in sketches]
+    save_index(args.output, ids, [sketches[gid] for gid in ids])
+    print(f"\nSaved {len(ids)} sketches to {args.output} "
+          f"({os.path.getsize(args.output) / 1e6:.1f} MB) in {time.time() - t0:.0f}s")
+    if missing:
+        print(f"  WARNING: {missing} genomes had missing FASTA files")
+
+    index = SketchIndex(args.output)
+    print(f"  Index load time: {index.load_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,18 @@
 """
-extract_kmers.py — Compute 6-mer frequency vectors from FASTA genome sequences.
+extract_kmers.py — Compute 6-mer count vectors from FASTA genome sequences.
 
 Reads each genome's FASTA file, counts all 6-mer occurrences across contigs,
-normalizes to frequencies, and saves as a numpy feature matrix.
+and saves the raw counts as a numpy matrix (normalized lazily by feature_store.py).
+Rows of genomes counted by stream_features.py are copied from its store; genomes
+with neither (reads only, see extract_kmers_fast.py) get a zero row and a warning.
 """
 
 import numpy as np
+import gzip
 import json
 import os
 from itertools import product
+from feature_store import save_counts
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 FASTA_DIR = os.path.join(DATA_DIR, "fastas")
@@ -24,10 +28,79 @@ def build_kmer_index():
     return {kmer: i for i, kmer in enumerate(kmers)}
 
 
+# Byte -> 2-bit base code lookup (A=0, C=1, G=2, T=3, anything else=4).
+# Matches the column order of build_kmer_index().
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for _i, _b in enumerate(BASES):
+    BASE_CODES[ord(_b)] = _i
+    BASE_CODES[ord(_b.lower())] = _i
+
+
+def encode_sequence(seq):
+    """Map a sequence (str or bytes) to an array of 2-bit base codes (4 = not ACGT)."""
+    if isinstance(seq, str):
+        seq = seq.encode("ascii", "replace")
+    return BASE_CODES[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def add_kmer_counts(codes, counts, k=K, mask=None):
+    """Add k-mer occurrences from an encoded contig into counts (in place).
+
+    Vectorized equivalent of sliding a window over the contig and looking each
+    k-mer up in build_kmer_index(): windows touching a non-ACGT base are skipped,
+    as are start positions where mask (one bool per k-mer start) is False.
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return counts
+    invalid = np.concatenate(([0], np.cumsum(codes > 3, dtype=np.int64)))
+    valid = (invalid[k:] - invalid[:-k]) == 0
+    if mask is not None:
+        valid &= mask
+    idx = np.zeros(n, dtype=np.int64)
+    for j in range(k):
+        idx <<= 2
+        idx |= codes[j : j + n] & 3
+    counts += np.bincount(idx[valid], minlength=len(counts))
+    return counts
+
+
+def sample_windows(contigs_codes, fraction, window=2000, seed=562):
+    """Deterministic stratified sample of ~fraction of a genome's bases, as one encoded array.
+
+    The contigs are laid end to end and cut into equal strata, one per window;
+    each stratum contributes one window at a seeded offset, so the sample
+    covers the whole genome and is the same on every call. Windows are joined
+    with a non-ACGT code between them, so add_kmer_counts() never counts a
+    k-mer that spans two windows or two contigs.
+    """
+    if not contigs_codes:
+        return np.empty(0, dtype=np.uint8)
+    codes = np.concatenate([np.append(c, np.uint8(4)) for c in contigs_codes])
+    n_windows = max(1, int(round(len(codes) * fraction / window)))
+    if n_windows * window >= len(codes):
+        return codes
+    stratum = len(codes) / n_windows
+    offsets = np.random.default_rng(seed).random(n_windows) * (stratum - window)
+    starts = (np.arange(n_windows) * stratum + offsets).astype(np.int64)
+    sample = np.full((n_windows, window + 1), 4, dtype=np.uint8)
+    sample[:, :window] = codes[starts[:, None] + np.arange(window)]
+    return sample.ravel()
+
+
+def find_fasta(genome_id, fasta_dir=FASTA_DIR):
+    """Return the path of a genome's FASTA (plain or .gz), or the plain path if neither exists."""
+    fasta_path = os.path.join(fasta_dir, f"{genome_id}.fasta")
+    if not os.path.exists(fasta_path) and os.path.exists(fasta_path + ".gz"):
+        return fasta_path + ".gz"
+    return fasta_path
+
+
 def read_fasta_sequences(fasta_path):
-    """Read a FASTA file and yield uppercase sequence strings (one per contig)."""
+    """Read a FASTA file (optionally .gz) and yield uppercase sequence strings (one per contig)."""
     sequence = []
-    with open(fasta_path, "r") as f:
+    opener = gzip.open if fasta_path.endswith(".gz") else open
+    with opener(fasta_path, "rt") as f:
         for line in f:
             line = line.strip()
             if line.startswith(">"):
@@ -56,30 +129,44 @@ def main():
     with open(genome_ids_path) as f:
         genome_ids = json.load(f)
 
-    print(f"Extracting {K}-mer frequencies for {len(genome_ids)} genomes...")
+    print(f"Extracting {K}-mer counts for {len(genome_ids)} genomes...")
     kmer_index = build_kmer_index()
     kmer_names = sorted(kmer_index, key=kmer_index.get)
     n_features = len(kmer_index)
     print(f"  Feature space: {n_features} {K}-mers")
 
-    feature_matrix = np.zeros((len(genome_ids), n_features), dtype=np.float32)
+    count_matrix = np.zeros((len(genome_ids), n_features), dtype=np.uint32)
 
-    for i, gid in enumerate(genome_ids):
-        fasta_path = os.path.join(FASTA_DIR, f"{gid}.fasta")
-        counts = count_kmers(fasta_path, kmer_index)
+    # Imported here: stream_features imports this module
+    from stream_features import load_stream_store
+    stream_manifest, stream_rows = load_stream_store()
+    reused = 0
+    missing = []
 
-        # Normalize to frequencies
-        total = counts.sum()
-        if total > 0:
-            feature_matrix[i] = (counts / total).astype(np.float32)
+    for i, gid in enumerate(genome_ids):
+        if gid in stream_manifest:
+            count_matrix[i] = stream_rows[stream_manifest[gid]]
+            reused += 1
+        else:
+            fasta_path = find_fasta(gid)
+            if os.path.exists(fasta_path):
+                count_matrix[i] = count_kmers(fasta_path, kmer_index)
+            else:
+                missing.append(gid)
 
         if (i + 1) % 25 == 0 or i == 0:
             print(f"  Processed {i + 1}/{len(genome_ids)} genomes")
+    del stream_rows
+
+    print(f"  Reused from stream store: {reused}")
+    if missing:
+        print(f"  WARNING: {len(missing)} genomes had missing FASTA files (zero rows; "
+              f"extract_kmers_fast.py also counts reads and the archive): {missing[:10]}")
 
     # Save outputs
-    features_path = os.path.join(PROCESSED_DIR, "kmer_features.npy")
-    np.save(features_path, feature_matrix)
-    print(f"\nSaved feature matrix {feature_matrix.shape} to {features_path}")
+    counts_path = os.path.join(PROCESSED_DIR, "kmer_counts.npy")
+    dtype = save_counts(count_matrix, counts_path)
+    print(f"\nSaved count matrix {count_matrix.shape} ({dtype}) to {counts_path}")
 
     kmer_names_path = os.path.join(PROCESSED_DIR, "kmer_names.json")
     with open(kmer_names_path, "w") as f:
@@ -87,7 +174,7 @@ def main():
     print(f"Saved k-mer names to {kmer_names_path}")
 
     # Quick sanity check
-    nonzero_per_genome = (feature_matrix > 0).sum(axis=1)
+    nonzero_per_genome = (count_matrix > 0).sum(axis=1)
     print(f"\nSanity check:")
     print(f"  Mean non-zero features per genome: {nonzero_per_genome.mean():.0f} / {n_features}")
     print(f"  Min: {nonzero_per_genome.min()}, Max: {nonzero_per_genome.max()}")
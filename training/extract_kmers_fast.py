@@ -2,7 +2,12 @@
 extract_kmers_fast.py — Parallel 6-mer extraction using multiprocessing.
 
 Same input/output as extract_kmers.py but distributes genome processing
-across all CPU cores via multiprocessing.Pool.
+across all CPU cores via multiprocessing.Pool. Genomes already counted by
+stream_features.py are copied from its store instead of re-reading FASTAs,
+genomes in the packed archive (genome_archive.py) are read from it without
+parsing, and genomes with reads but no assembly are counted from data/fastqs/
+(fastq_kmers.py).
+Writes raw counts to processed/kmer_counts.npy (see feature_store.py).
 
 Usage: python extract_kmers_fast.py
 """
@@ -12,7 +17,11 @@ import json
 import os
 import time
 from multiprocessing import Pool, cpu_count
-from extract_kmers import build_kmer_index, read_fasta_sequences, K
+from extract_kmers import build_kmer_index, find_fasta, read_fasta_sequences, encode_sequence, add_kmer_counts, K
+from fastq_kmers import assembly_equivalent, count_reads, find_fastqs
+from genome_archive import GenomeArchive
+from feature_store import save_counts
+from stream_features import load_stream_store
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 FASTA_DIR = os.path.join(DATA_DIR, "fastas")
@@ -22,27 +31,36 @@ PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
 KMER_INDEX = build_kmer_index()
 N_FEATURES = len(KMER_INDEX)
 
+_ARCHIVE = None  # opened once per worker process
+
+
+def archive():
+    """The packed genome archive (genome_archive.py), or False when there is none."""
+    global _ARCHIVE
+    if _ARCHIVE is None:
+        _ARCHIVE = GenomeArchive.open() or False
+    return _ARCHIVE
+
 
 def process_genome(gid):
-    """Count and normalize k-mers for a single genome. Worker function."""
-    fasta_path = os.path.join(FASTA_DIR, f"{gid}.fasta")
+    """Count k-mers for a single genome (archive, else FASTA, else reads). Worker function."""
+    packed = archive()
+    if packed and gid in packed:
+        return gid, packed.count_kmers(gid).astype(np.uint32), True
+
+    fasta_path = find_fasta(gid, FASTA_DIR)
     if not os.path.exists(fasta_path):
-        return gid, np.zeros(N_FEATURES, dtype=np.float32), False
+        fastq_paths = find_fastqs(gid)
+        if fastq_paths:
+            counts, stats = count_reads(fastq_paths)
+            return gid, assembly_equivalent(counts, stats), True
+        return gid, np.zeros(N_FEATURES, dtype=np.uint32), False
 
-    counts = np.zeros(N_FEATURES, dtype=np.float64)
+    counts = np.zeros(N_FEATURES, dtype=np.int64)
     for seq in read_fasta_sequences(fasta_path):
-        for i in range(len(seq) - K + 1):
-            kmer = seq[i : i + K]
-            if kmer in KMER_INDEX:
-                counts[KMER_INDEX[kmer]] += 1
-
-    total = counts.sum()
-    if total > 0:
-        freq = (counts / total).astype(np.float32)
-    else:
-        freq = counts.astype(np.float32)
+        add_kmer_counts(encode_sequence(seq), counts)
 
-    return gid, freq, True
+    return gid, counts.astype(np.uint32), True
 
 
 def main():
@@ -50,31 +68,40 @@ def main():
     with open(genome_ids_path) as f:
         genome_ids = json.load(f)
 
-    n_workers = min(cpu_count(), len(genome_ids))
     kmer_names = sorted(KMER_INDEX, key=KMER_INDEX.get)
+    count_matrix = np.zeros((len(genome_ids), N_FEATURES), dtype=np.uint32)
+    gid_to_idx = {gid: i for i, gid in enumerate(genome_ids)}
+
+    # Reuse rows already counted while streaming
+    stream_manifest, stream_rows = load_stream_store()
+    reused = [gid for gid in genome_ids if gid in stream_manifest]
+    for gid in reused:
+        count_matrix[gid_to_idx[gid]] = stream_rows[stream_manifest[gid]]
+    todo = [gid for gid in genome_ids if gid not in stream_manifest]
+    del stream_rows
+
+    n_workers = max(1, min(cpu_count(), len(todo)))
 
-    print(f"Extracting {K}-mer frequencies for {len(genome_ids)} genomes...")
+    print(f"Extracting {K}-mer counts for {len(genome_ids)} genomes...")
     print(f"  Feature space: {N_FEATURES} {K}-mers")
+    print(f"  Reused from stream store: {len(reused)}")
     print(f"  Workers: {n_workers} CPU cores")
 
-    feature_matrix = np.zeros((len(genome_ids), N_FEATURES), dtype=np.float32)
-    gid_to_idx = {gid: i for i, gid in enumerate(genome_ids)}
-
     t0 = time.time()
     completed = 0
     failed = 0
 
     with Pool(processes=n_workers) as pool:
-        for gid, freq, ok in pool.imap_unordered(process_genome, genome_ids, chunksize=8):
+        for gid, counts, ok in pool.imap_unordered(process_genome, todo, chunksize=8):
             idx = gid_to_idx[gid]
-            feature_matrix[idx] = freq
+            count_matrix[idx] = counts
             completed += 1
             if not ok:
                 failed += 1
-            if completed % 50 == 0 or completed == len(genome_ids):
+            if completed % 50 == 0 or completed == len(todo):
                 elapsed = time.time() - t0
                 rate = completed / elapsed
-                print(f"  {completed}/{len(genome_ids)} genomes  ({rate:.1f}/s)")
+                print(f"  {completed}/{len(todo)} genomes  ({rate:.1f}/s)")
 
     elapsed = time.time() - t0
     print(f"\nDone in {elapsed:.1f}s ({len(genome_ids)/elapsed:.1f} genomes/s)")
@@ -82,9 +109,10 @@ def main():
         print(f"  WARNING: {failed} genomes had missing FASTA files")
 
     # Save outputs (same paths as extract_kmers.py)
-    features_path = os.path.join(PROCESSED_DIR, "kmer_features.npy")
-    np.save(features_path, feature_matrix)
-    print(f"Saved feature matrix {feature_matrix.shape} to {features_path}")
+    counts_path = os.path.join(PROCESSED_DIR, "kmer_counts.npy")
+    dtype = save_counts(count_matrix, counts_path)
+    size_mb = count_matrix.shape[0] * count_matrix.shape[1] * dtype.itemsize / 1e6
+    print(f"Saved count matrix {count_matrix.shape} ({dtype}, {size_mb:.1f} MB) to {counts_path}")
 
     kmer_names_path = os.path.join(PROCESSED_DIR, "kmer_names.json")
     with open(kmer_names_path, "w") as f:
@@ -92,7 +120,7 @@ def main():
     print(f"Saved k-mer names to {kmer_names_path}")
 
     # Sanity check
-    nonzero_per_genome = (feature_matrix > 0).sum(axis=1)
+    nonzero_per_genome = (count_matrix > 0).sum(axis=1)
     print(f"\nSanity check:")
     print(f"  Mean non-zero features per genome: {nonzero_per_genome.mean():.0f} / {N_FEATURES}")
     print(f"  Min: {nonzero_per_genome.min()}, Max: {nonzero_per_genome.max()}")
@@ -0,0 +1,278 @@
+"""
+fastq_kmers.py — 6-mer count vectors straight from sequencing reads (FASTQ, optionally gzipped).
+
+Labs get predictions without assembling first. Reads are streamed in batches
+of BATCH_BASES bases (joined with N so nothing spans two reads) in two
+passes over the file:
+
+  1. every canonical SOLID_K-mer is added to a count-min sketch
+     (SKETCH_DEPTH rows x 2**SKETCH_WIDTH_BITS saturating uint8 counters)
+  2. a SOLID_K-mer is solid when its sketch estimate reaches min_abundance;
+     each 6-mer is counted only if it lies inside a solid SOLID_K-mer, so
+     6-mers overlapping a sequencing error (whose long k-mers occur once or
+     twice) are dropped
+
+Memory is the sketch plus one batch (~200 MB by default), whatever the file
+size. The counts are coverage-scaled, but normalizing them to frequencies
+gives the same 4096-dim feature space as an assembly. Reads come from both
+strands while an assembly is counted on one, so read features are the
+strand-averaged version; 6-mer frequencies of bacterial genomes are close to
+strand-symmetric, so the difference is small.
+
+The sketch also gives the genome size (sum of 1 / estimate over solid k-mer
+occurrences counts each distinct k-mer once) and the coverage.
+
+The training extractors fall back to data/fastqs/<genome id>*.fastq[.gz]
+(find_fastqs) for genomes that have no FASTA, storing assembly_equivalent()
+counts; the backend serves the same path at /api/analyze_reads.
+
+Usage:
+  python fastq_kmers.py reads_R1.fastq.gz reads_R2.fastq.gz
+  python fastq_kmers.py reads.fastq --min-abundance 5
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import time
+
+import numpy as np
+
+from extract_kmers import K, add_kmer_counts, encode_sequence
+
+SOLID_K = 21
+MIN_ABUNDANCE = 3
+SKETCH_DEPTH = 2
+SKETCH_WIDTH_BITS = 25  # 32 MB per row
+BATCH_BASES = 1 << 21
+SEED = 0x9E3779B97F4A7C15
+FASTQ_SUFFIXES = (".fastq", ".fq", ".fastq.gz", ".fq.gz")
+FASTQ_DIR = os.path.join(os.path.dirname(__file__), "data", "fastqs")
+
+
+def is_fastq(path):
+    return path.lower().endswith(FASTQ_SUFFIXES)
+
+
+def find_fastqs(genome_id, fastq_dir=FASTQ_DIR):
+    """Read files of a genome without an assembly: <id>.fastq[.gz], or mates <id>_1 / <id>_2 etc."""
+    paths = glob.glob(os.path.join(fastq_dir, f"{glob.escape(genome_id)}.*")) + glob.glob(
+        os.path.join(fastq_dir, f"{glob.escape(genome_id)}_*")
+    )
+    return sorted(p for p in paths if is_fastq(p))
+
+
+def assembly_equivalent(counts, stats):
+    """Read counts scaled down by the k-mer coverage, to the magnitude of an assembly's counts.
+
+    Frequencies are unchanged (up to rounding); the count store keeps its narrow dtype.
+    """
+    coverage = max(stats["est_coverage"], 1.0)
+    return np.rint(counts / coverage).astype(np.uint32)
+
+
+def open_reads(path):
+    """Binary file object for a FASTQ path, gunzipping by content rather than by name."""
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rb") if gzipped else open(path, "rb")
+
+
+def read_batches(paths, batch_bases=BATCH_BASES):
+    """Yield (encoded bases of a batch of reads, separated by N; number of reads)."""
+    seqs, n_bases = [], 0
+    for path in paths:
+        with open_reads(path) as f:
+            for i, line in enumerate(f):
+                if i % 4 != 1:  # header, sequence, +, quality
+                    continue
+                seq = line.rstrip()
+                seqs.append(seq)
+                n_bases += len(seq)
+                if n_bases >= batch_bases:
+                    yield encode_sequence(b"N".join(seqs)), len(seqs)
+                    seqs, n_bases = [], 0
+    if seqs:
+        yield encode_sequence(b"N".join(seqs)), len(seqs)
+
+
+def _mix64(x):
+    """splitmix64 finalizer: a well-mixed 64-bit hash of packed k-mers."""
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(SEED)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _packed(bits, width, n, reverse=False):
+    """2-bit packed width-mers at n start positions, built by doubling (log2(width) shifts, not width).
+
+    reverse packs right to left, which on complemented bases gives the reverse complement.
+    """
+    packed, size = bits, 1
+    parts = []
+    while size * 2 <= width:
+        if width & size:
+            parts.append((size, packed))
+        m = len(packed) - size
+        if reverse:
+            packed = packed[:m] | (packed[size : size + m] << np.uint64(2 * size))
+        else:
+            packed = (packed[:m] << np.uint64(2 * size)) | packed[size : size + m]
+        size *= 2
+    result, done = packed[:n], size
+    for part_size, part in reversed(parts):
+        if reverse:
+            result = result | (part[done : done + n] << np.uint64(2 * done))
+        else:
+            result = (result << np.uint64(2 * part_size)) | part[done : done + n]
+        done += part_size
+    return result
+
+
+def canonical_kmers(codes, k=SOLID_K):
+    """2-bit packed canonical k-mer at every start position, and whether it is free of N."""
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=bool)
+    invalid = np.concatenate(([0], np.cumsum(codes > 3, dtype=np.int64)))
+    valid = (invalid[k:] - invalid[:-k]) == 0
+    bits = (codes & 3).astype(np.uint64)
+    forward = _packed(bits, k, n)
+    reverse = _packed(np.uint64(3) - bits, k, n, reverse=True)
+    return np.minimum(forward, reverse), valid
+
+
+class CountMinSketch:
+    """Count-min sketch of 64-bit keys with saturating uint8 counters.
+
+    One hash per key; each row takes its own width_bits slice of it, so
+    depth * width_bits must fit in 64 bits.
+    """
+
+    def __init__(self, depth=SKETCH_DEPTH, width_bits=SKETCH_WIDTH_BITS):
+        if depth * width_bits > 64:
+            raise ValueError(f"{depth} rows of {width_bits} bits need more than one 64-bit hash")
+        self.depth = depth
+        self.width_bits = width_bits
+        self.table = np.zeros((depth, 1 << width_bits), dtype=np.uint8)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def _slots(self, keys):
+        hashes = _mix64(keys)
+        mask = np.uint64((1 << self.width_bits) - 1)
+        for row in range(self.depth):
+            yield row, ((hashes >> np.uint64(row * self.width_bits)) & mask).astype(np.uint32)
+
+    def add(self, keys):
+        for row, slots in self._slots(keys):
+            # Sorting beats np.add.at; counts per slot are added once, saturating at 255
+            slots.sort()
+            if not len(slots):
+                continue
+            starts = np.flatnonzero(np.concatenate(([True], slots[1:] != slots[:-1])))
+            unique = slots[starts]
+            hits = np.diff(np.append(starts, len(slots)))
+            current = self.table[row, unique].astype(np.int64)
+            self.table[row, unique] = np.minimum(current + hits, 255)
+
+    def estimate(self, keys):
+        est = np.full(len(keys), 255, dtype=np.uint8)
+        for row, slots in self._slots(keys):
+            np.minimum(est, self.table[row, slots], out=est)
+        return est
+
+
+def solid_mask(solid, n, k=K, solid_k=SOLID_K):
+    """For each k-mer start in a batch of n bases: does it lie inside a solid solid_k-mer?
+
+    It does when the nearest solid solid_k-mer starting at or before it starts
+    at most solid_k - k bases earlier.
+    """
+    n_small = n - k + 1
+    if n_small <= 0:
+        return np.empty(0, dtype=bool)
+    last = np.full(n_small, -solid_k, dtype=np.int64)
+    if len(solid):
+        last[: len(solid)] = np.where(solid, np.arange(len(solid)), -solid_k)
+        np.maximum.accumulate(last, out=last)
+    return np.arange(n_small) - last <= solid_k - k
+
+
+def count_reads(paths, min_abundance=MIN_ABUNDANCE, depth=SKETCH_DEPTH, width_bits=SKETCH_WIDTH_BITS,
+                batch_bases=BATCH_BASES):
+    """Raw 6-mer counts (int64, 4**K) of the error-filtered reads, and throughput / coverage stats."""
+    if isinstance(paths, str):
+        paths = [paths]
+    sketch = CountMinSketch(depth, width_bits)
+
+    t0 = time.perf_counter()
+    n_reads = n_bases = 0
+    for codes, batch_reads in read_batches(paths, batch_bases):
+        kmers, valid = canonical_kmers(codes)
+        sketch.add(kmers[valid])
+        n_reads += batch_reads
+        n_bases += int((codes < 4).sum())
+    pass1 = time.perf_counter() - t0
+
+    counts = np.zeros(4 ** K, dtype=np.int64)
+    solid_total = valid_total = 0
+    distinct = 0.0
+    gc = 0
+    t1 = time.perf_counter()
+    for codes, _ in read_batches(paths, batch_bases):
+        kmers, valid = canonical_kmers(codes)
+        est = np.zeros(len(kmers), dtype=np.uint8)
+        est[valid] = sketch.estimate(kmers[valid])
+        solid = est >= min_abundance
+        add_kmer_counts(codes, counts, mask=solid_mask(solid, len(codes)))
+        solid_total += int(solid.sum())
+        valid_total += int(valid.sum())
+        distinct += float((1.0 / est[solid]).sum())
+        gc += int(((codes == 1) | (codes == 2)).sum())
+    pass2 = time.perf_counter() - t1
+
+    elapsed = pass1 + pass2
+    stats = {
+        "reads": n_reads,
+        "bases": n_bases,
+        "gc_content": round(gc / n_bases, 4) if n_bases else None,
+        "min_abundance": min_abundance,
+        "solid_fraction": round(solid_total / valid_total, 4) if valid_total else 0.0,
+        # Saturated counters cap estimates at 255, so very deep coverage overestimates size
+        "est_genome_size": int(round(distinct)),
+        "est_coverage": round(solid_total / distinct, 1) if distinct else 0.0,
+        "kmers_counted": int(counts.sum()),
+        "sketch_mb": round(sketch.nbytes / 1e6, 1),
+        "pass1_seconds": round(pass1, 2),
+        "pass2_seconds": round(pass2, 2),
+        "reads_per_sec": round(n_reads / elapsed) if elapsed > 0 else None,
+        "mbases_per_sec": round(n_bases / elapsed / 1e6, 2) if elapsed > 0 else None,
+    }
+    return counts, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("reads", nargs="+", help="FASTQ files (.gz ok), e.g. both mates of a pair")
+    parser.add_argument("--min-abundance", type=int, default=MIN_ABUNDANCE)
+    parser.add_argument("--width-bits", type=int, default=SKETCH_WIDTH_BITS,
+                        help="log2 counters per sketch row (raise for very deep runs)")
+    parser.add_argument("--output", help="save the raw 6-mer counts as .npy")
+    args = parser.parse_args()
+
+    counts, stats = count_reads(args.reads, args.min_abundance, width_bits=args.width_bits)
+    print(json.dumps(stats, indent=2))
+    if args.output:
+        np.save(args.output, counts)
+        print(f"Saved counts to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+feature_precision_report.py — What float16 features do to the trained models.
+
+Loads the count store twice (float32 and float16 frequencies), runs every
+model in models/ on both and reports, per antibiotic, the largest change in
+predicted probability, how many R/S calls flip and the accuracy of each mode
+against the lab labels. Also lists the in-memory / on-disk size of counts,
+float32 and float16 matrices. Written to data/processed/feature_precision.json.
+
+Usage:
+  python feature_precision_report.py
+  python feature_precision_report.py --models-dir ../models/versions/v2
+"""
+
+import argparse
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from feature_store import COUNTS_PATH, PROCESSED_DIR, load_counts, load_features
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+REPORT_PATH = os.path.join(PROCESSED_DIR, "feature_precision.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--output", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    X32 = load_features("float32")
+    X16 = load_features("float16")
+    # XGBoost evaluates in float32; float16 mode = float16 storage, widened at predict time
+    X16_wide = X16.astype(np.float32)
+    labels = pd.read_csv(os.path.join(PROCESSED_DIR, "label_matrix.csv"), index_col=0)
+
+    sizes = {
+        "float32_mb": round(X32.nbytes / 1e6, 2),
+        "float16_mb": round(X16.nbytes / 1e6, 2),
+    }
+    if os.path.exists(COUNTS_PATH):
+        counts = load_counts(mmap_mode="r")
+        sizes["counts_dtype"] = str(counts.dtype)
+        sizes["counts_mb"] = round(counts.nbytes / 1e6, 2)
+        sizes["counts_file_mb"] = round(os.path.getsize(COUNTS_PATH) / 1e6, 2)
+    print(f"Features: {X32.shape}  " + "  ".join(f"{k}={v}" for k, v in sizes.items()))
+
+    per_antibiotic = {}
+    for antibiotic in labels.columns:
+        model_path = os.path.join(args.models_dir, f"{antibiotic.replace('/', '_')}.joblib")
+        if not os.path.exists(model_path):
+            continue
+        model = joblib.load(model_path)
+        p32 = model.predict_proba(X32)[:, 1]
+        p16 = model.predict_proba(X16_wide)[:, 1]
+
+        col = labels[antibiotic].values
+        mask = col != -1
+        y = col[mask].astype(int)
+        acc32 = float(np.mean((p32[mask] >= 0.5) == y)) if mask.any() else None
+        acc16 = float(np.mean((p16[mask] >= 0.5) == y)) if mask.any() else None
+
+        per_antibiotic[antibiotic] = {
+            "max_abs_dp": float(np.abs(p16 - p32).max()),
+            "mean_abs_dp": float(np.abs(p16 - p32).mean()),
+            "flipped_calls": int(((p32 >= 0.5) != (p16 >= 0.5)).sum()),
+            "accuracy_float32": round(acc32, 4) if acc32 is not None else None,
+            "accuracy_float16": round(acc16, 4) if acc16 is not None else None,
+            "n_labeled": int(mask.sum()),
+        }
+        r = per_antibiotic[antibiotic]
+        print(f"  {antibiotic:32s} max|dp|={r['max_abs_dp']:.2e}  flips={r['flipped_calls']}  "
+              f"acc {r['accuracy_float32']} -> {r['accuracy_float16']}")
+
+    report = {
+        "n_genomes": int(X32.shape[0]),
+        "n_features": int(X32.shape[1]),
+        "sizes": sizes,
+        "antibiotics": per_antibiotic,
+        "total_flipped_calls": sum(r["flipped_calls"] for r in per_antibiotic.values()),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nTotal flipped calls: {report['total_flipped_calls']}")
+    print(f"Saved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
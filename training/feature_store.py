@@ -0,0 +1,116 @@
+"""
+feature_store.py — Raw k-mer count storage with lazy normalization.
+
+The extractors save data/processed/kmer_counts.npy: raw k-mer counts per
+genome, in the narrowest unsigned integer dtype that holds the largest count
+(uint16 for typical E. coli 6-mer counts, half the size of float32
+frequencies). Counts, unlike frequencies, can be summed across contigs or
+shards and re-normalized later.
+
+load_features() normalizes rows to frequencies when the matrix is read, in
+blocks so the float64 intermediate stays small. dtype="float16" returns
+half-precision frequencies; feature_precision_report.py measures what that
+does to model outputs. Older trees with only kmer_features.npy still load.
+
+open_features() is the out-of-core variant: a LazyFeatures view over the
+memory-mapped store that normalizes only the rows it is indexed with, so
+training on corpora larger than RAM reads one batch at a time
+(xgb_engine.StreamedFeatures).
+"""
+
+import os
+
+import numpy as np
+
+PROCESSED_DIR = os.path.join(os.path.dirname(__file__), "data", "processed")
+COUNTS_PATH = os.path.join(PROCESSED_DIR, "kmer_counts.npy")
+
+NORMALIZE_BLOCK_ROWS = 4096
+
+
+def narrowest_uint(max_value):
+    """Smallest unsigned integer dtype that can represent max_value."""
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"count {max_value} does not fit in uint64")
+
+
+def save_counts(counts, path=COUNTS_PATH):
+    """Save a (genomes x k-mers) count matrix in its narrowest dtype. Returns the dtype."""
+    counts = np.asarray(counts)
+    dtype = narrowest_uint(int(counts.max()) if counts.size else 0)
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, counts.astype(dtype, copy=False))
+    os.replace(tmp_path, path)
+    return dtype
+
+
+def load_counts(path=COUNTS_PATH, mmap_mode=None):
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def normalize(counts, dtype=np.float32):
+    """Rows of counts -> frequency rows (same arithmetic the extractors used to apply)."""
+    counts = np.asarray(counts)
+    out = np.zeros(counts.shape, dtype=dtype)
+    for start in range(0, counts.shape[0], NORMALIZE_BLOCK_ROWS):
+        block = counts[start : start + NORMALIZE_BLOCK_ROWS].astype(np.float64)
+        totals = block.sum(axis=1, keepdims=True)
+        np.divide(block, totals, out=block, where=totals > 0)
+        # Round through float32 first so float16 mode is float32 features, rounded
+        out[start : start + NORMALIZE_BLOCK_ROWS] = block.astype(np.float32).astype(dtype)
+    return out
+
+
+def normalize_row(counts, dtype=np.float32):
+    """Single count vector -> frequency vector."""
+    return normalize(np.asarray(counts).reshape(1, -1), dtype)[0]
+
+
+def load_features(dtype="float32", processed_dir=PROCESSED_DIR):
+    """Load the feature matrix as normalized frequencies (float32 or float16)."""
+    dtype = np.dtype(dtype)
+    counts_path = os.path.join(processed_dir, "kmer_counts.npy")
+    if os.path.exists(counts_path):
+        return normalize(load_counts(counts_path, mmap_mode="r"), dtype)
+    # Trees extracted before the count store existed
+    features = np.load(os.path.join(processed_dir, "kmer_features.npy"))
+    return features.astype(dtype, copy=False)
+
+
+class LazyFeatures:
+    """Frequency rows of a memory-mapped count store, normalized when indexed.
+
+    features[rows] (a slice or an index array) reads and normalizes just
+    those rows; nothing else is held in memory.
+    """
+
+    def __init__(self, source, dtype=np.float32, counts=True):
+        self.source = source
+        self.dtype = np.dtype(dtype)
+        self.counts = counts
+        self.shape = source.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        """Size the normalized matrix would have in memory."""
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def __getitem__(self, rows):
+        block = self.source[rows]
+        if self.counts:
+            return normalize(block.reshape(-1, self.shape[1]), self.dtype).reshape(block.shape)
+        return np.asarray(block, dtype=self.dtype)
+
+
+def open_features(dtype="float32", processed_dir=PROCESSED_DIR):
+    """The feature matrix as a LazyFeatures view (memory-mapped, normalized per access)."""
+    counts_path = os.path.join(processed_dir, "kmer_counts.npy")
+    if os.path.exists(counts_path):
+        return LazyFeatures(load_counts(counts_path, mmap_mode="r"), dtype)
+    return LazyFeatures(np.load(os.path.join(processed_dir, "kmer_features.npy"), mmap_mode="r"),
+                        dtype, counts=False)
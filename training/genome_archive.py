@@ -0,0 +1,338 @@
+"""
+genome_archive.py — One-time conversion of the FASTA corpus into a packed 2-bit archive.
+
+Parsing thousands of text FASTAs line by line dominates every re-extraction.
+The archive stores each genome once in a form that is read with no parsing:
+
+  processed/genome_archive/bases.2bit   4 bases per byte (A=0 C=1 G=2 T=3, first
+                                        base in the high bits); every contig
+                                        starts on a byte boundary, and a genome's
+                                        contigs are contiguous
+  processed/genome_archive/index.npz    genome_ids, per-genome ranges into the
+                                        contig table, contig byte offsets and
+                                        lengths, and the N mask: (start, length)
+                                        runs of non-ACGT bases per contig (packed
+                                        as A), plus a meta JSON
+
+bases.2bit is opened with np.memmap, so a genome is unpacked from the page
+cache with a few vectorized shifts; k-mer counts for any k and GC stats run
+on that (GC straight from the packed bytes through a per-byte lookup table).
+About 4x smaller than plain FASTA text. extract_kmers_fast.py reads genomes
+from the archive when it has them.
+
+Re-runs append genomes that are not archived yet; an interrupted run loses
+nothing already indexed.
+
+Usage:
+  python genome_archive.py                 # archive the genomes in genome_ids.json
+  python genome_archive.py --all           # every FASTA in data/fastas
+  python genome_archive.py --check 20      # verify 20 genomes against their FASTAs, time both
+"""
+
+import argparse
+import functools
+import json
+import os
+import time
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from extract_kmers import K, add_kmer_counts, encode_sequence, find_fasta, read_fasta_sequences
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+FASTA_DIR = os.path.join(DATA_DIR, "fastas")
+PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
+ARCHIVE_DIR = os.path.join(PROCESSED_DIR, "genome_archive")
+ARCHIVE_FORMAT_VERSION = 1
+
+# Number of G/C bases (codes 1 and 2) in each packed byte
+GC_PER_BYTE = np.zeros(256, dtype=np.uint8)
+for _byte in range(256):
+    GC_PER_BYTE[_byte] = sum(((_byte >> shift) & 3) in (1, 2) for shift in (6, 4, 2, 0))
+
+
+def pack_contig(codes):
+    """(packed bytes, N run starts, N run lengths) of one encoded contig."""
+    invalid = codes > 3
+    bases = np.where(invalid, 0, codes).astype(np.uint8)
+    bases = np.concatenate((bases, np.zeros(-len(bases) % 4, dtype=np.uint8))).reshape(-1, 4)
+    packed = (bases[:, 0] << 6) | (bases[:, 1] << 4) | (bases[:, 2] << 2) | bases[:, 3]
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], invalid.astype(np.int8), [0]))))
+    starts, ends = edges[0::2], edges[1::2]
+    return packed, starts, ends - starts
+
+
+def unpack_contig(packed, length, run_starts=(), run_lengths=()):
+    """Base codes (0-3, 4 under the N mask) of a packed contig."""
+    codes = np.empty((len(packed), 4), dtype=np.uint8)
+    for j, shift in enumerate((6, 4, 2, 0)):
+        np.right_shift(packed, shift, out=codes[:, j])
+    codes = codes.ravel()[:length]
+    codes &= 3
+    for start, run in zip(run_starts, run_lengths):
+        codes[start : start + run] = 4
+    return codes
+
+
+def pack_genome(gid, fasta_dir=FASTA_DIR):
+    """Worker: (gid, packed bytes, contig lengths, N runs per contig), or (gid, None, ...) without a FASTA."""
+    fasta_path = find_fasta(gid, fasta_dir)
+    if not os.path.exists(fasta_path):
+        return gid, None, None, None
+    packed, lengths, runs = [], [], []
+    for seq in read_fasta_sequences(fasta_path):
+        codes = encode_sequence(seq)
+        contig_packed, starts, run_lengths = pack_contig(codes)
+        packed.append(contig_packed)
+        lengths.append(len(codes))
+        runs.append((starts, run_lengths))
+    data = np.concatenate(packed) if packed else np.empty(0, dtype=np.uint8)
+    return gid, data, lengths, runs
+
+
+class GenomeArchive:
+    """Read side of an archive directory; bases are memory-mapped, the index is loaded."""
+
+    def __init__(self, archive_dir=ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        with np.load(os.path.join(archive_dir, "index.npz")) as index:
+            self.meta = json.loads(bytes(index["meta"]).decode())
+            self.genome_ids = index["genome_ids"].tolist()
+            self.genome_contigs = index["genome_contigs"]
+            self.contig_offset = index["contig_offset"]
+            self.contig_length = index["contig_length"]
+            self.contig_runs = index["contig_runs"]
+            self.run_start = index["run_start"]
+            self.run_length = index["run_length"]
+        if self.meta["format_version"] != ARCHIVE_FORMAT_VERSION:
+            raise ValueError(f"{archive_dir}: archive format {self.meta['format_version']}, "
+                             f"expected {ARCHIVE_FORMAT_VERSION} (rebuild it)")
+        self.row = {gid: i for i, gid in enumerate(self.genome_ids)}
+        path = os.path.join(archive_dir, "bases.2bit")
+        self.nbytes = self.meta["nbytes"]
+        self.bases = np.memmap(path, dtype=np.uint8, mode="r", shape=(self.nbytes,)) if self.nbytes else None
+
+    @classmethod
+    def open(cls, archive_dir=ARCHIVE_DIR):
+        """The archive in archive_dir, or None when there is none."""
+        if not os.path.exists(os.path.join(archive_dir, "index.npz")):
+            return None
+        return cls(archive_dir)
+
+    def __contains__(self, gid):
+        return gid in self.row
+
+    def __len__(self):
+        return len(self.genome_ids)
+
+    def _contig_range(self, gid):
+        i = self.row[gid]
+        return range(self.genome_contigs[i], self.genome_contigs[i + 1])
+
+    def _byte_range(self, contigs):
+        if not len(contigs):
+            return 0, 0
+        last = contigs[-1]
+        return int(self.contig_offset[contigs[0]]), int(self.contig_offset[last] + (self.contig_length[last] + 3) // 4)
+
+    def contigs(self, gid):
+        """Yield the encoded contigs of a genome (the arrays read_fasta_sequences + encode_sequence give)."""
+        for c in self._contig_range(gid):
+            offset, length = int(self.contig_offset[c]), int(self.contig_length[c])
+            runs = slice(self.contig_runs[c], self.contig_runs[c + 1])
+            yield unpack_contig(self.bases[offset : offset + (length + 3) // 4], length,
+                                self.run_start[runs], self.run_length[runs])
+
+    def count_kmers(self, gid, k=K):
+        """Raw k-mer counts (int64, 4**k columns in build_kmer_index order for k=6) of a genome."""
+        counts = np.zeros(4 ** k, dtype=np.int64)
+        for codes in self.contigs(gid):
+            add_kmer_counts(codes, counts, k)
+        return counts
+
+    def gc_stats(self, gid):
+        """Length, masked and ACGT bases, contig count and GC content, from the packed bytes alone."""
+        contigs = self._contig_range(gid)
+        start, end = self._byte_range(contigs)
+        # Padding and masked bases are packed as A, so they never count as G/C
+        gc = int(GC_PER_BYTE[self.bases[start:end]].sum(dtype=np.int64)) if end > start else 0
+        length = int(self.contig_length[contigs.start : contigs.stop].sum())
+        runs = slice(self.contig_runs[contigs.start], self.contig_runs[contigs.stop])
+        masked = int(self.run_length[runs].sum())
+        acgt = length - masked
+        return {
+            "length": length,
+            "contigs": len(contigs),
+            "n_bases": masked,
+            "gc_content": round(gc / acgt, 4) if acgt else None,
+        }
+
+
+def write_index(archive_dir, genome_ids, contig_lengths, contig_offsets, contig_runs, nbytes):
+    """Write index.npz atomically from per-genome contig lists."""
+    genome_contigs = np.zeros(len(genome_ids) + 1, dtype=np.int64)
+    np.cumsum([len(lengths) for lengths in contig_lengths], out=genome_contigs[1:])
+    flat_runs = [runs for genome_runs in contig_runs for runs in genome_runs]
+    run_counts = np.zeros(len(flat_runs) + 1, dtype=np.int64)
+    np.cumsum([len(starts) for starts, _ in flat_runs], out=run_counts[1:])
+    meta = {
+        "format_version": ARCHIVE_FORMAT_VERSION,
+        "encoding": "2bit ACGT, high bits first, contigs byte-aligned, N as runs",
+        "n_genomes": len(genome_ids),
+        "n_contigs": int(genome_contigs[-1]),
+        "n_bases": int(sum(sum(lengths) for lengths in contig_lengths)),
+        "nbytes": nbytes,
+        "updated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    tmp_path = os.path.join(archive_dir, "index.tmp.npz")
+    np.savez(
+        tmp_path,
+        genome_ids=np.asarray(genome_ids, dtype=str),
+        genome_contigs=genome_contigs,
+        contig_offset=np.asarray([o for offsets in contig_offsets for o in offsets], dtype=np.int64),
+        contig_length=np.asarray([n for lengths in contig_lengths for n in lengths], dtype=np.int64),
+        contig_runs=run_counts,
+        run_start=np.concatenate([s for s, _ in flat_runs] or [[]]).astype(np.int64),
+        run_length=np.concatenate([r for _, r in flat_runs] or [[]]).astype(np.int64),
+        meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+    )
+    os.replace(tmp_path, os.path.join(archive_dir, "index.npz"))
+    return meta
+
+
+def existing_contents(archive):
+    """Per-genome (ids, lengths, offsets, runs) lists of an open archive, for appending to it."""
+    ids, lengths, offsets, runs = [], [], [], []
+    for gid in archive.genome_ids:
+        contigs = archive._contig_range(gid)
+        ids.append(gid)
+        lengths.append(archive.contig_length[contigs.start : contigs.stop].tolist())
+        offsets.append(archive.contig_offset[contigs.start : contigs.stop].tolist())
+        runs.append([
+            (archive.run_start[archive.contig_runs[c] : archive.contig_runs[c + 1]],
+             archive.run_length[archive.contig_runs[c] : archive.contig_runs[c + 1]])
+            for c in contigs
+        ])
+    return ids, lengths, offsets, runs
+
+
+def build_archive(genome_ids, archive_dir=ARCHIVE_DIR, fasta_dir=FASTA_DIR, workers=None, flush_every=200):
+    """Append the genomes of genome_ids that are not archived yet. Returns (added, missing FASTA)."""
+    os.makedirs(archive_dir, exist_ok=True)
+    archive = GenomeArchive.open(archive_dir)
+    if archive is not None:
+        ids, lengths, offsets, runs = existing_contents(archive)
+        nbytes = archive.nbytes
+        del archive
+    else:
+        ids, lengths, offsets, runs, nbytes = [], [], [], [], 0
+    todo = [gid for gid in dict.fromkeys(genome_ids) if gid not in set(ids)]
+    print(f"Archive {archive_dir}: {len(ids)} genomes archived, {len(todo)} to add")
+    if not todo:
+        return 0, 0
+
+    bases_path = os.path.join(archive_dir, "bases.2bit")
+    added = missing = 0
+    t0 = time.time()
+    with open(bases_path, "ab") as out:
+        # Drop bytes of an interrupted run that never made it into the index
+        out.truncate(nbytes)
+        out.seek(nbytes)
+        workers = max(1, min(workers or cpu_count(), len(todo)))
+        pack = functools.partial(pack_genome, fasta_dir=fasta_dir)
+        with Pool(processes=workers) as pool:
+            for gid, packed, contig_lengths, contig_runs in pool.imap(pack, todo, chunksize=4):
+                if packed is None:
+                    missing += 1
+                    continue
+                contig_offsets, offset = [], nbytes
+                for n in contig_lengths:
+                    contig_offsets.append(offset)
+                    offset += (n + 3) // 4
+                out.write(packed.tobytes())
+                nbytes = offset
+                ids.append(gid)
+                lengths.append(contig_lengths)
+                offsets.append(contig_offsets)
+                runs.append(contig_runs)
+                added += 1
+                if added % flush_every == 0:
+                    out.flush()
+                    write_index(archive_dir, ids, lengths, offsets, runs, nbytes)
+                if added % 50 == 0:
+                    print(f"  {added}/{len(todo)} genomes  ({added / (time.time() - t0):.1f}/s)")
+        out.flush()
+    meta = write_index(archive_dir, ids, lengths, offsets, runs, nbytes)
+    print(f"Added {added} genomes in {time.time() - t0:.1f}s: {meta['n_genomes']} genomes, "
+          f"{meta['n_bases'] / 1e6:.0f} Mbases in {nbytes / 1e6:.1f} MB")
+    if missing:
+        print(f"  WARNING: {missing} genomes had missing FASTA files")
+    return added, missing
+
+
+def check_archive(archive, n, fasta_dir=FASTA_DIR):
+    """Compare archived genomes with their FASTAs (k-mer counts, length) and time both paths."""
+    checked = [gid for gid in archive.genome_ids if os.path.exists(find_fasta(gid, fasta_dir))][:n]
+    if not checked:
+        print("No archived genome has a FASTA to compare with")
+        return False
+    fasta_s = archive_s = 0.0
+    fasta_bytes = 0
+    ok = True
+    for gid in checked:
+        path = find_fasta(gid, fasta_dir)
+        fasta_bytes += os.path.getsize(path)
+        t0 = time.perf_counter()
+        expected = np.zeros(4 ** K, dtype=np.int64)
+        length = 0
+        for seq in read_fasta_sequences(path):
+            codes = encode_sequence(seq)
+            add_kmer_counts(codes, expected)
+            length += len(codes)
+        t1 = time.perf_counter()
+        counts = archive.count_kmers(gid)
+        t2 = time.perf_counter()
+        fasta_s, archive_s = fasta_s + t1 - t0, archive_s + t2 - t1
+        if not np.array_equal(counts, expected) or archive.gc_stats(gid)["length"] != length:
+            print(f"  MISMATCH: {gid}")
+            ok = False
+    archived_bytes = 0
+    for gid in checked:
+        start, end = archive._byte_range(archive._contig_range(gid))
+        archived_bytes += end - start
+    print(f"{len(checked)} genomes {'match' if ok else 'DO NOT match'} their FASTAs")
+    print(f"  FASTA parse + count: {fasta_s:.2f}s   archive: {archive_s:.2f}s   "
+          f"({fasta_s / max(archive_s, 1e-9):.1f}x)")
+    print(f"  size: {fasta_bytes / 1e6:.1f} MB FASTA -> {archived_bytes / 1e6:.1f} MB packed")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--all", action="store_true", help="archive every FASTA, not just genome_ids.json")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    parser.add_argument("--check", type=int, default=0, metavar="N",
+                        help="verify N archived genomes against their FASTAs instead of building")
+    args = parser.parse_args()
+
+    if args.check:
+        archive = GenomeArchive.open(args.archive_dir)
+        if archive is None:
+            raise SystemExit(f"No archive in {args.archive_dir}; build it first")
+        raise SystemExit(0 if check_archive(archive, args.check) else 1)
+
+    if args.all:
+        genome_ids = sorted(
+            name.split(".fasta")[0] for name in os.listdir(FASTA_DIR)
+            if name.endswith((".fasta", ".fasta.gz"))
+        ) if os.path.isdir(FASTA_DIR) else []
+    else:
+        with open(os.path.join(PROCESSED_DIR, "genome_ids.json")) as f:
+            genome_ids = json.load(f)
+    build_archive(genome_ids, args.archive_dir, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
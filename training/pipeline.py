@@ -0,0 +1,436 @@
+"""
+pipeline.py — Run the training scripts as a cached DAG of stages.
+
+  download -> preprocess -> archive -> extract -> train -> validate
+                                                         |-> demo
+
+Each stage declares the files it reads and writes. Before running a stage the
+orchestrator hashes (sha256 of content) its inputs, its code (the script plus
+every training/ or backend/ module it imports, transitively) and its
+parameters (the extra command-line flags). If all three match the last
+successful run and the recorded outputs are still on disk unchanged, the stage
+is a cache hit and is skipped. Since a stage's inputs are the previous stage's
+outputs, a stage that re-runs but writes identical files stops the cascade
+there.
+
+File hashes are memoized by (size, mtime) in data/.pipeline_hashes.json so
+the FASTA directory is only read in full once; run state lives in
+data/pipeline_state.json.
+
+Usage:
+  python pipeline.py                                   # everything that is stale
+  python pipeline.py train validate                    # just these (and stale upstream stages)
+  python pipeline.py --dry-run                         # show what would run and why
+  python pipeline.py --set train=--feature-dtype=float16
+  python pipeline.py --force extract                   # re-run a stage regardless of the cache
+  python pipeline.py --skip download                   # offline: use data/fastas/ as it is
+  python pipeline.py --version v7 --promote            # versioned model set for train/validate
+"""
+
+import argparse
+import ast
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+TRAINING_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TRAINING_DIR, "..", "backend")
+DATA_DIR = os.path.join(TRAINING_DIR, "data")
+PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
+FASTA_DIR = os.path.join(DATA_DIR, "fastas")
+FASTQ_DIR = os.path.join(DATA_DIR, "fastqs")
+MODELS_DIR = os.path.normpath(os.path.join(TRAINING_DIR, "..", "models"))
+DEMO_DIR = os.path.normpath(os.path.join(BACKEND_DIR, "data", "demo_genomes"))
+STATE_PATH = os.path.join(DATA_DIR, "pipeline_state.json")
+HASH_MEMO_PATH = os.path.join(DATA_DIR, ".pipeline_hashes.json")
+CODE_SEARCH_PATH = (TRAINING_DIR, os.path.normpath(BACKEND_DIR))
+HASH_CHUNK = 1 << 20
+
+# Files train_models.py writes into its model directory, and the ones precompute_genomes.py reads
+MODEL_OUTPUTS = ("*.joblib", "*_shap.json", "metrics.json", "train_timings.json",
+                 "models.bundle", "similarity_index.npz")
+DEMO_MODEL_INPUTS = ("*.joblib", "*_shap.json", "metrics.json")
+
+
+class Stage:
+    """One script run: declared input / output paths (files, directories or globs) and flags."""
+
+    def __init__(self, name, script, inputs, outputs, args=()):
+        self.name = name
+        self.script = script
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.args = list(args)
+
+    def command(self):
+        return [sys.executable, os.path.join(TRAINING_DIR, self.script), *self.args]
+
+
+def demo_genome_ids():
+    """DEMO_GENOMES ids from prepare_demo_genomes.py, read without importing it."""
+    with open(os.path.join(TRAINING_DIR, "prepare_demo_genomes.py")) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "DEMO_GENOMES":
+            return [g["genome_id"] for g in ast.literal_eval(node.value)]
+    return []
+
+
+def build_stages(version=None, promote=False, extra_args=None):
+    """The stage DAG in execution order (each stage only reads what earlier ones write)."""
+    extra_args = extra_args or {}
+    models_dir = os.path.join(MODELS_DIR, "versions", version) if version else MODELS_DIR
+    version_args = ["--version", version] if version else []
+    processed = lambda name: os.path.join(PROCESSED_DIR, name)
+
+    stages = [
+        Stage("download", os.path.join("data", "download_fastas.py"),
+              inputs=[os.path.join(DATA_DIR, "ecoli_genome_ids_full.txt")],
+              outputs=[FASTA_DIR]),
+        Stage("preprocess", "preprocess.py",
+              inputs=[os.path.join(DATA_DIR, "amr_all.csv"), FASTA_DIR, FASTQ_DIR,
+                      processed("stream_genome_ids.json")],
+              outputs=[processed("label_matrix.csv"), processed("genome_ids.json"),
+                       processed("antibiotics.json")]),
+        Stage("archive", "genome_archive.py",
+              inputs=[processed("genome_ids.json"), FASTA_DIR],
+              outputs=[processed("genome_archive")]),
+        Stage("extract", "extract_kmers_fast.py",
+              inputs=[processed("genome_ids.json"), FASTA_DIR, FASTQ_DIR, processed("genome_archive"),
+                      processed("stream_features.npy"), processed("stream_genome_ids.json")],
+              outputs=[processed("kmer_counts.npy"), processed("kmer_names.json")]),
+        Stage("train", "train_models.py",
+              inputs=[processed("label_matrix.csv"), processed("genome_ids.json"),
+                      processed("kmer_names.json"), processed("kmer_counts.npy")],
+              outputs=[os.path.join(models_dir, pattern) for pattern in MODEL_OUTPUTS],
+              args=version_args + (["--promote"] if promote else [])),
+        Stage("validate", "validate.py",
+              inputs=[processed("label_matrix.csv"), processed("genome_ids.json"),
+                      processed("kmer_names.json"), processed("kmer_counts.npy"),
+                      os.path.join(models_dir, "metrics.json")],
+              outputs=[os.path.join(models_dir, "validation_stats.json")],
+              args=version_args),
+        # precompute_genomes.py always reads the flat models/ directory
+        Stage("demo", "prepare_demo_genomes.py",
+              inputs=[os.path.join(MODELS_DIR, pattern) for pattern in DEMO_MODEL_INPUTS]
+                     + [os.path.join(DATA_DIR, "amr_all.csv"), processed("genome_ids.json")]
+                     + [os.path.join(FASTA_DIR, f"{gid}.fasta*") for gid in demo_genome_ids()],
+              outputs=[os.path.join(DEMO_DIR, "*.json")]),
+    ]
+    for stage in stages:
+        stage.args += extra_args.get(stage.name, [])
+    return stages
+
+
+def upstream(stages, stage):
+    """Stages whose declared outputs overlap this stage's inputs."""
+    deps = []
+    for other in stages:
+        if other is stage:
+            break
+        if any(_overlaps(out, inp) for out in other.outputs for inp in stage.inputs):
+            deps.append(other)
+    return deps
+
+
+def _overlaps(output, input_path):
+    output, input_path = os.path.normpath(output), os.path.normpath(input_path)
+    return (
+        output == input_path
+        or fnmatch.fnmatch(input_path, output)
+        or fnmatch.fnmatch(output, input_path)
+        or input_path.startswith(output + os.sep)
+        or output.startswith(input_path + os.sep)
+    )
+
+
+class Hasher:
+    """sha256 of files, directories and globs, memoized per file by (size, mtime_ns)."""
+
+    def __init__(self, memo_path=HASH_MEMO_PATH):
+        self.memo_path = memo_path
+        self.memo = {}
+        if os.path.exists(memo_path):
+            with open(memo_path) as f:
+                self.memo = json.load(f)
+        self.bytes_hashed = 0
+
+    def file(self, path):
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        cached = self.memo.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                digest.update(chunk)
+        self.bytes_hashed += st.st_size
+        self.memo[key] = [st.st_size, st.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def files(self, spec):
+        """Files a declared path stands for: itself, everything under a directory, or glob matches."""
+        if os.path.isdir(spec):
+            return sorted(
+                os.path.join(root, name)
+                for root, dirs, names in os.walk(spec)
+                for name in names
+            )
+        if glob.has_magic(spec):
+            return sorted(p for p in glob.glob(spec) if os.path.isfile(p))
+        return [spec] if os.path.isfile(spec) else []
+
+    def path(self, spec):
+        """Combined hash of a declared path; "missing" if it matches no files."""
+        files = self.files(spec)
+        if not files:
+            return "missing"
+        if len(files) == 1 and files[0] == spec:
+            return self.file(spec)
+        digest = hashlib.sha256()
+        base = spec if os.path.isdir(spec) else os.path.dirname(spec)
+        for path in files:
+            digest.update(f"{os.path.relpath(path, base)}\0{self.file(path)}\n".encode())
+        return digest.hexdigest()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.memo_path), exist_ok=True)
+        tmp_path = self.memo_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.memo, f)
+        os.replace(tmp_path, self.memo_path)
+
+
+def local_imports(path, search_path=CODE_SEARCH_PATH):
+    """Modules in search_path that a script imports, transitively (including itself)."""
+    seen = {}
+    pending = [os.path.abspath(path)]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        with open(current) as f:
+            source = f.read()
+        seen[current] = source
+        for node in ast.walk(ast.parse(source)):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                for directory in search_path:
+                    candidate = os.path.join(directory, name.split(".")[0] + ".py")
+                    if os.path.exists(candidate):
+                        pending.append(os.path.abspath(candidate))
+                        break
+    return sorted(seen)
+
+
+def stage_fingerprint(stage, hasher):
+    """(input hashes, code hashes, params) — what decides whether the stage is stale."""
+    inputs = {_rel(spec): hasher.path(spec) for spec in stage.inputs}
+    code = {_rel(path): hasher.file(path) for path in local_imports(os.path.join(TRAINING_DIR, stage.script))}
+    params = {"args": stage.args}
+    return inputs, code, params
+
+
+def _rel(path):
+    return os.path.relpath(os.path.normpath(path), TRAINING_DIR)
+
+
+def _key(inputs, code, params):
+    return hashlib.sha256(json.dumps([inputs, code, params], sort_keys=True).encode()).hexdigest()
+
+
+def stale_reasons(record, inputs, code, params, outputs):
+    """Why a stage must run, compared to its last successful record; [] means cache hit."""
+    if record is None:
+        return ["never run"]
+    reasons = []
+    changed = sorted(k for k in set(inputs) | set(record["inputs"]) if inputs.get(k) != record["inputs"].get(k))
+    if changed:
+        reasons.append("inputs changed: " + ", ".join(changed))
+    changed = sorted(k for k in set(code) | set(record["code"]) if code.get(k) != record["code"].get(k))
+    if changed:
+        reasons.append("code changed: " + ", ".join(changed))
+    if params != record["params"]:
+        reasons.append(f"params changed: {record['params']['args']} -> {params['args']}")
+    missing = sorted(k for k, v in outputs.items() if v == "missing")
+    if missing:
+        reasons.append("outputs missing: " + ", ".join(missing))
+    elif outputs != record["outputs"]:
+        reasons.append("outputs modified since last run")
+    return reasons
+
+
+def load_state(path=STATE_PATH):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def select(stages, targets):
+    """The targets plus everything upstream of them, in execution order."""
+    if not targets:
+        return list(stages)
+    by_name = {stage.name: stage for stage in stages}
+    wanted = set()
+    pending = [by_name[name] for name in targets]
+    while pending:
+        stage = pending.pop()
+        if stage.name not in wanted:
+            wanted.add(stage.name)
+            pending.extend(upstream(stages, stage))
+    return [stage for stage in stages if stage.name in wanted]
+
+
+def run_pipeline(stages, force=(), skip=(), dry_run=False):
+    """Run stale stages in order; returns (per-stage report rows, bytes hashed)."""
+    state = load_state()
+    hasher = Hasher()
+    report = []
+    failed = set()
+    ran = set()
+
+    for stage in stages:
+        t0 = time.perf_counter()
+        blocked = [dep.name for dep in upstream(stages, stage) if dep.name in failed]
+        if blocked:
+            failed.add(stage.name)
+            report.append({"stage": stage.name, "status": "blocked", "seconds": 0.0,
+                           "reasons": [f"upstream failed: {', '.join(blocked)}"]})
+            continue
+
+        if stage.name in skip:
+            report.append({"stage": stage.name, "status": "skipped", "seconds": 0.0,
+                           "reasons": ["--skip: using its outputs as they are"]})
+            continue
+
+        inputs, code, params = stage_fingerprint(stage, hasher)
+        outputs = {_rel(spec): hasher.path(spec) for spec in stage.outputs}
+        record = state.get(stage.name)
+        reasons = stale_reasons(record, inputs, code, params, outputs)
+        if stage.name in force:
+            reasons = ["forced"] + reasons
+        hash_seconds = time.perf_counter() - t0
+
+        if not reasons:
+            report.append({"stage": stage.name, "status": "cached", "seconds": round(hash_seconds, 2),
+                           "reasons": [], "saved_seconds": record.get("seconds", 0.0)})
+            continue
+        if dry_run:
+            pending_upstream = [dep.name for dep in upstream(stages, stage) if dep.name in ran]
+            if pending_upstream:
+                reasons = reasons + [f"may change after: {', '.join(pending_upstream)}"]
+            ran.add(stage.name)
+            report.append({"stage": stage.name, "status": "would run", "seconds": 0.0, "reasons": reasons})
+            continue
+
+        print(f"\n=== {stage.name}: {' '.join(stage.command()[1:])}")
+        for reason in reasons:
+            print(f"    ({reason})")
+        result = subprocess.run(stage.command(), cwd=TRAINING_DIR)
+        run_seconds = time.perf_counter() - t0 - hash_seconds
+        outputs = {_rel(spec): hasher.path(spec) for spec in stage.outputs}
+        missing = sorted(k for k, v in outputs.items() if v == "missing")
+        if result.returncode != 0 or missing:
+            failed.add(stage.name)
+            state.pop(stage.name, None)
+            why = f"exit code {result.returncode}" if result.returncode else "no output: " + ", ".join(missing)
+            report.append({"stage": stage.name, "status": "failed", "seconds": round(run_seconds, 2),
+                           "reasons": reasons + [why]})
+        else:
+            # Inputs are re-hashed after the run: a stage that rewrote its own inputs is recorded as it left them
+            inputs, code, params = stage_fingerprint(stage, hasher)
+            ran.add(stage.name)
+            state[stage.name] = {
+                "key": _key(inputs, code, params),
+                "inputs": inputs,
+                "code": code,
+                "params": params,
+                "outputs": outputs,
+                "seconds": round(run_seconds, 2),
+                "finished": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+            report.append({"stage": stage.name, "status": "ran", "seconds": round(run_seconds, 2),
+                           "reasons": reasons})
+        save_state(state)
+        hasher.save()
+
+    hasher.save()
+    return report, hasher.bytes_hashed
+
+
+def print_report(report, bytes_hashed):
+    print(f"\n{'stage':<12}{'status':<11}{'seconds':>9}  reason")
+    for row in report:
+        reason = "; ".join(row["reasons"])
+        if row["status"] == "cached":
+            reason = f"saved ~{row['saved_seconds']:.1f}s"
+        print(f"{row['stage']:<12}{row['status']:<11}{row['seconds']:>9.2f}  {reason}")
+    hits = sum(1 for row in report if row["status"] == "cached")
+    total = sum(row["seconds"] for row in report)
+    print(f"\nCache hits: {hits}/{len(report)}   total {total:.1f}s   "
+          f"hashed {bytes_hashed / 1e6:.1f} MB (rest from memo)")
+
+
+def parse_extra_args(values, stage_names):
+    """--set stage=--flag=value pairs -> {stage: [flags]}."""
+    extra = {}
+    for value in values:
+        name, sep, flag = value.partition("=")
+        if not sep or name not in stage_names:
+            raise SystemExit(f"--set expects <stage>=<flag> with stage in {stage_names}, got {value!r}")
+        extra.setdefault(name, []).extend(flag.split("=", 1) if flag.startswith("--") else [flag])
+    return extra
+
+
+def main():
+    stage_names = [stage.name for stage in build_stages()]
+    parser = argparse.ArgumentParser(description="Run the training pipeline, skipping up-to-date stages.")
+    parser.add_argument("targets", nargs="*", help=f"stages to bring up to date: {', '.join(stage_names)} (default: all)")
+    parser.add_argument("--force", action="append", default=[], choices=stage_names,
+                        help="re-run this stage even if cached (repeatable)")
+    parser.add_argument("--skip", action="append", default=[], choices=stage_names,
+                        help="don't run this stage, e.g. download when offline (repeatable)")
+    parser.add_argument("--set", action="append", default=[], metavar="STAGE=FLAG",
+                        help="extra flag for a stage's script, e.g. train=--feature-dtype=float16")
+    parser.add_argument("--version", help="train/validate a versioned model set (models/versions/<version>/)")
+    parser.add_argument("--promote", action="store_true", help="promote --version after training")
+    parser.add_argument("--dry-run", action="store_true", help="report what would run and why")
+    args = parser.parse_args()
+    if args.promote and not args.version:
+        parser.error("--promote requires --version")
+    unknown = [name for name in args.targets if name not in stage_names]
+    if unknown:
+        parser.error(f"unknown stages {unknown}; choose from {stage_names}")
+
+    stages = build_stages(args.version, args.promote, parse_extra_args(args.set, stage_names))
+    selected = select(stages, args.targets)
+    report, bytes_hashed = run_pipeline(
+        selected, force=set(args.force), skip=set(args.skip), dry_run=args.dry_run
+    )
+    print_report(report, bytes_hashed)
+    if any(row["status"] in ("failed", "blocked") for row in report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
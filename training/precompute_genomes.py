@@ -0,0 +1,321 @@
+"""
+precompute_genomes.py — Batch-precompute analysis JSONs for any list of genomes.
+
+Generalizes prepare_demo_genomes.py so hundreds of reference isolates can be
+published: models, SHAP summaries and metrics are loaded once per worker
+process, each FASTA is read once (k-mers and genome stats come from the same
+text), genomes are spread across a process pool, and every per-genome JSON
+plus index.json is written atomically (temp file + os.replace).
+
+Usage:
+  python precompute_genomes.py 562.86537 562.97781
+  python precompute_genomes.py --ids-file reference_ids.txt --workers 8 --append
+
+An ids file has one genome ID per line, optionally followed by a tab and a
+display name.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+import joblib
+import pandas as pd
+
+from preprocess import TARGET_ANTIBIOTICS
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from resistance_genes import compute_genome_stats, infer_resistance_genes
+from sequence_analysis import extract_kmers_from_fasta_text
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
+FASTA_DIR = os.path.join(DATA_DIR, "fastas")
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "backend", "data", "demo_genomes")
+
+ORGANISM = "Escherichia coli"
+
+# Per-worker state, filled once by init_worker()
+_MODELS = {}
+_SHAP_DATA = {}
+_METRICS = {}
+
+
+def load_lab_results(amr_df, genome_id):
+    """Extract lab-confirmed phenotypes from amr_all.csv for a genome."""
+    rows = amr_df[amr_df["genome_id"] == genome_id]
+    lab_results = {}
+    for _, row in rows.iterrows():
+        ab = row["antibiotic"]
+        phenotype = str(row.get("resistant_phenotype", "")).strip()
+        if phenotype in ("Resistant", "Susceptible"):
+            lab_results[ab] = {
+                "phenotype": phenotype,
+                "method": str(row.get("laboratory_typing_method", "")) or None,
+                "measurement": str(row.get("measurement_value", "")) or None,
+                "measurement_unit": str(row.get("measurement_unit", "")) or None,
+                "source": str(row.get("source", "")) or None,
+            }
+    return lab_results
+
+
+def find_genome_fasta(gid):
+    """Locate a genome's FASTA, trying the ID with a trailing 0 as a fallback."""
+    for candidate in (gid, gid + "0"):
+        for ext in (".fasta", ".fasta.gz"):
+            path = os.path.join(FASTA_DIR, f"{candidate}{ext}")
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def read_fasta_text(fasta_path):
+    if fasta_path.endswith(".gz"):
+        with gzip.open(fasta_path, "rt") as f:
+            return f.read()
+    with open(fasta_path) as f:
+        return f.read()
+
+
+def init_worker(models_dir):
+    """Load every model and its SHAP summary once per worker process."""
+    global _METRICS
+    with open(os.path.join(models_dir, "metrics.json")) as f:
+        _METRICS = json.load(f)
+    for ab in TARGET_ANTIBIOTICS:
+        ab_safe = ab.replace("/", "_")
+        model_path = os.path.join(models_dir, f"{ab_safe}.joblib")
+        if os.path.exists(model_path):
+            _MODELS[ab] = joblib.load(model_path)
+        shap_path = os.path.join(models_dir, f"{ab_safe}_shap.json")
+        if os.path.exists(shap_path):
+            with open(shap_path) as f:
+                _SHAP_DATA[ab] = json.load(f)
+
+
+def analyze_genome(task):
+    """Worker: build the demo-genome JSON for one genome. Returns (task, output, log lines)."""
+    gid = task["genome_id"]
+    lab_results = task["lab_results"]
+    known_labels = task["known_labels"]
+    log = []
+
+    fasta_text = read_fasta_text(task["fasta_path"])
+    features = extract_kmers_from_fasta_text(fasta_text)
+    X = features.reshape(1, -1)
+
+    predictions = []
+    for ab in TARGET_ANTIBIOTICS:
+        lab = lab_results.get(ab)
+        lab_phenotype = lab["phenotype"] if lab else known_labels.get(ab)
+
+        if ab not in _MODELS:
+            predictions.append({
+                "antibiotic": ab,
+                "prediction": "No model",
+                "confidence": 0,
+                "lab_result": lab_phenotype,
+                "lab_method": lab["method"] if lab else None,
+            })
+            continue
+
+        prob = _MODELS[ab].predict_proba(X)[0]
+        pred_class = int(prob[1] >= 0.5)
+        confidence = float(prob[1]) if pred_class == 1 else float(prob[0])
+
+        ab_metrics = _METRICS.get(ab, {})
+        top_kmers = _SHAP_DATA.get(ab, [])[:10]
+
+        pred_label = "Resistant" if pred_class == 1 else "Susceptible"
+        match = None
+        if lab_phenotype:
+            match = pred_label == lab_phenotype
+
+        predictions.append({
+            "antibiotic": ab,
+            "prediction": pred_label,
+            "confidence": round(confidence, 4),
+            "resistant_probability": round(float(prob[1]), 4),
+            "lab_result": lab_phenotype,
+            "lab_method": lab["method"] if lab else None,
+            "match": match,
+            "model_accuracy": ab_metrics.get("cv_accuracy"),
+            "model_f1": ab_metrics.get("cv_f1"),
+            "top_kmers": top_kmers,
+        })
+
+        status = "MATCH" if match is True else ("MISMATCH" if match is False else "")
+        log.append(f"  {ab:40s} -> {pred_label:12s} (conf={confidence:.3f}) lab={lab_phenotype or 'N/A':12s} {status}")
+
+    genome_stats = compute_genome_stats(fasta_text)
+    resistance_genes = infer_resistance_genes(
+        predictions, genome_stats["chromosome"]["length"]
+    )
+    log.append(f"  Inferred {len(resistance_genes)} resistance genes")
+
+    verified = [p for p in predictions if p.get("match") is not None]
+    matches = sum(1 for p in verified if p["match"])
+    verification = {
+        "total_verified": len(verified),
+        "matches": matches,
+        "mismatches": len(verified) - matches,
+        "accuracy": round(matches / len(verified), 4) if verified else None,
+        "in_training_set": task["in_training_set"],
+    }
+    log.append(f"  Verification: {matches}/{len(verified)} correct ({verification['accuracy'] or 0:.0%})")
+
+    output = {
+        "genome_id": gid,
+        "genome_name": task["name"],
+        "organism": ORGANISM,
+        "in_training_set": task["in_training_set"],
+        "predictions": predictions,
+        "verification": verification,
+        "summary": {
+            "total_antibiotics": len(predictions),
+            "resistant_count": sum(1 for p in predictions if p["prediction"] == "Resistant"),
+            "susceptible_count": sum(1 for p in predictions if p["prediction"] == "Susceptible"),
+        },
+        "genome_data": genome_stats,
+        "resistance_genes": resistance_genes,
+    }
+    return task, output, log
+
+
+def write_json_atomic(path, obj):
+    """Write JSON to a temp file in the same directory, then rename over path."""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def precompute(genomes, output_dir=OUTPUT_DIR, models_dir=MODELS_DIR, workers=None, append=False):
+    """Precompute analysis JSONs for genomes ([{"genome_id", "name"}]) and write index.json."""
+    print(f"Precomputing predictions for {len(genomes)} genomes...")
+
+    # Load known labels for validation display
+    labels = pd.read_csv(os.path.join(PROCESSED_DIR, "label_matrix.csv"), index_col=0)
+    labels.index = labels.index.astype(str)
+
+    # Load training genome IDs to flag exclusion
+    with open(os.path.join(PROCESSED_DIR, "genome_ids.json")) as f:
+        training_genome_ids = set(json.load(f))
+
+    # Load raw AMR lab data for ground-truth results, once, grouped by genome
+    amr_df = pd.read_csv(os.path.join(DATA_DIR, "amr_all.csv"), dtype=str)
+    amr_df["antibiotic"] = amr_df["antibiotic"].str.lower()
+    wanted = {g["genome_id"] for g in genomes}
+    amr_df = amr_df[amr_df["genome_id"].isin(wanted)]
+
+    tasks = []
+    for genome in genomes:
+        gid = genome["genome_id"]
+        fasta_path = find_genome_fasta(gid)
+        if fasta_path is None:
+            print(f"  WARNING: No FASTA for {gid}, skipping")
+            continue
+
+        known_labels = {}
+        if gid in labels.index:
+            row = labels.loc[gid]
+            for ab in TARGET_ANTIBIOTICS:
+                ab_lower = ab.lower()
+                if ab_lower in row.index and row[ab_lower] != -1:
+                    known_labels[ab] = "Resistant" if row[ab_lower] == 1 else "Susceptible"
+
+        tasks.append({
+            "genome_id": gid,
+            "name": genome["name"],
+            "fasta_path": fasta_path,
+            "in_training_set": gid in training_genome_ids,
+            "lab_results": load_lab_results(amr_df, gid),
+            "known_labels": known_labels,
+        })
+
+    os.makedirs(output_dir, exist_ok=True)
+    n_workers = max(1, min(workers or cpu_count(), len(tasks)))
+    print(f"  Workers: {n_workers}")
+
+    t0 = time.time()
+    done = []
+    with Pool(processes=n_workers, initializer=init_worker, initargs=(models_dir,)) as pool:
+        for task, output, log in pool.imap_unordered(analyze_genome, tasks):
+            gid = task["genome_id"]
+            print(f"\nProcessed {gid} ({task['name']})")
+            print(f"  In training set: {task['in_training_set']}")
+            print(f"  Lab results available: {len(task['lab_results'])} antibiotics")
+            for line in log:
+                print(line)
+            output_path = os.path.join(output_dir, f"{gid}.json")
+            write_json_atomic(output_path, output)
+            print(f"  Saved to {output_path}")
+            done.append(gid)
+
+    elapsed = time.time() - t0
+    print(f"\nPrecomputed {len(done)}/{len(genomes)} genomes in {elapsed:.1f}s")
+
+    # Save index of available genomes, in the order they were requested
+    index_path = os.path.join(output_dir, "index.json")
+    written = set(done)
+    index = []
+    if append and os.path.exists(index_path):
+        with open(index_path) as f:
+            # Replace only the entries rewritten above; a genome that failed this
+            # run keeps its earlier entry (and JSON)
+            index = [e for e in json.load(f) if e["genome_id"] not in written]
+    index += [
+        {"genome_id": g["genome_id"], "genome_name": g["name"], "organism": ORGANISM}
+        for g in genomes if g["genome_id"] in written
+    ]
+    write_json_atomic(index_path, index)
+    print(f"Saved genome index ({len(index)} entries) to {index_path}")
+    return done
+
+
+def read_ids_file(path):
+    genomes = []
+    with open(path) as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t", 1)
+            if parts[0].strip():
+                gid = parts[0].strip()
+                name = parts[1].strip() if len(parts) > 1 else None
+                genomes.append({"genome_id": gid, "name": name})
+    return genomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("genome_ids", nargs="*", help="genome IDs to precompute")
+    parser.add_argument("--ids-file", help="file with one genome ID (tab name) per line")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--append", action="store_true", help="merge into the existing index.json")
+    args = parser.parse_args()
+
+    genomes = [{"genome_id": gid, "name": None} for gid in args.genome_ids]
+    if args.ids_file:
+        genomes += read_ids_file(args.ids_file)
+    if not genomes:
+        parser.error("no genome IDs given")
+
+    seen = set()
+    unique = []
+    for g in genomes:
+        if g["genome_id"] in seen:
+            continue
+        seen.add(g["genome_id"])
+        g["name"] = g["name"] or f"E. coli strain {g['genome_id'].split('.')[-1]}"
+        unique.append(g)
+
+    precompute(unique, output_dir=args.output_dir, workers=args.workers, append=args.append)
+    print("Done!")
+
+
+if __name__ == "__main__":
+    main()
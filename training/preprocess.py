@@ -13,7 +13,9 @@ import json
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 CSV_PATH = os.path.join(DATA_DIR, "amr_all.csv")
 FASTA_DIR = os.path.join(DATA_DIR, "fastas")
+FASTQ_DIR = os.path.join(DATA_DIR, "fastqs")
 OUTPUT_DIR = os.path.join(DATA_DIR, "processed")
+STREAM_MANIFEST_PATH = os.path.join(OUTPUT_DIR, "stream_genome_ids.json")
 
 TARGET_ANTIBIOTICS = [
     "ampicillin",
@@ -48,14 +50,27 @@ CLSI_BREAKPOINTS = {
 
 
 def get_available_genomes():
-    """Return set of genome IDs that have FASTA files downloaded."""
+    """Return set of genome IDs that have FASTA files downloaded, reads, or streamed features."""
     available = set()
-    for fname in os.listdir(FASTA_DIR):
-        if fname.endswith(".fasta"):
-            genome_id = fname.replace(".fasta", "")
-            fpath = os.path.join(FASTA_DIR, fname)
-            if os.path.getsize(fpath) > 1000:
-                available.add(genome_id)
+    if os.path.isdir(FASTA_DIR):
+        for fname in os.listdir(FASTA_DIR):
+            if fname.endswith(".fasta") or fname.endswith(".fasta.gz"):
+                genome_id = fname.split(".fasta")[0]
+                fpath = os.path.join(FASTA_DIR, fname)
+                # gzip shrinks sequence ~4x, so scale the "likely an error" threshold
+                min_size = 250 if fname.endswith(".gz") else 1000
+                if os.path.getsize(fpath) > min_size:
+                    available.add(genome_id)
+    # Genomes sequenced but not assembled: <id>.fastq[.gz] or mates <id>_1.fastq.gz etc. (fastq_kmers.py)
+    if os.path.isdir(FASTQ_DIR):
+        for fname in os.listdir(FASTQ_DIR):
+            if fname.lower().endswith((".fastq", ".fq", ".fastq.gz", ".fq.gz")):
+                stem = fname.split(".f")[0]
+                available.add(stem.rsplit("_", 1)[0] if "_" in stem else stem)
+    # Genomes counted by stream_features.py without keeping a FASTA
+    if os.path.exists(STREAM_MANIFEST_PATH):
+        with open(STREAM_MANIFEST_PATH) as f:
+            available.update(json.load(f))
     return available
 
 
@@ -0,0 +1,208 @@
+"""
+preview_study.py — How far preview-mode predictions (k-mers of a genome sample) agree with full ones.
+
+The backend's preview mode counts k-mers on a stratified sample of sequence
+windows. Counting a fraction f of a genome's positions keeps each k-mer
+occurrence with probability ~f, so a genome's sampled counts are simulated
+from the count store by binomial thinning: Binomial(count, f) per k-mer.
+For each fraction and antibiotic this reports:
+
+  agreement       share of genomes whose R/S call matches the full-genome call
+  p_abs_err       mean / 95th percentile |p_sample - p_full|
+  per margin m:   share of sampled predictions within m of 0.5 (flagged
+                  ambiguous) and the agreement of the rest
+
+and, per fraction, the smallest margin whose unflagged calls agree at least
+--target of the time (a PREVIEW_MARGIN for backend/app.py).
+
+Windows are contiguous, so real samples vary more than independent thinning.
+--fasta-check N repeats the study on N genomes with the exact window sampler
+the backend uses (extract_kmers.sample_windows), when their FASTAs are present.
+Written to data/processed/preview_study.json.
+
+Usage:
+  python preview_study.py
+  python preview_study.py --fractions 0.01 0.05 0.1 --fasta-check 200
+"""
+
+import argparse
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from extract_kmers import K, add_kmer_counts, encode_sequence, find_fasta, read_fasta_sequences, sample_windows
+from feature_store import PROCESSED_DIR, load_counts, normalize
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+REPORT_PATH = os.path.join(PROCESSED_DIR, "preview_study.json")
+FRACTIONS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5)
+MARGINS = (0.02, 0.05, 0.1, 0.15, 0.2, 0.25)
+RANDOM_SEED = 42
+
+
+def load_models(models_dir, antibiotics):
+    models = {}
+    for antibiotic in antibiotics:
+        model_path = os.path.join(models_dir, f"{antibiotic.replace('/', '_')}.joblib")
+        if os.path.exists(model_path):
+            models[antibiotic] = joblib.load(model_path)
+    return models
+
+
+def compare(p_full, p_sample, margins=MARGINS):
+    """Agreement of sampled vs full probabilities, overall and outside each ambiguity margin."""
+    agree = (p_full >= 0.5) == (p_sample >= 0.5)
+    err = np.abs(p_sample - p_full)
+    result = {
+        "agreement": round(float(agree.mean()), 4),
+        "p_abs_err_mean": round(float(err.mean()), 4),
+        "p_abs_err_p95": round(float(np.percentile(err, 95)), 4),
+        "margins": {},
+    }
+    for margin in margins:
+        flagged = np.abs(p_sample - 0.5) < margin
+        kept = ~flagged
+        result["margins"][str(margin)] = {
+            "ambiguous_rate": round(float(flagged.mean()), 4),
+            "agreement_unflagged": round(float(agree[kept].mean()), 4) if kept.any() else None,
+        }
+    return result
+
+
+def pooled(per_antibiotic):
+    """Genome-weighted means of compare() results across antibiotics."""
+    rows = list(per_antibiotic.values())
+    weights = np.array([r["n"] for r in rows], dtype=np.float64)
+    out = {"agreement": round(float(np.average([r["agreement"] for r in rows], weights=weights)), 4),
+           "margins": {}}
+    for margin in rows[0]["margins"]:
+        rates = [r["margins"][margin]["ambiguous_rate"] for r in rows]
+        kept = [r["margins"][margin]["agreement_unflagged"] for r in rows]
+        kept_weights = weights * (1 - np.array(rates))
+        valid = [i for i, k in enumerate(kept) if k is not None]
+        out["margins"][margin] = {
+            "ambiguous_rate": round(float(np.average(rates, weights=weights)), 4),
+            "agreement_unflagged": round(float(np.average(
+                [kept[i] for i in valid], weights=[kept_weights[i] for i in valid]
+            )), 4) if valid and sum(kept_weights[i] for i in valid) > 0 else None,
+        }
+    return out
+
+
+def recommended_margin(summary, target):
+    """Smallest margin whose unflagged calls agree at least `target` of the time (None if none do)."""
+    for margin, stats in sorted(summary["margins"].items(), key=lambda kv: float(kv[0])):
+        if stats["agreement_unflagged"] is not None and stats["agreement_unflagged"] >= target:
+            return float(margin)
+    return None
+
+
+def study(p_full, sampled_features, models, margins):
+    """compare() per antibiotic for one set of sampled feature rows."""
+    per_antibiotic = {}
+    for antibiotic, model in models.items():
+        p_sample = model.predict_proba(sampled_features)[:, 1]
+        per_antibiotic[antibiotic] = {"n": len(p_sample), **compare(p_full[antibiotic], p_sample, margins)}
+    return per_antibiotic
+
+
+def fasta_sample_counts(genome_ids, fraction):
+    """6-mer counts of each genome's window sample (None where the FASTA is missing)."""
+    rows = []
+    for gid in genome_ids:
+        path = find_fasta(gid)
+        if not os.path.exists(path):
+            rows.append(None)
+            continue
+        contigs = [encode_sequence(seq) for seq in read_fasta_sequences(path)]
+        counts = np.zeros(4 ** K, dtype=np.float64)
+        add_kmer_counts(sample_windows(contigs, fraction), counts)
+        rows.append(counts)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--fractions", type=float, nargs="+", default=list(FRACTIONS))
+    parser.add_argument("--margins", type=float, nargs="+", default=list(MARGINS))
+    parser.add_argument("--target", type=float, default=0.99,
+                        help="agreement required of unflagged calls for the recommended margin")
+    parser.add_argument("--max-genomes", type=int, default=None, help="study a random subset of genomes")
+    parser.add_argument("--fasta-check", type=int, default=0, metavar="N",
+                        help="also window-sample N genomes from their FASTAs")
+    parser.add_argument("--output", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    counts = load_counts(mmap_mode="r")
+    with open(os.path.join(PROCESSED_DIR, "genome_ids.json")) as f:
+        genome_ids = json.load(f)
+    rng = np.random.default_rng(RANDOM_SEED)
+    rows = np.arange(len(genome_ids))
+    if args.max_genomes and args.max_genomes < len(rows):
+        rows = np.sort(rng.choice(rows, args.max_genomes, replace=False))
+    counts = np.asarray(counts[rows], dtype=np.int64)
+    genome_ids = [genome_ids[i] for i in rows]
+
+    labels = pd.read_csv(os.path.join(PROCESSED_DIR, "label_matrix.csv"), index_col=0)
+    models = load_models(args.models_dir, labels.columns)
+    if not models:
+        raise SystemExit(f"No models in {args.models_dir}; run train_models.py first")
+    X_full = normalize(counts)
+    p_full = {ab: model.predict_proba(X_full)[:, 1] for ab, model in models.items()}
+    print(f"{len(genome_ids)} genomes, {len(models)} models, "
+          f"median genome {np.median(counts.sum(axis=1)) / 1e6:.1f} M k-mers")
+
+    report = {
+        "method": "binomial_thinning",
+        "n_genomes": len(genome_ids),
+        "target": args.target,
+        "fractions": {},
+    }
+    print(f"\n{'fraction':>9}{'agree':>8}" + "".join(f"{f'amb@{m}':>10}{'ok':>7}" for m in args.margins)
+          + f"{'margin':>8}")
+    for fraction in args.fractions:
+        thinned = rng.binomial(counts, fraction)
+        per_antibiotic = study(p_full, normalize(thinned), models, args.margins)
+        summary = pooled(per_antibiotic)
+        margin = recommended_margin(summary, args.target)
+        report["fractions"][str(fraction)] = {
+            **summary, "recommended_margin": margin, "antibiotics": per_antibiotic,
+        }
+        cells = "".join(
+            f"{summary['margins'][str(m)]['ambiguous_rate']:>10.1%}"
+            f"{(summary['margins'][str(m)]['agreement_unflagged'] or 0):>7.1%}"
+            for m in args.margins
+        )
+        print(f"{fraction:>9}{summary['agreement']:>8.1%}{cells}{str(margin):>8}")
+
+    if args.fasta_check:
+        checked = genome_ids[: args.fasta_check]
+        report["fasta_check"] = {}
+        print(f"\nWindow sampling from FASTA ({len(checked)} genomes):")
+        for fraction in args.fractions:
+            sampled = fasta_sample_counts(checked, fraction)
+            present = [i for i, row in enumerate(sampled) if row is not None]
+            if not present:
+                print("  no FASTAs found; skipped")
+                break
+            X_sample = normalize(np.array([sampled[i] for i in present]))
+            p_sub = {ab: p[present] for ab, p in p_full.items()}
+            summary = pooled(study(p_sub, X_sample, models, args.margins))
+            margin = recommended_margin(summary, args.target)
+            report["fasta_check"][str(fraction)] = {
+                **summary, "recommended_margin": margin, "n_genomes": len(present),
+            }
+            print(f"  fraction {fraction}: agreement {summary['agreement']:.1%}, "
+                  f"recommended margin {margin} ({len(present)} genomes)")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
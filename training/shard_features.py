@@ -0,0 +1,283 @@
+"""
+shard_features.py — Sharded k-mer extraction across machines, with a validating merge.
+
+genome_ids.json is partitioned into N shards by crc32(genome_id) % N. The
+assignment depends only on the ID, so every machine computes the same
+partition without coordination, and adding genomes to the corpus never moves
+existing ones. Each shard run copies its genomes' rows from the stream store
+(stream_features.py) when it has them and counts the rest (extract_kmers_fast's
+worker, all local cores), then writes one self-describing partial file:
+
+  processed/shards/kmer_counts.shard-<i>-of-<N>.npz
+    genome_ids, counts (narrowest uint dtype), found (sequence found)
+    meta: format version, k, feature count, k-mer index hash, shard i / N,
+          sha256 of the genome_ids.json it was cut from, host, timings
+
+merge checks that all N shards are present exactly once, were cut from the
+same genome list with the same k-mer index, hold exactly the genomes their
+crc32 assigns them, and together cover genome_ids.json, then writes
+kmer_counts.npy + kmer_names.json in genome_ids.json order (the same output
+as extract_kmers_fast.py). Labelled genomes whose sequence no shard found
+would train as all-zero rows, so merge refuses them unless --allow-missing.
+
+Usage:
+  python shard_features.py extract --shard 3 --num-shards 16   # on each machine
+  python shard_features.py merge --num-shards 16               # after copying shards in
+  python shard_features.py merge --num-shards 16 --allow-missing  # keep zero rows for missing genomes
+  python shard_features.py local --num-shards 4                # all shards as local processes, then merge
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from extract_kmers import K
+from extract_kmers_fast import KMER_INDEX, N_FEATURES, process_genome
+from feature_store import narrowest_uint, save_counts
+from stream_features import load_stream_store
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
+SHARD_DIR = os.path.join(PROCESSED_DIR, "shards")
+SHARD_FORMAT_VERSION = 1
+
+
+def shard_of(genome_id, num_shards):
+    return zlib.crc32(genome_id.encode()) % num_shards
+
+
+def kmer_index_hash():
+    names = sorted(KMER_INDEX, key=KMER_INDEX.get)
+    return hashlib.sha256("\n".join(names).encode()).hexdigest()[:16]
+
+
+def shard_path(shard, num_shards, shard_dir=SHARD_DIR):
+    return os.path.join(shard_dir, f"kmer_counts.shard-{shard:04d}-of-{num_shards:04d}.npz")
+
+
+def load_genome_ids(processed_dir=PROCESSED_DIR):
+    """(genome IDs, sha256 of genome_ids.json)."""
+    with open(os.path.join(processed_dir, "genome_ids.json"), "rb") as f:
+        raw = f.read()
+    return json.loads(raw), hashlib.sha256(raw).hexdigest()
+
+
+def extract_shard(shard, num_shards, workers, processed_dir=PROCESSED_DIR, shard_dir=SHARD_DIR):
+    """Count the k-mers of one shard's genomes and write its partial file."""
+    if not 0 <= shard < num_shards:
+        raise SystemExit(f"--shard must be in [0, {num_shards})")
+    genome_ids, corpus_hash = load_genome_ids(processed_dir)
+    mine = [gid for gid in genome_ids if shard_of(gid, num_shards) == shard]
+    print(f"Shard {shard}/{num_shards}: {len(mine)} of {len(genome_ids)} genomes, {workers} workers")
+
+    t0 = time.time()
+    rows = {}
+    found = {}
+    # Reuse rows already counted while streaming (as extract_kmers_fast.main does)
+    stream_manifest, stream_rows = load_stream_store()
+    for gid in mine:
+        if gid in stream_manifest:
+            rows[gid], found[gid] = np.asarray(stream_rows[stream_manifest[gid]]), True
+    del stream_rows
+    todo = [gid for gid in mine if gid not in rows]
+    print(f"  Reused from stream store: {len(rows)}")
+    with Pool(processes=max(1, min(workers, len(todo) or 1))) as pool:
+        for i, (gid, counts, ok) in enumerate(pool.imap_unordered(process_genome, todo, chunksize=8), 1):
+            rows[gid], found[gid] = counts, ok
+            if i % 50 == 0 or i == len(todo):
+                print(f"  {i}/{len(todo)} genomes  ({i / (time.time() - t0):.1f}/s)")
+    elapsed = time.time() - t0
+
+    counts = np.zeros((len(mine), N_FEATURES), dtype=np.uint32)
+    for i, gid in enumerate(mine):
+        counts[i] = rows[gid]
+    dtype = narrowest_uint(int(counts.max()) if counts.size else 0)
+    meta = {
+        "format_version": SHARD_FORMAT_VERSION,
+        "k": K,
+        "n_features": N_FEATURES,
+        "kmer_index_hash": kmer_index_hash(),
+        "shard": shard,
+        "num_shards": num_shards,
+        "partition": "crc32",
+        "genome_ids_sha256": corpus_hash,
+        "n_genomes": len(mine),
+        "n_streamed": len(mine) - len(todo),
+        "n_missing_fasta": sum(1 for gid in mine if not found[gid]),
+        "host": socket.gethostname(),
+        "extract_seconds": round(elapsed, 2),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+    os.makedirs(shard_dir, exist_ok=True)
+    path = shard_path(shard, num_shards, shard_dir)
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        genome_ids=np.asarray(mine, dtype=str),
+        counts=counts.astype(dtype),
+        found=np.asarray([found[gid] for gid in mine], dtype=bool),
+        meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+    )
+    os.replace(tmp_path, path)
+    print(f"Saved {path} ({dtype}, {os.path.getsize(path) / 1e6:.1f} MB) in {elapsed:.1f}s")
+    if meta["n_missing_fasta"]:
+        print(f"  WARNING: {meta['n_missing_fasta']} genomes had missing FASTA files")
+    return path
+
+
+def read_shard(path):
+    with np.load(path) as data:
+        meta = json.loads(bytes(data["meta"]).decode())
+        return meta, data["genome_ids"].tolist(), data["counts"], data["found"]
+
+
+def labelled_genomes(processed_dir=PROCESSED_DIR):
+    """Genome IDs with at least one R/S label in label_matrix.csv (empty set without one)."""
+    path = os.path.join(processed_dir, "label_matrix.csv")
+    if not os.path.exists(path):
+        return set()
+    labelled = set()
+    with open(path) as f:
+        next(f, None)
+        for line in f:
+            gid, *values = line.rstrip("\n").split(",")
+            if any(v.strip() not in ("-1", "") for v in values):
+                labelled.add(gid)
+    return labelled
+
+
+def merge_shards(num_shards, processed_dir=PROCESSED_DIR, shard_dir=SHARD_DIR, allow_missing=False):
+    """Validate every partial file of an N-shard run and assemble kmer_counts.npy."""
+    genome_ids, corpus_hash = load_genome_ids(processed_dir)
+    expected = {
+        "format_version": SHARD_FORMAT_VERSION,
+        "k": K,
+        "n_features": N_FEATURES,
+        "kmer_index_hash": kmer_index_hash(),
+        "num_shards": num_shards,
+        "partition": "crc32",
+        "genome_ids_sha256": corpus_hash,
+    }
+    paths = sorted(glob.glob(os.path.join(shard_dir, f"kmer_counts.shard-*-of-{num_shards:04d}.npz")))
+    errors = []
+    seen_shards = {}
+    gid_to_idx = {gid: i for i, gid in enumerate(genome_ids)}
+    count_matrix = np.zeros((len(genome_ids), N_FEATURES), dtype=np.uint32)
+    filled = np.zeros(len(genome_ids), dtype=bool)
+    missing_ids = []
+
+    for path in paths:
+        meta, ids, counts, found = read_shard(path)
+        name = os.path.basename(path)
+        mismatched = {k: (meta.get(k), v) for k, v in expected.items() if meta.get(k) != v}
+        if mismatched:
+            errors.append(f"{name}: metadata differs from this corpus/index (got, expected): {mismatched}")
+            continue
+        if meta["shard"] in seen_shards:
+            errors.append(f"{name}: shard {meta['shard']} already read from {seen_shards[meta['shard']]}")
+            continue
+        seen_shards[meta["shard"]] = name
+        if counts.shape != (len(ids), N_FEATURES) or len(found) != len(ids):
+            errors.append(f"{name}: counts shape {counts.shape} does not match {len(ids)} genome IDs")
+            continue
+        wrong = [gid for gid in ids if shard_of(gid, num_shards) != meta["shard"]]
+        unknown = [gid for gid in ids if gid not in gid_to_idx]
+        if wrong or unknown:
+            errors.append(f"{name}: {len(wrong)} genomes from other shards, {len(unknown)} not in genome_ids.json")
+            continue
+        idx = np.array([gid_to_idx[gid] for gid in ids], dtype=np.int64)
+        if filled[idx].any():
+            errors.append(f"{name}: {int(filled[idx].sum())} genomes already filled by another shard")
+            continue
+        count_matrix[idx] = counts
+        filled[idx] = True
+        missing_ids += [gid for gid, ok in zip(ids, found) if not ok]
+        print(f"  {name}: {len(ids)} genomes from {meta['host']} ({meta['extract_seconds']:.0f}s)")
+
+    absent = sorted(set(range(num_shards)) - set(seen_shards))
+    if absent:
+        errors.append(f"missing shards: {absent[:20]}{' ...' if len(absent) > 20 else ''}")
+    if not errors and not filled.all():
+        errors.append(f"{int((~filled).sum())} genomes in genome_ids.json are in no shard")
+    # Labelled genomes without sequence would silently train as all-zero feature rows
+    missing_labelled = sorted(set(missing_ids) & labelled_genomes(processed_dir))
+    if missing_labelled and not allow_missing:
+        errors.append(
+            f"{len(missing_labelled)} labelled genomes have no FASTA, archive entry, reads or stream row "
+            f"(zero rows): {missing_labelled[:10]}{' ...' if len(missing_labelled) > 10 else ''}; "
+            f"fetch them or re-run with --allow-missing"
+        )
+    if errors:
+        print("\nMerge failed:")
+        for error in errors:
+            print(f"  - {error}")
+        raise SystemExit(1)
+
+    counts_path = os.path.join(processed_dir, "kmer_counts.npy")
+    dtype = save_counts(count_matrix, counts_path)
+    with open(os.path.join(processed_dir, "kmer_names.json"), "w") as f:
+        json.dump(sorted(KMER_INDEX, key=KMER_INDEX.get), f)
+    print(f"\nMerged {num_shards} shards -> {counts_path} {count_matrix.shape} ({dtype})")
+    if missing_ids:
+        print(f"  WARNING: {len(missing_ids)} genomes had missing FASTA files (zero rows), "
+              f"{len(missing_labelled)} of them labelled")
+    return counts_path
+
+
+def run_local(num_shards, workers, allow_missing=False):
+    """Run every shard as its own process on this machine, then merge."""
+    per_shard = max(1, workers // num_shards)
+    t0 = time.time()
+    procs = [
+        subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "extract",
+            "--shard", str(i), "--num-shards", str(num_shards), "--workers", str(per_shard),
+        ])
+        for i in range(num_shards)
+    ]
+    failed = [i for i, proc in enumerate(procs) if proc.wait() != 0]
+    if failed:
+        raise SystemExit(f"shards {failed} failed")
+    print(f"\nAll {num_shards} shards done in {time.time() - t0:.1f}s; merging...")
+    merge_shards(num_shards, allow_missing=allow_missing)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    extract = sub.add_parser("extract", help="count one shard's genomes")
+    extract.add_argument("--shard", type=int, required=True)
+    extract.add_argument("--num-shards", type=int, required=True)
+    extract.add_argument("--workers", type=int, default=cpu_count())
+    merge = sub.add_parser("merge", help="validate and assemble all shards")
+    merge.add_argument("--num-shards", type=int, required=True)
+    merge.add_argument("--allow-missing", action="store_true",
+                       help="write zero rows for labelled genomes no shard found")
+    local = sub.add_parser("local", help="run all shards as local processes, then merge")
+    local.add_argument("--num-shards", type=int, required=True)
+    local.add_argument("--workers", type=int, default=cpu_count(), help="total across shards")
+    local.add_argument("--allow-missing", action="store_true",
+                       help="write zero rows for labelled genomes no shard found")
+    args = parser.parse_args()
+
+    if args.command == "extract":
+        extract_shard(args.shard, args.num_shards, args.workers)
+    elif args.command == "merge":
+        merge_shards(args.num_shards, allow_missing=args.allow_missing)
+    else:
+        run_local(args.num_shards, args.workers, args.allow_missing)
+
+
+if __name__ == "__main__":
+    main()
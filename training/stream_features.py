@@ -0,0 +1,238 @@
+"""
+stream_features.py — Fused FASTA download + 6-mer extraction (no raw FASTA round-trip).
+
+Streams each genome from the PATRIC/BV-BRC API and counts k-mers while the
+bytes arrive. Downloader threads parse the response into sequence blocks and
+push them onto a bounded queue; the main thread drains the queue and counts,
+so network I/O overlaps with counting and memory stays bounded by the queue.
+
+Raw k-mer count rows are written straight to data/processed/stream_features.npy
+with a {genome_id: row} manifest in stream_genome_ids.json. preprocess.py treats
+streamed genomes as available and extract_kmers_fast.py reuses their rows
+instead of re-reading FASTAs. Re-runs keep rows from the previous store.
+
+Usage:
+  python stream_features.py                  # ids from data/ecoli_genome_ids_full.txt
+  python stream_features.py --save-fasta     # also keep data/fastas/<id>.fasta.gz
+  python stream_features.py --api-url http://127.0.0.1:8000/api/genome_sequence/
+"""
+
+import argparse
+import gzip
+import json
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from extract_kmers import build_kmer_index, encode_sequence, add_kmer_counts, K
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+FASTA_DIR = os.path.join(DATA_DIR, "fastas")
+PROCESSED_DIR = os.path.join(DATA_DIR, "processed")
+IDS_FILE = os.path.join(DATA_DIR, "ecoli_genome_ids_full.txt")
+STREAM_FEATURES_PATH = os.path.join(PROCESSED_DIR, "stream_features.npy")
+STREAM_MANIFEST_PATH = os.path.join(PROCESSED_DIR, "stream_genome_ids.json")
+
+API_URL = "https://patricbrc.org/api/genome_sequence/"
+NUM_THREADS = 15
+TIMEOUT = 30
+MIN_RESPONSE_SIZE = 500  # bytes — same threshold as download_fastas.py
+CHUNK_SIZE = 1 << 16  # network read size
+BLOCK_SIZE = 1 << 20  # bases per queued block
+QUEUE_BLOCKS = 64  # bounded queue: at most ~64 MB of sequence in flight
+
+N_FEATURES = len(build_kmer_index())
+
+
+def load_stream_store():
+    """Return (manifest, feature rows) of an existing stream store, or ({}, None)."""
+    if not (os.path.exists(STREAM_MANIFEST_PATH) and os.path.exists(STREAM_FEATURES_PATH)):
+        return {}, None
+    rows = np.load(STREAM_FEATURES_PATH, mmap_mode="r")
+    if rows.dtype.kind == "f":
+        print(f"  Ignoring {STREAM_FEATURES_PATH}: holds frequencies, not raw counts (re-stream)")
+        return {}, None
+    with open(STREAM_MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    return manifest, rows
+
+
+def stream_one(genome_id, blocks, api_url, save_fasta):
+    """Stream one genome and push its sequence blocks onto the queue.
+
+    Blocks are self-contained: a block split mid-contig carries the previous
+    K-1 bases so no k-mer is lost or double counted at the boundary. Each
+    ("block", genome_id, block, new bases) message counts the carried bases
+    out of new bases. Always finishes with a ("done", genome_id, success, msg)
+    message.
+    """
+    url = f"{api_url}?eq(genome_id,{genome_id})&http_accept=application/dna+fasta&limit(25000)"
+    fasta_path = os.path.join(FASTA_DIR, f"{genome_id}.fasta.gz")
+    tmp_path = fasta_path + ".part"
+    out = None
+    try:
+        with requests.get(url, timeout=TIMEOUT, stream=True) as resp:
+            if resp.status_code != 200:
+                blocks.put(("done", genome_id, False, f"status={resp.status_code}"))
+                return
+            if save_fasta:
+                out = gzip.open(tmp_path, "wb", compresslevel=6)
+
+            pending = b""
+            contig = []
+            contig_len = 0
+            carried = 0  # bases at the start of contig repeated from the previous block
+            total = 0
+            for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                if out is not None:
+                    out.write(chunk)
+                total += len(chunk)
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    if line.startswith(b">"):
+                        if contig_len > carried:
+                            blocks.put(("block", genome_id, b"".join(contig), contig_len - carried))
+                        contig, contig_len, carried = [], 0, 0
+                        continue
+                    line = line.strip()
+                    contig.append(line)
+                    contig_len += len(line)
+                    if contig_len >= BLOCK_SIZE:
+                        block = b"".join(contig)
+                        blocks.put(("block", genome_id, block, contig_len - carried))
+                        contig, contig_len, carried = [block[-(K - 1):]], K - 1, K - 1
+            if pending and not pending.startswith(b">"):
+                line = pending.strip()
+                contig.append(line)
+                contig_len += len(line)
+            if contig_len > carried:
+                blocks.put(("block", genome_id, b"".join(contig), contig_len - carried))
+
+        if total <= MIN_RESPONSE_SIZE:
+            blocks.put(("done", genome_id, False, f"status=200 len={total}"))
+            return
+        if out is not None:
+            out.close()
+            out = None
+            os.replace(tmp_path, fasta_path)
+        blocks.put(("done", genome_id, True, "streamed"))
+    except Exception as e:
+        # Network errors, but also OSError from writing the .fasta.gz (disk
+        # full, permissions): main() waits for a "done" from every genome
+        blocks.put(("done", genome_id, False, f"{type(e).__name__}: {e}"))
+    finally:
+        if out is not None:
+            out.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--ids", default=IDS_FILE, help="file with one genome ID per line")
+    parser.add_argument("--api-url", default=API_URL, help="genome_sequence endpoint (e.g. a local stand-in)")
+    parser.add_argument("--threads", type=int, default=NUM_THREADS)
+    parser.add_argument("--save-fasta", action="store_true", help="also write data/fastas/<id>.fasta.gz")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ids):
+        print(f"ERROR: {args.ids} not found. Run download_amr.py first.")
+        sys.exit(1)
+    with open(args.ids) as f:
+        genome_ids = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    if args.save_fasta:
+        os.makedirs(FASTA_DIR, exist_ok=True)
+
+    # Carry rows over from a previous run so the command stays resume-safe
+    old_manifest, old_rows = load_stream_store()
+    row_of = {gid: i for i, gid in enumerate(genome_ids)}
+    tmp_features = STREAM_FEATURES_PATH + ".tmp.npy"
+    features = np.lib.format.open_memmap(
+        tmp_features, mode="w+", dtype=np.uint32, shape=(len(genome_ids), N_FEATURES)
+    )
+    manifest = {}
+    todo = []
+    for gid in genome_ids:
+        if gid in old_manifest:
+            features[row_of[gid]] = old_rows[old_manifest[gid]]
+            manifest[gid] = row_of[gid]
+        else:
+            todo.append(gid)
+    del old_rows
+
+    print(f"Streaming {K}-mer features for {len(todo)} genomes ({args.threads} threads)...")
+    print(f"  Reused from previous run: {len(manifest)}")
+    print(f"  Source: {args.api_url}")
+    print(f"  Output: {STREAM_FEATURES_PATH}")
+
+    blocks = queue.Queue(maxsize=QUEUE_BLOCKS)
+    counts = {}
+    streamed = 0
+    failed_ids = []
+    bases = 0
+    t0 = time.time()
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for gid in todo:
+            pool.submit(stream_one, gid, blocks, args.api_url, args.save_fasta)
+
+        finished = 0
+        while finished < len(todo):
+            msg = blocks.get()
+            if msg[0] == "block":
+                _, gid, block, new_bases = msg
+                if gid not in counts:
+                    counts[gid] = np.zeros(N_FEATURES, dtype=np.int64)
+                add_kmer_counts(encode_sequence(block), counts[gid])
+                bases += new_bases
+                continue
+
+            _, gid, ok, info = msg
+            finished += 1
+            genome_counts = counts.pop(gid, None)
+            if ok and genome_counts is not None:
+                features[row_of[gid]] = genome_counts
+                manifest[gid] = row_of[gid]
+                streamed += 1
+            else:
+                failed_ids.append(gid)
+
+            if finished % 100 == 0 or finished == len(todo):
+                elapsed = time.time() - t0
+                print(
+                    f"  [{finished}/{len(todo)}] streamed={streamed} failed={len(failed_ids)} "
+                    f"({finished / elapsed:.1f} genomes/s, {bases / elapsed / 1e6:.1f} Mbp/s)"
+                )
+
+    features.flush()
+    del features
+    os.replace(tmp_features, STREAM_FEATURES_PATH)
+    tmp_manifest = STREAM_MANIFEST_PATH + ".tmp"
+    with open(tmp_manifest, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, STREAM_MANIFEST_PATH)
+
+    elapsed = time.time() - t0
+    print(f"\nDone in {elapsed:.0f}s")
+    print(f"  Streamed: {streamed}")
+    print(f"  Failed: {len(failed_ids)}")
+    print(f"  Feature rows available: {len(manifest)} -> {STREAM_MANIFEST_PATH}")
+
+    if failed_ids:
+        failed_path = os.path.join(DATA_DIR, "failed_downloads.txt")
+        with open(failed_path, "w") as f:
+            for gid in failed_ids:
+                f.write(gid + "\n")
+        print(f"  Failed IDs saved to {failed_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+train_joint.py — Train one multi-output XGBoost model for all antibiotics.
+
+Alternative to train_models.py: a single multi_output_tree booster over the
+whole label matrix, with missing labels (-1) masked out of the loss (see
+xgb_engine.py), so serving one genome is one tree-ensemble evaluation instead
+of ten. Writes joint.ubj, joint_model.json, metrics.json and <antibiotic>_shap.json
+into models/versions/<version>/; the backend serves it through the usual
+response contract (backend/joint_model.py).
+
+Also writes joint_report.json next to the model: per-antibiotic CV accuracy /
+F1 / AUC, model size and per-genome inference latency, side by side with the
+per-antibiotic model set in models/.
+
+Usage:
+  python train_joint.py                           # models/versions/joint/
+  python train_joint.py --version joint-v2 --promote
+  python train_joint.py --multi-strategy one_output_per_tree
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+
+from feature_store import load_features
+from xgb_engine import QuantizedFeatures, cross_validate_joint, fit_joint
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+from joint_model import JOINT_META_NAME, JOINT_MODEL_NAME
+from model_registry import load_model_set
+
+warnings.filterwarnings("ignore", category=UserWarning)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "processed")
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+
+MIN_SAMPLES_PER_CLASS = 2
+N_SPLITS = 5
+LATENCY_RUNS = 50
+
+
+def model_set_bytes(model_set):
+    """On-disk size of what the backend actually loads for a model set."""
+    path = model_set.path
+    if model_set.source == "joint":
+        names = [JOINT_MODEL_NAME]
+    elif model_set.source.startswith("bundle:"):
+        names = ["models.bundle"]
+    else:
+        names = [f"{ab.replace('/', '_')}.joblib" for ab in model_set.models]
+    return sum(os.path.getsize(os.path.join(path, n)) for n in names)
+
+
+def inference_latency_ms(model_set, features, runs=LATENCY_RUNS):
+    """Median ms to predict every antibiotic for one genome (distinct rows per run)."""
+    times = []
+    for i in range(runs):
+        X = features[i % len(features)].reshape(1, -1)
+        t0 = time.perf_counter()
+        for model in model_set.models.values():
+            model.predict_proba(X)
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+
+def side_by_side(joint_set, baseline_set, features):
+    report = {"antibiotics": {}}
+    for ab, joint_metrics in joint_set.metrics.items():
+        base = baseline_set.metrics.get(ab, {})
+        report["antibiotics"][ab] = {
+            metric: {"per_antibiotic": base.get(metric), "joint": joint_metrics.get(metric)}
+            for metric in ("cv_accuracy", "cv_f1", "cv_auc")
+        }
+    report["model_bytes"] = {
+        "per_antibiotic": model_set_bytes(baseline_set),
+        "joint": model_set_bytes(joint_set),
+    }
+    report["latency_ms_per_genome"] = {
+        "per_antibiotic": round(inference_latency_ms(baseline_set, features), 3),
+        "joint": round(inference_latency_ms(joint_set, features), 3),
+    }
+    report["sources"] = {"per_antibiotic": baseline_set.source, "joint": joint_set.source}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train one multi-output model for all antibiotics.")
+    parser.add_argument("--version", default="joint", help="model set name under models/versions/")
+    parser.add_argument("--promote", action="store_true", help="make --version the served version")
+    parser.add_argument("--multi-strategy", choices=["multi_output_tree", "one_output_per_tree"],
+                        default="multi_output_tree",
+                        help="vector-leaf trees shared by all outputs, or one tree per output per round")
+    parser.add_argument("--baseline-dir", default=MODELS_DIR,
+                        help="per-antibiotic model set to compare against")
+    args = parser.parse_args()
+    models_dir = os.path.join(MODELS_DIR, "versions", args.version)
+
+    features = load_features()
+    labels = pd.read_csv(os.path.join(DATA_DIR, "label_matrix.csv"), index_col=0)
+    with open(os.path.join(DATA_DIR, "kmer_names.json")) as f:
+        kmer_names = json.load(f)
+
+    # Outputs need both classes present; the rest are left to "No model"
+    all_metrics = {}
+    antibiotics = []
+    for ab in labels.columns:
+        col = labels[ab].values
+        if min((col == 1).sum(), (col == 0).sum()) < max(MIN_SAMPLES_PER_CLASS, N_SPLITS):
+            all_metrics[ab] = {"status": "skipped", "reason": "insufficient samples"}
+            continue
+        antibiotics.append(ab)
+    Y = labels[antibiotics].values.astype(np.float32)
+
+    print(f"Features: {features.shape}")
+    print(f"Labels: {Y.shape} ({(Y != -1).mean():.0%} observed)")
+    print(f"Joint outputs: {antibiotics}\n")
+
+    qf = QuantizedFeatures(features)
+    t0 = time.perf_counter()
+    y_prob_cv, fold_rounds = cross_validate_joint(qf, Y, N_SPLITS, args.multi_strategy)
+    n_trees = int(np.median(fold_rounds))
+    booster = fit_joint(qf, Y, n_trees, args.multi_strategy)
+    fit_seconds = time.perf_counter() - t0
+    print(f"Trees: {n_trees} (early-stopped folds: {fold_rounds})  Fit: {fit_seconds:.1f}s\n")
+
+    # Gain importance is shared by all outputs (no per-output SHAP for vector leaves)
+    gain = booster.get_score(importance_type="total_gain")
+    total_gain = sum(gain.values()) or 1.0
+    top = sorted(gain.items(), key=lambda kv: kv[1], reverse=True)[:20]
+    top_kmers = [
+        {"kmer": kmer_names[int(name[1:])], "importance": float(value / total_gain)}
+        for name, value in top
+    ]
+
+    os.makedirs(models_dir, exist_ok=True)
+    for j, ab in enumerate(antibiotics):
+        mask = Y[:, j] != -1
+        y = Y[mask, j].astype(int)
+        prob = y_prob_cv[mask, j]
+        pred = (prob >= 0.5).astype(int)
+        acc = accuracy_score(y, pred)
+        f1 = f1_score(y, pred, zero_division=0)
+        try:
+            auc = roc_auc_score(y, prob)
+        except ValueError:
+            auc = None
+        print(f"  {ab:32s} n={len(y):5d}  acc={acc:.3f}  f1={f1:.3f}  auc={auc if auc is None else round(auc, 3)}")
+
+        all_metrics[ab] = {
+            "status": "trained",
+            "model_type": "joint",
+            "n_samples": int(len(y)),
+            "n_resistant": int((y == 1).sum()),
+            "n_susceptible": int((y == 0).sum()),
+            "cv_accuracy": round(acc, 4),
+            "cv_f1": round(f1, 4),
+            "cv_auc": round(auc, 4) if auc is not None else None,
+            "cv_folds": N_SPLITS,
+            "n_trees": n_trees,
+            "fit_seconds": round(fit_seconds, 3),
+            "top_kmers": top_kmers[:5],
+        }
+        with open(os.path.join(models_dir, f"{ab.replace('/', '_')}_shap.json"), "w") as f:
+            json.dump(top_kmers, f, indent=2)
+
+    booster.save_model(os.path.join(models_dir, JOINT_MODEL_NAME))
+    with open(os.path.join(models_dir, JOINT_META_NAME), "w") as f:
+        json.dump({"antibiotics": antibiotics, "n_trees": n_trees,
+                   "multi_strategy": args.multi_strategy}, f, indent=2)
+    with open(os.path.join(models_dir, "metrics.json"), "w") as f:
+        json.dump(all_metrics, f, indent=2)
+    print(f"\nSaved joint model to {models_dir}")
+
+    # Side-by-side with the per-antibiotic set, loaded the way the backend loads both
+    joint_set = load_model_set(models_dir, args.version, antibiotics)
+    baseline_set = load_model_set(args.baseline_dir, "baseline", list(labels.columns))
+    report = side_by_side(joint_set, baseline_set, features)
+    report_path = os.path.join(models_dir, "joint_report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    sizes, latency = report["model_bytes"], report["latency_ms_per_genome"]
+    print(f"  Model size: {sizes['per_antibiotic'] / 1024:.0f} KB -> {sizes['joint'] / 1024:.0f} KB")
+    print(f"  Latency:    {latency['per_antibiotic']:.2f} ms -> {latency['joint']:.2f} ms per genome")
+    print(f"  Report: {report_path}")
+
+    if args.promote:
+        current_path = os.path.join(MODELS_DIR, "CURRENT")
+        with open(current_path + ".tmp", "w") as f:
+            f.write(args.version + "\n")
+        os.replace(current_path + ".tmp", current_path)
+        print(f"Promoted model version {args.version} ({current_path})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,35 @@
 """
 train_models.py — Train one XGBoost classifier per antibiotic with 5-fold CV.
 
+Uses xgb_engine.py (shared quantized features, hist trees, early stopping).
 Computes SHAP values for interpretability and saves models + metrics.
+
+Usage:
+  python train_models.py                          # write into models/
+  python train_models.py --version 2026-10-19     # write into models/versions/<version>/
+  python train_models.py --version v2 --promote   # ...and point models/CURRENT at it
+  python train_models.py --benchmark              # report legacy vs engine fit times
+  python train_models.py --out-of-core            # stream batches from the memory-mapped store
 """
 
+import argparse
+import time
 import numpy as np
 import pandas as pd
 import json
 import os
 import warnings
-from xgboost import XGBClassifier
 from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from feature_store import load_features, open_features
+from xgb_engine import (
+    BATCH_ROWS, QuantizedFeatures, StreamedFeatures, cross_validate, fit_final, legacy_classifier,
+    peak_rss_mb,
+)
 from sklearn.metrics import accuracy_score, f1_score, roc_auc_score, classification_report
 import shap
 import joblib
+from build_bundle import build_bundle
+from similarity_index import SIMILARITY_INDEX_NAME, build_index
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -21,11 +37,40 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "processed")
 MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
 
 MIN_SAMPLES_PER_CLASS = 2
+SHAP_MAX_ROWS = 2000  # out-of-core: mean |SHAP| over a sample of the labelled genomes
+
+
+def time_legacy_fit(X, y, n_splits, scale_pos_weight):
+    """Seconds the pre-engine path took: two cross_val_predict passes plus a 100-tree fit."""
+    t0 = time.perf_counter()
+    model = legacy_classifier(scale_pos_weight)
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+    cross_val_predict(model, X, y, cv=cv, method="predict")
+    cross_val_predict(model, X, y, cv=cv, method="predict_proba")
+    model.fit(X, y)
+    return time.perf_counter() - t0
 
 
 def main():
-    # Load data
-    features = np.load(os.path.join(DATA_DIR, "kmer_features.npy"))
+    parser = argparse.ArgumentParser(description="Train one XGBoost classifier per antibiotic.")
+    parser.add_argument("--version", help="write a versioned model set under models/versions/")
+    parser.add_argument("--promote", action="store_true", help="make --version the served version")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="also time the legacy fixed-100-tree path for comparison")
+    parser.add_argument("--feature-dtype", choices=["float32", "float16"], default="float32",
+                        help="in-memory feature precision (see feature_precision_report.py)")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="never load the feature matrix: stream batches into external-memory DMatrices")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="genomes per out-of-core batch")
+    args = parser.parse_args()
+    if args.promote and not args.version:
+        parser.error("--promote requires --version")
+    if args.benchmark and args.out_of_core:
+        parser.error("--benchmark needs the in-memory matrix; drop --out-of-core")
+    models_dir = os.path.join(MODELS_DIR, "versions", args.version) if args.version else MODELS_DIR
+
+    # Load data (out of core: a memory-mapped view, normalized batch by batch)
+    features = open_features(args.feature_dtype) if args.out_of_core else load_features(args.feature_dtype)
     labels = pd.read_csv(
         os.path.join(DATA_DIR, "label_matrix.csv"), index_col=0
     )
@@ -34,13 +79,23 @@ def main():
     with open(os.path.join(DATA_DIR, "kmer_names.json")) as f:
         kmer_names = json.load(f)
 
-    print(f"Features: {features.shape}")
+    print(f"Features: {features.shape} {features.dtype} ({features.nbytes / 1e6:.0f} MB"
+          f"{', streamed in batches of %d' % args.batch_rows if args.out_of_core else ''})")
     print(f"Labels: {labels.shape}")
     print(f"Antibiotics: {list(labels.columns)}\n")
 
-    os.makedirs(MODELS_DIR, exist_ok=True)
+    os.makedirs(models_dir, exist_ok=True)
+
+    # Histogram bin boundaries are sketched once and shared by every fit below
+    if args.out_of_core:
+        qf = StreamedFeatures(features, args.batch_rows)
+        print(f"Histogram cut points from {qf.sketched_rows} of {len(features)} genomes")
+    else:
+        qf = QuantizedFeatures(features)
+    print(f"Quantized feature matrix in {qf.quantize_seconds:.1f}s (peak RSS {peak_rss_mb():.0f} MB)\n")
 
     all_metrics = {}
+    timings = {}
 
     for antibiotic in labels.columns:
         print(f"{'='*60}")
@@ -48,7 +103,7 @@ def main():
 
         col = labels[antibiotic].values
         mask = col != -1  # only genomes with labels for this antibiotic
-        X = features[mask]
+        rows = np.flatnonzero(mask)
         y = col[mask].astype(int)
         gids = [genome_ids[i] for i in range(len(genome_ids)) if mask[i]]
 
@@ -63,16 +118,6 @@ def main():
 
         # XGBoost with scale_pos_weight to handle imbalance
         scale_pos_weight = n_neg / n_pos if n_pos > 0 else 1
-        model = XGBClassifier(
-            n_estimators=100,
-            max_depth=4,
-            learning_rate=0.1,
-            scale_pos_weight=scale_pos_weight,
-            use_label_encoder=False,
-            eval_metric="logloss",
-            random_state=42,
-            n_jobs=-1,
-        )
 
         # 5-fold cross-validation
         n_splits = min(5, n_pos, n_neg)
@@ -81,9 +126,16 @@ def main():
             all_metrics[antibiotic] = {"status": "skipped", "reason": "insufficient for CV"}
             continue
 
-        cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
-        y_pred_cv = cross_val_predict(model, X, y, cv=cv, method="predict")
-        y_prob_cv = cross_val_predict(model, X, y, cv=cv, method="predict_proba")[:, 1]
+        if args.benchmark:
+            legacy_seconds = time_legacy_fit(features[mask], y, n_splits, scale_pos_weight)
+
+        # CV with early stopping, then the final model on all data
+        t0 = time.perf_counter()
+        y_prob_cv, fold_rounds = cross_validate(qf, rows, y, n_splits, scale_pos_weight)
+        n_trees = int(np.median(fold_rounds))
+        model = fit_final(qf, rows, y, scale_pos_weight, n_trees)
+        fit_seconds = time.perf_counter() - t0
+        y_pred_cv = (y_prob_cv >= 0.5).astype(int)
 
         acc = accuracy_score(y, y_pred_cv)
         f1 = f1_score(y, y_pred_cv, zero_division=0)
@@ -96,13 +148,20 @@ def main():
         print(f"  CV F1:       {f1:.3f}")
         if auc is not None:
             print(f"  CV AUC:      {auc:.3f}")
-
-        # Train final model on all data
-        model.fit(X, y)
-
-        # SHAP values
+        print(f"  Trees: {n_trees} (early-stopped folds: {fold_rounds})")
+        print(f"  Fit time:    {fit_seconds:.1f}s (peak RSS {peak_rss_mb():.0f} MB)")
+        timings[antibiotic] = {"engine_seconds": round(fit_seconds, 3), "n_trees": n_trees,
+                               "peak_rss_mb": round(peak_rss_mb())}
+        if args.benchmark:
+            print(f"  Legacy:      {legacy_seconds:.1f}s (100 trees, cross_val_predict x2 + fit)")
+            timings[antibiotic]["legacy_seconds"] = round(legacy_seconds, 3)
+
+        # SHAP values (out of core: on a fixed sample of the labelled genomes)
+        shap_rows = rows
+        if args.out_of_core and len(rows) > SHAP_MAX_ROWS:
+            shap_rows = np.sort(np.random.default_rng(42).choice(rows, SHAP_MAX_ROWS, replace=False))
         explainer = shap.TreeExplainer(model)
-        shap_values = explainer.shap_values(X)
+        shap_values = explainer.shap_values(features[shap_rows])
 
         # Top 20 most important k-mers by mean |SHAP|
         mean_shap = np.abs(shap_values).mean(axis=0)
@@ -114,11 +173,11 @@ def main():
         print(f"  Top 3 k-mers: {', '.join(t['kmer'] for t in top_kmers[:3])}")
 
         # Save model
-        model_path = os.path.join(MODELS_DIR, f"{antibiotic.replace('/', '_')}.joblib")
+        model_path = os.path.join(models_dir, f"{antibiotic.replace('/', '_')}.joblib")
         joblib.dump(model, model_path)
 
         # Save SHAP summary
-        shap_path = os.path.join(MODELS_DIR, f"{antibiotic.replace('/', '_')}_shap.json")
+        shap_path = os.path.join(models_dir, f"{antibiotic.replace('/', '_')}_shap.json")
         with open(shap_path, "w") as f:
             json.dump(top_kmers, f, indent=2)
 
@@ -131,20 +190,54 @@ def main():
             "cv_f1": round(f1, 4),
             "cv_auc": round(auc, 4) if auc is not None else None,
             "cv_folds": int(n_splits),
+            "n_trees": n_trees,
+            "fit_seconds": round(fit_seconds, 3),
             "top_kmers": top_kmers[:5],
         }
 
     # Save combined metrics
-    metrics_path = os.path.join(MODELS_DIR, "metrics.json")
+    metrics_path = os.path.join(models_dir, "metrics.json")
     with open(metrics_path, "w") as f:
         json.dump(all_metrics, f, indent=2)
     print(f"\n{'='*60}")
     print(f"Saved metrics to {metrics_path}")
 
+    timings_path = os.path.join(models_dir, "train_timings.json")
+    with open(timings_path, "w") as f:
+        json.dump({
+            "quantize_seconds": round(qf.quantize_seconds, 3),
+            "out_of_core": args.out_of_core,
+            "peak_rss_mb": round(peak_rss_mb()),
+            "antibiotics": timings,
+        }, f, indent=2)
+    if args.out_of_core:
+        qf.close()
+    print(f"Peak RSS: {peak_rss_mb():.0f} MB")
+    if args.benchmark:
+        legacy_total = sum(t["legacy_seconds"] for t in timings.values())
+        engine_total = sum(t["engine_seconds"] for t in timings.values()) + qf.quantize_seconds
+        print(f"Fit time: legacy {legacy_total:.1f}s -> engine {engine_total:.1f}s ({timings_path})")
+
     trained = sum(1 for m in all_metrics.values() if m["status"] == "trained")
     skipped = sum(1 for m in all_metrics.values() if m["status"] == "skipped")
     print(f"Done! Trained: {trained}, Skipped: {skipped}")
 
+    # Single-file bundle the backend maps instead of unpickling each model
+    build_bundle(models_dir)
+
+    # Nearest-training-genome index for /api/similar
+    similarity_path = os.path.join(models_dir, SIMILARITY_INDEX_NAME)
+    explained = build_index(features, genome_ids, similarity_path)
+    print(f"Saved similarity index to {similarity_path} ({explained:.0%} variance kept)")
+
+    if args.promote:
+        # Running backends pick this up via /api/models/reload or MODEL_WATCH_INTERVAL
+        current_path = os.path.join(MODELS_DIR, "CURRENT")
+        with open(current_path + ".tmp", "w") as f:
+            f.write(args.version + "\n")
+        os.replace(current_path + ".tmp", current_path)
+        print(f"Promoted model version {args.version} ({current_path})")
+
 
 if __name__ == "__main__":
     main()
@@ -3,15 +3,18 @@ validate.py — Post-training validation with bootstrap confidence intervals.
 
 Loads held-out CV predictions and computes per-antibiotic accuracy
 with 95% CIs (1000 bootstrap iterations) and calibration curves.
-Saves results to models/validation_stats.json.
+Saves results to models/validation_stats.json (or models/versions/<version>/
+with --version, next to the model set it describes). --out-of-core streams
+the feature store in batches, as train_models.py --out-of-core does.
 """
 
+import argparse
 import numpy as np
 import pandas as pd
 import json
 import os
-from xgboost import XGBClassifier
-from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from feature_store import load_features, open_features
+from xgb_engine import BATCH_ROWS, QuantizedFeatures, StreamedFeatures, cross_validate, peak_rss_mb
 from sklearn.calibration import calibration_curve
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data", "processed")
@@ -67,9 +70,17 @@ def specificity_fn(y_true, y_pred):
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Bootstrap validation of trained models.")
+    parser.add_argument("--version", help="validate the model set in models/versions/<version>/")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="stream feature batches into external-memory DMatrices")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="genomes per out-of-core batch")
+    args = parser.parse_args()
+    models_dir = os.path.join(MODELS_DIR, "versions", args.version) if args.version else MODELS_DIR
+
     print("Running post-training validation with bootstrap CIs...\n")
 
-    features = np.load(os.path.join(DATA_DIR, "kmer_features.npy"))
+    features = open_features() if args.out_of_core else load_features()
     labels = pd.read_csv(
         os.path.join(DATA_DIR, "label_matrix.csv"), index_col=0
     )
@@ -79,9 +90,10 @@ def main():
         kmer_names = json.load(f)
 
     # Load existing metrics to know model config
-    with open(os.path.join(MODELS_DIR, "metrics.json")) as f:
+    with open(os.path.join(models_dir, "metrics.json")) as f:
         train_metrics = json.load(f)
 
+    qf = StreamedFeatures(features, args.batch_rows) if args.out_of_core else QuantizedFeatures(features)
     validation_stats = {}
 
     for antibiotic in labels.columns:
@@ -94,7 +106,7 @@ def main():
 
         col = labels[antibiotic].values
         mask = col != -1
-        X = features[mask]
+        rows = np.flatnonzero(mask)
         y = col[mask].astype(int)
 
         n_pos = int((y == 1).sum())
@@ -103,22 +115,10 @@ def main():
         if n_splits < 2:
             continue
 
-        # Recreate the same CV split and predictions
+        # Recreate the same CV split and predictions (same engine as train_models.py)
         scale_pos_weight = n_neg / n_pos if n_pos > 0 else 1
-        model = XGBClassifier(
-            n_estimators=100,
-            max_depth=4,
-            learning_rate=0.1,
-            scale_pos_weight=scale_pos_weight,
-            use_label_encoder=False,
-            eval_metric="logloss",
-            random_state=42,
-            n_jobs=-1,
-        )
-
-        cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
-        y_pred_cv = cross_val_predict(model, X, y, cv=cv, method="predict")
-        y_prob_cv = cross_val_predict(model, X, y, cv=cv, method="predict_proba")[:, 1]
+        y_prob_cv, _ = cross_validate(qf, rows, y, n_splits, scale_pos_weight)
+        y_pred_cv = (y_prob_cv >= 0.5).astype(int)
 
         # Bootstrap CIs for each metric
         acc_ci = bootstrap_ci(y, y_pred_cv, accuracy_fn)
@@ -161,12 +161,15 @@ def main():
         }
 
     # Save
-    os.makedirs(MODELS_DIR, exist_ok=True)
-    output_path = os.path.join(MODELS_DIR, "validation_stats.json")
+    os.makedirs(models_dir, exist_ok=True)
+    output_path = os.path.join(models_dir, "validation_stats.json")
     with open(output_path, "w") as f:
         json.dump(validation_stats, f, indent=2)
 
+    if args.out_of_core:
+        qf.close()
     print(f"\nSaved validation stats for {len(validation_stats)} antibiotics to {output_path}")
+    print(f"Peak RSS: {peak_rss_mb():.0f} MB")
 
 
 if __name__ == "__main__":
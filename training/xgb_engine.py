@@ -0,0 +1,305 @@
+"""
+xgb_engine.py — Shared XGBoost training engine for train_models.py and validate.py.
+
+The feature matrix is quantized once: QuantizedFeatures sketches histogram
+bin boundaries over every genome, and each antibiotic / CV fold subset is
+binned against those boundaries (QuantileDMatrix with ref=) instead of
+XGBoost re-sketching the 4096 columns for every fit as cross_val_predict did.
+
+Trees are grown with the hist method and early stopping on a stratified
+validation split carved out of each training fold, so the tree count is
+chosen per antibiotic rather than fixed at 100. The final model is trained on
+all labelled genomes for the median of the per-fold best tree counts and
+returned as an XGBClassifier, so joblib files, SHAP and build_bundle.py work
+unchanged.
+
+The joint mode (train_joint.py) grows one multi-output tree ensemble over the
+whole label matrix (vector-leaf trees, or with one_output_per_tree a tree per
+antibiotic per round inside the same booster). Missing labels (-1) stay in the DMatrix and get zero
+gradient and hessian in masked_logloss, so each output only learns from the
+genomes labelled for its antibiotic.
+
+StreamedFeatures is the out-of-core stand-in for QuantizedFeatures: the same
+dmatrix() interface, but rows are streamed from a feature_store.LazyFeatures
+view in batches through an XGBoost DataIter into ExtMemQuantileDMatrix,
+whose binned pages are cached on disk. An antibiotic's or fold's rows are
+picked out batch by batch, so neither the full matrix nor a per-antibiotic
+copy is ever in memory. Up to SKETCH_ROWS genomes the bins and trees match
+the in-memory path exactly; beyond that the cut points come from a random
+sample of SKETCH_ROWS genomes, which keeps the sketch's memory fixed.
+"""
+
+import gc
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import xgboost as xgb
+from sklearn.model_selection import KFold, StratifiedKFold, train_test_split
+from xgboost import XGBClassifier
+
+PARAMS = {
+    "objective": "binary:logistic",
+    "eval_metric": "logloss",
+    "tree_method": "hist",
+    "max_depth": 4,
+    "eta": 0.1,
+    "max_bin": 256,
+    "seed": 42,
+}
+MAX_ROUNDS = 500
+EARLY_STOPPING_ROUNDS = 20
+VALID_FRACTION = 0.2
+RANDOM_SEED = 42
+BATCH_ROWS = 2048  # out-of-core rows per batch (4096 float32 features: 32 MB)
+SKETCH_ROWS = 10000  # out-of-core: genomes sampled for the histogram cut points
+
+JOINT_PARAMS = {
+    "tree_method": "hist",
+    "multi_strategy": "multi_output_tree",
+    "max_depth": 4,
+    "eta": 0.1,
+    "max_bin": 256,
+    "seed": 42,
+    "disable_default_eval_metric": 1,
+}
+
+
+class QuantizedFeatures:
+    """Feature matrix plus histogram cut points computed once over all genomes."""
+
+    def __init__(self, features, max_bin=PARAMS["max_bin"]):
+        t0 = time.perf_counter()
+        self.features = features
+        self.max_bin = max_bin
+        self.ref = xgb.QuantileDMatrix(features, max_bin=max_bin)
+        self.quantize_seconds = time.perf_counter() - t0
+
+    def dmatrix(self, rows, label=None, ref=None):
+        """Bin a row subset against the shared cut points."""
+        return xgb.QuantileDMatrix(
+            self.features[rows], label=label, ref=ref or self.ref, max_bin=self.max_bin
+        )
+
+
+class RowBatches(xgb.DataIter):
+    """DataIter over features[rows] (with matching labels), batch_rows rows at a time."""
+
+    def __init__(self, features, rows, label=None, batch_rows=BATCH_ROWS, cache_prefix=None):
+        self.features = features
+        self.rows = np.asarray(rows)
+        self.label = label
+        self.batch_rows = batch_rows
+        self._batch = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        start = self._batch * self.batch_rows
+        if start >= len(self.rows):
+            return False
+        batch = self.rows[start : start + self.batch_rows]
+        # Read the store in row order, then put the rows back in the caller's order
+        order = np.argsort(batch, kind="stable")
+        data = np.empty((len(batch), self.features.shape[1]), dtype=self.features.dtype)
+        data[order] = self.features[batch[order]]
+        label = None if self.label is None else self.label[start : start + self.batch_rows]
+        input_data(data=data, label=label)
+        self._batch += 1
+        return True
+
+    def reset(self):
+        self._batch = 0
+
+
+class StreamedFeatures:
+    """Out-of-core QuantizedFeatures: batches of a LazyFeatures store into external-memory DMatrices."""
+
+    def __init__(self, features, batch_rows=BATCH_ROWS, max_bin=PARAMS["max_bin"], cache_dir=None,
+                 sketch_rows=SKETCH_ROWS):
+        t0 = time.perf_counter()
+        self.features = features
+        self.batch_rows = batch_rows
+        self.max_bin = max_bin
+        self.cache_dir = tempfile.mkdtemp(prefix="xgb-extmem-", dir=cache_dir)
+        self._n_matrices = 0
+        # XGBoost's quantile sketch grows with the rows it sees (~70 MB per
+        # 1000 genomes of 4096 features), so larger corpora take their cut
+        # points from a fixed random sample of genomes
+        sketched = np.arange(len(features))
+        if sketch_rows and len(features) > sketch_rows:
+            rng = np.random.default_rng(RANDOM_SEED)
+            sketched = np.sort(rng.choice(len(features), sketch_rows, replace=False))
+        self.sketched_rows = len(sketched)
+        self.ref = self.dmatrix(sketched)
+        self.quantize_seconds = time.perf_counter() - t0
+
+    def dmatrix(self, rows, label=None, ref=None):
+        """Bin a row subset against the shared cut points, one batch in memory at a time."""
+        self._n_matrices += 1
+        batches = RowBatches(self.features, rows, label, self.batch_rows,
+                             os.path.join(self.cache_dir, f"m{self._n_matrices}"))
+        return xgb.ExtMemQuantileDMatrix(
+            batches, ref=ref or getattr(self, "ref", None), max_bin=self.max_bin
+        )
+
+    def close(self):
+        """Free the reference matrix and delete the on-disk page cache."""
+        self.ref = None
+        gc.collect()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (MB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def legacy_classifier(scale_pos_weight):
+    """The fixed 100-tree classifier train_models.py used before this engine."""
+    return XGBClassifier(
+        n_estimators=100,
+        max_depth=4,
+        learning_rate=0.1,
+        scale_pos_weight=scale_pos_weight,
+        eval_metric="logloss",
+        random_state=42,
+        n_jobs=-1,
+    )
+
+
+def _train(params, qf, rows, y, valid_rows=None, valid_y=None, num_rounds=MAX_ROUNDS):
+    dtrain = qf.dmatrix(rows, y)
+    if valid_rows is None:
+        return xgb.train(params, dtrain, num_boost_round=num_rounds)
+    # XGBoost wants eval sets binned against the training matrix (same cuts here)
+    dvalid = qf.dmatrix(valid_rows, valid_y, ref=dtrain)
+    return xgb.train(
+        params, dtrain, num_boost_round=num_rounds,
+        evals=[(dvalid, "valid")],
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        verbose_eval=False,
+    )
+
+
+def fit_early_stopped(qf, rows, y, scale_pos_weight):
+    """Train on rows with early stopping on an inner validation split.
+
+    Returns (booster, number of trees to keep).
+    """
+    params = dict(PARAMS, scale_pos_weight=scale_pos_weight)
+    n_valid = int(round(len(y) * VALID_FRACTION))
+    if n_valid < 2 or min(np.bincount(y, minlength=2)) < 2:
+        # Too small to hold anything out: fall back to the legacy tree count
+        return _train(params, qf, rows, y, num_rounds=100), 100
+    fit_idx, valid_idx = train_test_split(
+        np.arange(len(y)), test_size=n_valid, stratify=y, random_state=RANDOM_SEED
+    )
+    booster = _train(params, qf, rows[fit_idx], y[fit_idx], rows[valid_idx], y[valid_idx])
+    return booster, booster.best_iteration + 1
+
+
+def cross_validate(qf, rows, y, n_splits, scale_pos_weight):
+    """Out-of-fold predicted probabilities plus the early-stopped tree count per fold.
+
+    rows are indices into qf.features (the genomes labelled for one antibiotic),
+    y their labels. Uses the same StratifiedKFold split as before.
+    """
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=RANDOM_SEED)
+    y_prob = np.zeros(len(y), dtype=np.float64)
+    best_rounds = []
+    for train_idx, test_idx in cv.split(rows, y):
+        booster, n_trees = fit_early_stopped(qf, rows[train_idx], y[train_idx], scale_pos_weight)
+        y_prob[test_idx] = booster.predict(qf.dmatrix(rows[test_idx]), iteration_range=(0, n_trees))
+        best_rounds.append(n_trees)
+    return y_prob, best_rounds
+
+
+def fit_final(qf, rows, y, scale_pos_weight, n_trees):
+    """Train the served model on every labelled genome; returns an XGBClassifier."""
+    params = dict(PARAMS, scale_pos_weight=scale_pos_weight)
+    booster = _train(params, qf, rows, y, num_rounds=n_trees)
+    model = XGBClassifier()
+    model.load_model(bytearray(booster.save_raw("ubj")))
+    return model
+
+
+def _sigmoid(margin):
+    return 1.0 / (1.0 + np.exp(-margin))
+
+
+def masked_logloss(class_weights):
+    """Multi-output logistic objective that ignores -1 labels.
+
+    class_weights is a (n_outputs,) array of positive-class weights
+    (n_neg / n_pos per antibiotic, the joint scale_pos_weight).
+    """
+    def objective(margin, dtrain):
+        y = dtrain.get_label().reshape(margin.shape)
+        weight = np.where(y < 0, 0.0, np.where(y == 1, class_weights, 1.0))
+        p = _sigmoid(margin)
+        return (p - y) * weight, np.maximum(p * (1.0 - p), 1e-16) * weight
+    return objective
+
+
+def masked_logloss_metric(margin, dmatrix):
+    y = dmatrix.get_label().reshape(margin.shape)
+    mask = y >= 0
+    p = np.clip(_sigmoid(margin[mask]), 1e-7, 1 - 1e-7)
+    t = y[mask]
+    return "masked-logloss", float(-np.mean(t * np.log(p) + (1 - t) * np.log(1 - p)))
+
+
+def joint_class_weights(labels):
+    n_pos = (labels == 1).sum(axis=0)
+    n_neg = (labels == 0).sum(axis=0)
+    return np.where(n_pos > 0, n_neg / np.maximum(n_pos, 1), 1.0)
+
+
+def _train_joint(qf, rows, labels, class_weights, multi_strategy,
+                 valid_rows=None, num_rounds=MAX_ROUNDS):
+    params = dict(JOINT_PARAMS, num_target=labels.shape[1], multi_strategy=multi_strategy)
+    objective = masked_logloss(class_weights)
+    dtrain = qf.dmatrix(rows, labels[rows])
+    if valid_rows is None:
+        return xgb.train(params, dtrain, num_boost_round=num_rounds, obj=objective)
+    dvalid = qf.dmatrix(valid_rows, labels[valid_rows], ref=dtrain)
+    return xgb.train(
+        params, dtrain, num_boost_round=num_rounds, obj=objective,
+        evals=[(dvalid, "valid")], custom_metric=masked_logloss_metric,
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS, verbose_eval=False,
+    )
+
+
+def cross_validate_joint(qf, labels, n_splits=5, multi_strategy=JOINT_PARAMS["multi_strategy"]):
+    """Out-of-fold probabilities (genomes x antibiotics) for the joint model.
+
+    labels is the full label matrix with -1 for missing. Folds are plain
+    shuffled KFold over genomes, since one stratification cannot cover every
+    antibiotic. Returns (probabilities, early-stopped tree count per fold).
+    """
+    class_weights = joint_class_weights(labels)
+    y_prob = np.zeros(labels.shape, dtype=np.float64)
+    best_rounds = []
+    cv = KFold(n_splits=n_splits, shuffle=True, random_state=RANDOM_SEED)
+    for train_idx, test_idx in cv.split(labels):
+        fit_idx, valid_idx = train_test_split(
+            train_idx, test_size=VALID_FRACTION, random_state=RANDOM_SEED
+        )
+        booster = _train_joint(qf, fit_idx, labels, class_weights, multi_strategy, valid_idx)
+        n_trees = booster.best_iteration + 1
+        margin = booster.predict(qf.dmatrix(test_idx), output_margin=True,
+                                 iteration_range=(0, n_trees))
+        y_prob[test_idx] = _sigmoid(margin.reshape(len(test_idx), -1))
+        best_rounds.append(n_trees)
+    return y_prob, best_rounds
+
+
+def fit_joint(qf, labels, n_trees, multi_strategy=JOINT_PARAMS["multi_strategy"]):
+    """Train the joint booster on every genome (missing labels masked)."""
+    rows = np.arange(labels.shape[0])
+    return _train_joint(
+        qf, rows, labels, joint_class_weights(labels), multi_strategy, num_rounds=n_trees
+    )